@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks :
+
+    Performance benchmarks for nyccc. The corpus module generates synthetic
+    manuscripts and bibliographies of any size and the run module times the
+    phases of a check over a sweep of sizes and saves the results as JSON,
+    so that the results of two revisions can be compared.
+
+example:
+
+    $ python -m benchmarks.run --sizes 100,1000,10000 -o before.json
+    $ git checkout my-branch
+    $ python -m benchmarks.run --sizes 100,1000,10000 -o after.json
+    $ python -m benchmarks.run --compare before.json after.json
+"""
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks/corpus.py :
+
+    Generates synthetic manuscripts and bibliographies for the benchmarks.
+    The manuscripts have one paragraph per line with parenthetical
+    citations ("(Rasku & Musliu 2013, p. 12; Smith et al. 2001)") and text
+    citations ("Smith and Jones (2006) state", also with finnish suffixes
+    like "Raskun (2013) mukaan"). The bibliographies have one reference per
+    line, some of them duplicated and some without a publication year. Some
+    of the citations have no reference and some of the references are not
+    cited. The names have accented characters like real ones do.
+
+    The same seed always gives the same corpus.
+"""
+
+import os
+import codecs
+import random
+
+SURNAMES = [u"Rasku", u"Musliu", u"Kärkkäinen", u"Virtanen", u"Hotokka",
+            u"D'Alembert", u"Descartes", u"Platon", u"Bennett", u"Andrews",
+            u"Smith", u"Jones", u"Lax", u"Huhta", u"Campinha-Bacote",
+            u"Young", u"Oldman", u"Ragins", u"Cotton", u"Lankau",
+            u"Scandura", u"Müller", u"Nyström", u"Ångström", u"Gödel",
+            u"Čapek", u"Häkkinen", u"Flycht-Eriksson", u"O'Neil",
+            u"Rasku-Puttonen"]
+SYLLABLES = [u"ka", u"ri", u"nen", u"la", u"mä", u"ki", u"ho", u"sa",
+             u"lo", u"ne", u"tö", u"va", u"ber", u"son", u"ström", u"ul",
+             u"ma", u"ti", u"ja", u"ran", u"é", u"ko", u"pe", u"ü"]
+WORDS = [u"the", u"results", u"of", u"this", u"study", u"show", u"that",
+         u"model", u"is", u"a", u"method", u"for", u"in", u"with", u"data",
+         u"analysis", u"and", u"were", u"found", u"to", u"be", u"näin",
+         u"also", u"on", u"previous", u"work", u"approach", u"theory"]
+TEXT_VERBS = [u"state", u"show", u"argue", u"found", u"write"]
+FINNISH_SUFFIXES = [u"n", u"n", u"lla", u"in"]
+
+def _surname(rnd):
+    if rnd.random()<0.2:
+        return rnd.choice(SURNAMES)
+    name = u"".join(rnd.choice(SYLLABLES) for i in range(rnd.randint(2, 4)))
+    return name[0].upper()+name[1:]
+
+def _sentence(rnd, min_words=6, max_words=20):
+    words = [rnd.choice(WORDS) for i in range(rnd.randint(min_words,
+                                                          max_words))]
+    return words[0].capitalize()+u" "+u" ".join(words[1:])
+
+def generate_bibliography(num_refs, rnd, duplicate_rate=0.01,
+                          missing_year_rate=0.01):
+    """ Returns a list of (authors, year, reference) tuples, where year is
+    None for the references without a publication year.
+
+    num_refs
+        the number of references (including the duplicates)
+    rnd
+        the random.Random to use
+    duplicate_rate, missing_year_rate
+        the share of the references that are copies of an earlier one and
+         that are missing the publication year
+    """
+    refs = []
+    for i in range(num_refs):
+        if refs and rnd.random()<duplicate_rate:
+            refs.append(rnd.choice(refs))
+            continue
+
+        authors = [_surname(rnd) for j in range(rnd.choice([1,1,2,2,3,4]))]
+        year = unicode(rnd.randint(1950, 2020))+rnd.choice([u"",u"",u"",u"a"])
+        names = [u"%s, %s." % (a, rnd.choice(u"ABCDEHJKLMPRST"))
+                 for a in authors]
+        if len(names)>1:
+            namestr = u", ".join(names[:-1])+u" & "+names[-1]
+        else:
+            namestr = names[0]
+        title = _sentence(rnd, 3, 10)
+        if rnd.random()<missing_year_rate:
+            year = None
+            ref = u"%s %s. Journal of %s." % (namestr, title, _surname(rnd))
+        else:
+            ref = u"%s %s. %s. Journal of %s." % (namestr, year, title,
+                                                  _surname(rnd))
+        refs.append( (authors, year, ref) )
+    return refs
+
+def _cited_names(authors):
+    if len(authors)>2:
+        return authors[0]+u" et al."
+    return u" & ".join(authors)
+
+def _parenthetical_cite(rnd, cited):
+    parts = []
+    for authors, year in cited:
+        part = u"%s %s" % (_cited_names(authors), year)
+        if rnd.random()<0.3:
+            part += u", p. %d" % rnd.randint(1, 300)
+        parts.append(part)
+    return u"(%s)" % u"; ".join(parts)
+
+def _text_cite(rnd, authors, year):
+    if len(authors)>2:
+        names = authors[0]+u" et al."
+    else:
+        names = u" and ".join(authors)
+    if rnd.random()<0.2:
+        # Finnish possessive "Raskun (2013) mukaan"
+        return u"%s%s (%s) mukaan" % (names, rnd.choice(FINNISH_SUFFIXES),
+                                     year)
+    return u"%s (%s) %s" % (names, year, rnd.choice(TEXT_VERBS))
+
+def generate_manuscript(num_paragraphs, refs, rnd, cites_per_paragraph=3,
+                        missing_rate=0.05):
+    """ Returns a list of paragraphs that cite the references.
+
+    num_paragraphs
+        the number of paragraphs
+    refs
+        the references from generate_bibliography
+    rnd
+        the random.Random to use
+    cites_per_paragraph
+        the average number of citations in a paragraph
+    missing_rate
+        the share of the citations that have no reference
+    """
+    citable = [(authors, year) for authors, year, ref in refs if year]
+
+    def pick():
+        if not citable or rnd.random()<missing_rate:
+            return ([_surname(rnd)], unicode(rnd.randint(1950, 2020)))
+        return rnd.choice(citable)
+
+    paragraphs = []
+    for i in range(num_paragraphs):
+        sentences = []
+        for j in range(rnd.randint(1, 2*cites_per_paragraph)):
+            sentence = _sentence(rnd)
+            kind = rnd.random()
+            if kind<0.5:
+                cited = [pick() for k in range(rnd.choice([1,1,1,2,3]))]
+                sentence += u" "+_parenthetical_cite(rnd, cited)
+            elif kind<0.7:
+                authors, year = pick()
+                sentence = _text_cite(rnd, authors, year)+u" "+ \
+                           sentence[0].lower()+sentence[1:]
+            sentences.append(sentence+u".")
+        paragraphs.append(u" ".join(sentences))
+    return paragraphs
+
+def generate_corpus(num_paragraphs, num_refs=None, seed=0):
+    """ Returns a tuple (paragraphs, references) of unicode strings. By
+    default there is a reference per three paragraphs (at least 10).
+    """
+    rnd = random.Random(seed)
+    if num_refs is None:
+        num_refs = max(10, num_paragraphs/3)
+    refs = generate_bibliography(num_refs, rnd)
+    paragraphs = generate_manuscript(num_paragraphs, refs, rnd)
+    return paragraphs, [ref for authors, year, ref in refs]
+
+def write_corpus(directory, num_paragraphs, num_refs=None, seed=0):
+    """ Writes a generated corpus as UTF-8 files text.txt and bib.txt to
+    the directory and returns their paths.
+    """
+    paragraphs, references = generate_corpus(num_paragraphs, num_refs, seed)
+    textfile = os.path.join(directory, "text.txt")
+    bibfile = os.path.join(directory, "bib.txt")
+    for filename, lines in ((textfile, paragraphs), (bibfile, references)):
+        with codecs.open(filename, 'w', 'utf-8') as out:
+            for line in lines:
+                out.write(line+u"\n")
+    return textfile, bibfile
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks/run.py :
+
+    Times the phases of a nyccc check (init_regexps, get_cites_from_file,
+    get_bib_from_file, _unique and cross_check) on generated corpora of
+    increasing size. For each size the throughput of each phase and the
+    peak memory of the process are reported. Each size is run in a fresh
+    worker process so that the peak memory is that of the size alone. The
+    results are saved as JSON, and two result files can be compared.
+
+    Run it from the repository root:
+
+    $ python -m benchmarks.run --sizes 100,1000,10000 -o results.json
+    $ python -m benchmarks.run --compare old.json results.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+import multiprocessing
+from StringIO import StringIO
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import nyccc
+from benchmarks.corpus import write_corpus
+
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_REPEAT = 3
+
+# The phases in the order they are run, and what their throughput is of
+PHASES = [("init_regexps", None),
+          ("get_cites_from_file", "paragraphs"),
+          ("get_bib_from_file", "references"),
+          ("_unique", "cites"),
+          ("cross_check", "unique cites")]
+
+def _best_time(repeat, function, *args):
+    """ Returns (seconds, result) of the fastest of repeat calls. The output
+    nyccc prints is discarded.
+    """
+    best = None
+    stdout = sys.stdout
+    try:
+        for i in range(repeat):
+            sys.stdout = StringIO()
+            start = time.time()
+            result = function(*args)
+            seconds = time.time()-start
+            if best is None or seconds<best:
+                best = seconds
+    finally:
+        sys.stdout = stdout
+    return best, result
+
+def _init_regexps(engine):
+    # Compile from scratch, not from the parser or re module caches
+    re.purge()
+    nyccc._parser_cache = nyccc._LRUCache(nyccc.PARSER_CACHE_SIZE)
+    return nyccc.init_regexps(engine=engine)
+
+def _get_cites(textfile, parser):
+    # Each run starts with nothing memoized, like a run of nyccc does
+    parser.parse_memo.clear()
+    return nyccc.get_cites_from_file(textfile, nyccc.MULTICITE_DELIMETER,
+                                     None, 0, parser)
+
+def _peak_memory_kb():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    if sys.platform=="darwin":
+        maxrss /= 1024
+    return maxrss
+
+def run_size(num_paragraphs, num_refs=None, seed=0, repeat=DEFAULT_REPEAT,
+             suffix_eat_cnt=nyccc.EAT_SUFFIX_CHARS,
+             engine=nyccc.EXTRACTION_ENGINE):
+    """ Generates a corpus and times the phases of checking it. Returns a
+    dict with the corpus size and for each phase the seconds (best of
+    repeat runs) and the throughput.
+    """
+    directory = tempfile.mkdtemp(prefix="nyccc-bench-")
+    try:
+        textfile, bibfile = write_corpus(directory, num_paragraphs, num_refs,
+                                         seed)
+        seconds = {}
+        seconds["init_regexps"], parser = _best_time(repeat, _init_regexps,
+                                                     engine)
+        seconds["get_cites_from_file"], cites = _best_time(repeat,
+            _get_cites, textfile, parser)
+        seconds["get_bib_from_file"], bib = _best_time(repeat,
+            nyccc.get_bib_from_file, bibfile)
+        seconds["_unique"], ucites = _best_time(repeat, nyccc._unique, cites)
+        seconds["cross_check"], result = _best_time(repeat,
+            nyccc.cross_check, ucites, bib, suffix_eat_cnt, parser)
+    finally:
+        shutil.rmtree(directory)
+
+    counts = {"paragraphs":num_paragraphs, "references":len(bib),
+              "cites":len(cites), "unique cites":len(ucites)}
+    phases = {}
+    for phase, unit in PHASES:
+        phases[phase] = {"seconds":seconds[phase]}
+        if unit:
+            phases[phase]["unit"] = unit
+            phases[phase]["per_second"] = counts[unit]/seconds[phase] \
+                                          if seconds[phase] else None
+    return {"paragraphs":num_paragraphs,
+            "references":len(bib),
+            "cites":len(cites),
+            "unique_cites":len(ucites),
+            "missing_refs":result.missing_ref_cnt,
+            "missing_cites":result.missing_cite_cnt,
+            "phases":phases,
+            "peak_memory_kb":_peak_memory_kb()}
+
+def _run_size_in_process(args):
+    return run_size(*args)
+
+def run_sweep(sizes, num_refs=None, seed=0, repeat=DEFAULT_REPEAT,
+              suffix_eat_cnt=nyccc.EAT_SUFFIX_CHARS,
+              engine=nyccc.EXTRACTION_ENGINE):
+    """ Runs run_size for each of the sizes (number of paragraphs) in its
+    own process and returns the results with some information about the
+    revision and the machine.
+    """
+    results = []
+    for size in sizes:
+        pool = multiprocessing.Pool(1)
+        try:
+            results.append(pool.apply(_run_size_in_process,
+                ((size, num_refs, seed, repeat, suffix_eat_cnt, engine),)))
+        finally:
+            pool.close()
+            pool.join()
+    return {"revision":_revision(),
+            "time":time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python":platform.python_version(),
+            "platform":platform.platform(),
+            "engine":engine,
+            "seed":seed,
+            "repeat":repeat,
+            "suffix_eat_cnt":suffix_eat_cnt,
+            "results":results}
+
+def _revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(nyccc.__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(sweep):
+    print "Revision %s, Python %s, %s engine" % (sweep["revision"],
+        sweep["python"], sweep["engine"])
+    for result in sweep["results"]:
+        print
+        print "%d paragraphs, %d references, %d cites (%d unique), "\
+              "peak memory %s kB" % (result["paragraphs"],
+              result["references"], result["cites"], result["unique_cites"],
+              result["peak_memory_kb"])
+        for phase, unit in PHASES:
+            timing = result["phases"][phase]
+            line = "\t%-20s %9.4f s" % (phase, timing["seconds"])
+            if timing.get("per_second"):
+                line += "  %12.0f %s/s" % (timing["per_second"], unit)
+            print line
+
+def compare(old, new):
+    """ Prints how many times faster (>1) or slower (<1) each phase of the
+    new sweep is than in the old one, for the sizes that are in both.
+    """
+    print "Speedup of %s over %s" % (new["revision"], old["revision"])
+    old_results = dict((r["paragraphs"], r) for r in old["results"])
+    for result in new["results"]:
+        old_result = old_results.get(result["paragraphs"])
+        if not old_result:
+            continue
+        print
+        print "%d paragraphs:" % result["paragraphs"]
+        for phase, unit in PHASES:
+            old_seconds = old_result["phases"][phase]["seconds"]
+            new_seconds = result["phases"][phase]["seconds"]
+            ratio = old_seconds/new_seconds if new_seconds else float("inf")
+            print "\t%-20s %9.4f s -> %9.4f s  %6.2fx" % (phase, old_seconds,
+                new_seconds, ratio)
+        if old_result["peak_memory_kb"] and result["peak_memory_kb"]:
+            print "\t%-20s %9d kB -> %8d kB" % ("peak memory",
+                old_result["peak_memory_kb"], result["peak_memory_kb"])
+
+def parse_cmd_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark nyccc on generated manuscripts and bibliographies.')
+    parser.add_argument('--sizes', help='Comma separated numbers of paragraphs to benchmark (default: %s)' % ",".join(map(str, DEFAULT_SIZES)), default=DEFAULT_SIZES, type=lambda s: [int(n) for n in s.split(",")])
+    parser.add_argument('--refs', help='Number of references (default: a third of the paragraphs)', dest='num_refs', type=int)
+    parser.add_argument('--seed', help='Seed of the generated corpora', default=0, type=int)
+    parser.add_argument('--repeat', help='Take the best of this many runs of each phase', default=DEFAULT_REPEAT, type=int)
+    parser.add_argument('-e', help='Eat this many letters from the end of author names of in-text citations', dest='suffix_eat_cnt', default=nyccc.EAT_SUFFIX_CHARS, type=int)
+    parser.add_argument('--engine', help='The citation extraction engine', choices=nyccc.EXTRACTION_ENGINES, default=nyccc.EXTRACTION_ENGINE)
+    parser.add_argument('-o', '--output', help='Save the results to this JSON file')
+    parser.add_argument('--compare', help='Compare two JSON result files instead of benchmarking', nargs=2, metavar=('OLD', 'NEW'))
+    return vars(parser.parse_args())
+
+def main():
+    parsed_args = parse_cmd_arguments()
+    if parsed_args['compare']:
+        old_file, new_file = parsed_args['compare']
+        with open(old_file) as old, open(new_file) as new:
+            compare(json.load(old), json.load(new))
+        return
+
+    sweep = run_sweep(parsed_args['sizes'], parsed_args['num_refs'],
+                      parsed_args['seed'], parsed_args['repeat'],
+                      parsed_args['suffix_eat_cnt'], parsed_args['engine'])
+    print_results(sweep)
+    if parsed_args['output']:
+        with open(parsed_args['output'], 'w') as out:
+            json.dump(sweep, out, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
@@ -135,11 +135,45 @@ example 2:
 
 import re
 import os
+import sys
 import argparse
+import multiprocessing
+from bisect import bisect_left, bisect_right
 from collections import Counter
-import codecs
+import hashlib
+import math
+import random
+import struct
+import tempfile
+import threading
+import time
+import json
+import zipfile
+import zlib
+import bz2
+from array import array
+import cPickle as pickle
+from collections import OrderedDict
+from contextlib import contextmanager
+from collections import namedtuple
+from itertools import combinations, islice
+from StringIO import StringIO
+import xml.etree.cElementTree as etree
 
 from unicodedata import normalize, category
+try:
+    import fcntl
+except ImportError:
+    # e.g. Windows, where the cache files are merged without a lock
+    fcntl = None
+try:
+    import lzma
+except ImportError:
+    # Python 2 has it only as a backport (pip install backports.lzma)
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
 
 
 ####################
@@ -158,155 +192,1884 @@ ETAL_NOTATIONS = ["et al."]
 EAT_SUFFIX_CHARS = 2 
 VERBOSITY = 0
 
+# How the citations are found from the paragraphs, see CitationParser
+EXTRACTION_ENGINES = ["scan", "regex", "anchored"]
+EXTRACTION_ENGINE = "scan"
+# How many characters before its year the anchored engine looks for the 
+#  names of a citation
+ANCHORED_WINDOW = 300
+# How many differently configured parsers are kept compiled (get_parser)
+PARSER_CACHE_SIZE = 16
+# Bump this when the format of the ExtractionCache files changes
+CACHE_FORMAT = 3
+# The ExtractionCache keeps the citations of each parser configuration in
+#  this many files (by the hash of the paragraph) with at most this many 
+#  paragraphs in all of them. The least recently used are dropped first.
+CACHE_SHARDS = 64
+CACHE_MAX_PARAGRAPHS = 1<<20
+# How many bibliographies the ExtractionCache keeps the keys of
+CACHE_MAX_BIBLIOGRAPHIES = 16
+# How many bytes of the manuscripts and bibliographies are read at once
+READ_CHUNK_SIZE = 1<<20
+# The manuscripts and bibliographies can be compressed, this is told by
+#  their first bytes. The extensions of the compressed files are left out
+#  when telling the format of the file by its extension. This file name 
+#  reads from the standard input.
+COMPRESSION_MAGIC = [("\x1f\x8b", "gzip"), ("BZh", "bzip2"),
+                     ("\xfd7zXZ\x00", "xz")]
+COMPRESSED_EXTENSIONS = [".gz", ".bz2", ".xz"]
+STDIN_FILENAME = "-"
+# The bibliography file formats (see load_bibliography) and the file
+#  extensions of the formats other than the plain text
+BIB_FORMATS = ["text", "bibtex", "ris", "csl-json"]
+BIB_FORMAT_EXTENSIONS = {".bib":"bibtex", ".bibtex":"bibtex", ".ris":"ris",
+                         ".json":"csl-json"}
+# The references and keys of the BibTeX, RIS and CSL-JSON bibliographies are
+#  saved next to them in a file with this suffix
+BIB_SIDECAR_SUFFIX = ".nyccc-keys"
+# With jobs, cross_check matches the unique citations in parallel only if
+#  there are at least this many of them. Each worker gets its share in
+#  this many chunks.
+PARALLEL_MATCH_MIN_CITES = 1000
+PARALLEL_MATCH_CHUNKS_PER_JOB = 4
+
+# How many "did you mean" references to suggest for citations without a
+#  reference (0 disables) and how many typos (edits to the names and year
+#  in total) a suggestion may have.
+SUGGESTIONS = 0
+SUGGESTION_MAX_DISTANCE = 2
+# How many author names are compared at most when looking for the
+#  suggestions of a citation. It bounds the time of a citation with a very
+#  common name, and being a count and not a time the suggestions are the
+#  same on every run.
+SUGGESTION_MAX_EVALUATIONS = 2000
+# How many locations of a citation the text report lists, and the array
+#  type the locations are stored as (see OccurrenceIndex)
+OCCURRENCES_SHOWN = 5
+OCCURRENCE_TYPECODE = 'I'
+
+# Near-duplicate references (see BibIndex.near_duplicates): the share of
+#  the words two references must have in common (of the words in either of
+#  them), and the bands and rows (hashes per band) of the MinHash LSH that
+#  finds the candidate pairs. With more bands or fewer rows fewer of the
+#  pairs close to the threshold are missed, but more pairs are compared.
+NEAR_DUPLICATE_THRESHOLD = 0.7
+MINHASH_BANDS = 10
+MINHASH_ROWS = 4
+# The words in more than this share of the references (e.g. "the", "of" and
+#  "journal") are left out of the MinHash signatures, and the buckets with
+#  more than this many references are not compared. Both would put many
+#  references that have little else in common in the same buckets.
+NEAR_DUPLICATE_COMMON_SHARE = 0.01
+NEAR_DUPLICATE_MAX_BUCKET = 50
+# How many parsed citation candidates each parser, and how many citation
+#  matches each bibliography index remember during a run (0 disables).
+#  The entries that have not been used for the longest are forgotten.
+PARSE_MEMO_SIZE = 1<<14
+MATCH_MEMO_SIZE = 1<<14
+# The estimate mode (see estimate_check): the confidence of the intervals
+#  and their half width upto which is sampled, how many paragraphs (and
+#  references) are sampled between looking at the intervals, the share of
+#  the paragraphs that may be read (for the sample) before all of them are
+#  checked instead (and the rates are exact), and the seed of the sampling.
+ESTIMATE_CONFIDENCE = 0.95
+ESTIMATE_MARGIN = 0.02
+ESTIMATE_ROUND = 50
+ESTIMATE_MAX_SHARE = 0.5
+ESTIMATE_SEED = 0
+
     
 ##################################
 # HELPER FUNCTIONS AND VARIABLES #
 ##################################
 
-# Compiled regexps comes here
-textcitere = None
-authorre = None
-yearre = None
-likere = None
-citere = None
+# The parser used when none is given (see init_regexps)
+_default_parser = None
 
 def _strip_accents(s):
     #print s.encode('utf8')
     return str(u''.join(c for c in normalize('NFD', s) if category(c) != u'Mn'))
 
-def _bib_to_key(bibref):
-    global yearre
+def _use_parser(parser):
+    if parser is None:
+        parser = _default_parser or init_regexps()
+    return parser
+
+class _LRUCache(object):
+    """ A thread-safe mapping that holds at most maxsize items and evicts
+    the least recently used ones. 
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            value = self._items.pop(key)
+            self._items[key] = value
+            return value
+    
+    def setdefault(self, key, value):
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+            self._items[key] = value
+            while len(self._items)>self.maxsize:
+                self._items.popitem(last=False)
+            return value
+
+# The default of _Memo.get when None is a valid value
+_MISSING = object()
+
+class _Memo(object):
+    """ A bounded memo of the results of a function by its arguments, that
+    counts its hits and misses. Unlike _LRUCache a hit is only a dict
+    lookup or two: the entries are kept in two generations of upto 
+    maxsize/2 entries, the used entries move to the newer one, and when 
+    it is full the older generation is forgotten as a whole.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._new = {}
+        self._old = {}
+    
+    def get(self, key, default=None):
+        value = self._new.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._old.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.put(key, value)
+        self.hits += 1
+        return value
+    
+    def put(self, key, value):
+        if len(self._new)>=self.maxsize//2:
+            if not self.maxsize:
+                return
+            self._old = self._new
+            self._new = {}
+        self._new[key] = value
     
-    yearmatch = yearre.search(bibref)       
+    def clear(self):
+        self._new = {}
+        self._old = {}
+    
+    def __len__(self):
+        return len(self._new)+len(self._old)
+
+def _load_pickle(filename, default):
+    try:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # Missing or broken cache files are just rebuilt
+        return default
+
+def _save_pickle(filename, data):
+    _save_file(filename,
+               lambda f: pickle.dump(data, f, pickle.HIGHEST_PROTOCOL))
+
+def _save_file(filename, write, shared=False):
+    # Write to a temp file first so that the readers never see a partial
+    #  file. The temp file is readable only by the user, a shared file gets
+    #  the permissions of the umask like any new file.
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename) or ".")
+    with os.fdopen(fd, 'wb') as f:
+        write(f)
+    if shared:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpname, 0666 & ~umask)
+    try:
+        os.rename(tmpname, filename)
+    except OSError:
+        os.remove(filename)
+        os.rename(tmpname, filename)
+
+@contextmanager
+def _locked(filename):
+    # Holds an exclusive lock on the file (created if missing) for merging
+    #  a file that other processes write too, if the platform has one
+    if fcntl is None:
+        yield
+        return
+    with open(filename, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _file_digest(filename, salt=""):
+    digest = hashlib.sha1(salt)
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(READ_CHUNK_SIZE), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _bib_to_key(bibref, parser=None):
+    # The reference upto the publication year, None if it has no year
+    parser = _use_parser(parser)
+    
+    yearmatch = parser.yearre.search(bibref)       
     if not yearmatch:
-        shortref = bibref[:min(len(bibref),60)]
-        print "WARNING: Reference '%s...' has no publication year" % shortref
-        end = len(bibref)-1
-    else:
-        end = yearmatch.span()[1]   
+        return None
+    end = yearmatch.span()[1]   
     return bibref[:end] 
     
-def _find_cite_in_bib(authors, year, bib_keys, full_bib=None):
-    # unpack 
-    cite_matched = False
-    matched_refs = []        
+def _ordered_match(ref, authors, year):
+    # Require author order
+    author_search_pos = 0
+    for author in authors:
+        search_result = ref.find(author, author_search_pos)
+        if search_result==-1:
+            return False
+        author_search_pos = search_result;
+    return year in ref
+
+def _unordered_match(full_ref, authors, year):
+    for author in authors:
+        if author not in full_ref:
+            return False
+    return year in full_ref
+
+class _SubstringIndex(object):
+    """ Candidate lookup for the author and year substring tests used when
+    matching citations. Every name-like token of every text is stored from
+    each capital letter onwards in a sorted list, so an author occurs in a
+    text exactly when it is a prefix of one of the stored stems. Years are
+    posted by their four digit prefix. The lookups return a superset of the
+    matching text ids (in text order), the caller still does the actual
+    comparison.
+    """
     
-    for ref in bib_keys:
-        match = True
-        
-        # Require author order
-        author_search_pos = 0
+    tokenre = re.compile(r"[a-zA-Z'`\-\?]+")
+    authorre = re.compile(r"[A-Z\?][a-zA-Z'`\-\?]*$")
+    digitsre = re.compile(r"(?=((?:18|19|20)[0-9][0-9]))")
+    
+    def __init__(self, texts):
+        self.size = len(texts)
+        stems = []
+        self.years = {}
+        for i, text in enumerate(texts):
+            for tm in self.tokenre.finditer(text):
+                token = tm.group(0)
+                for j, c in enumerate(token):
+                    if c.isupper() or c=="?":
+                        stems.append((token[j:], i))
+            for ym in self.digitsre.finditer(text):
+                self.years.setdefault(ym.group(1), set()).add(i)
+        stems.sort()
+        self.stems = [stem for stem, i in stems]
+        self.stem_ids = [i for stem, i in stems]
+    
+    def _author_ids(self, author):
+        if not self.authorre.match(author):
+            return None
+        # The stems starting with the author are a contiguous range 
+        #  ("\x7f" sorts after all the characters of the stems)
+        start = bisect_left(self.stems, author)
+        end = bisect_left(self.stems, author+"\x7f", start)
+        return set(self.stem_ids[start:end])
+    
+    def candidates(self, authors, year):
+        constraints = []
+        if self.digitsre.match(year):
+            constraints.append(self.years.get(year[:4], set()))
         for author in authors:
-            search_result = ref.find(author, author_search_pos)
-            if search_result==-1:
-                match = False
+            author_ids = self._author_ids(author)
+            if author_ids is not None:
+                constraints.append(author_ids)
+        if not constraints:
+            return range(self.size)
+        
+        # Intersect starting from the most selective constraint
+        constraints.sort(key=len)
+        candidate_ids = set(constraints[0])
+        for ids in constraints[1:]:
+            if not candidate_ids:
                 break
-            author_search_pos = search_result;
-            
-        if match and year in ref:
-            cite_matched = True
-            matched_refs.append(ref)
-            
-    # As a backup, do a full search (for example if names are editors)
-    if full_bib and not cite_matched:
-        for full_ref in full_bib:
-            match = True
-            for author in authors:
-                if author not in full_ref:
-                    match = False
-                    break
-            if match and year in full_ref:
-                cite_matched = True
-                matched_refs.append(_bib_to_key(full_ref))
-                
-                #print("DEBUG: fullbibmatch", authors, year)
+            candidate_ids &= ids
+        return sorted(candidate_ids)
+
+_dupwordre = re.compile(r"[a-z0-9]{2,}")
+
+def _near_duplicate_words(reference, ignored=()):
+    # The words of a reference for comparing it to the others. Initials,
+    #  punctuation and case do not count, nor the ignored words (e.g. "and"
+    #  as the other reference may have "&").
+    return frozenset(_dupwordre.findall(reference.lower())).difference(
+        ignored)
+
+def _token_minhashes(token, num_hashes):
+    # The values of num_hashes independent hash functions for the token
+    digests = "".join(hashlib.sha512(chr(i)+token).digest()
+                      for i in range(-(-4*num_hashes//64)))
+    return struct.unpack("<%dI" % num_hashes, digests[:4*num_hashes])
+
+def _near_duplicate_clusters(word_sets, threshold, bands, rows,
+                             common_share=NEAR_DUPLICATE_COMMON_SHARE,
+                             max_bucket=NEAR_DUPLICATE_MAX_BUCKET, stats=None):
+    """ Returns the groups of the word sets (lists of their indices) that
+    are linked by a Jaccard similarity of at least threshold. Comparing all
+    the pairs would take quadratic time, so the candidate pairs are found
+    with MinHash LSH. The MinHash signature of a set is the minimum of each
+    of bands*rows hash functions over its words, and two sets are compared
+    only if all the rows of some band of their signatures are the same. For
+    sets with a similarity s that happens with probability 1-(1-s**rows)**
+    bands.
+    
+    The words in more than common_share of the sets (and more than 
+    max_bucket sets) are left out of the signatures, but not of the
+    comparison, and the buckets of more than max_bucket sets are skipped.
+    Otherwise the sets that share only common words would fill a few 
+    buckets whose every pair is compared.
+    """
+    num_hashes = bands*rows
+    frequencies = Counter()
+    for words in word_sets:
+        frequencies.update(words)
+    # A word in fewer sets than a bucket can hold does not fill one, and in
+    #  a small bibliography even the words of a pair would be "common"
+    max_frequency = max(max_bucket, common_share*len(word_sets))
+    minhashes = {}
+    signatures = []
+    for words in word_sets:
+        # A set of only common words is hashed by them
+        rare_words = [word for word in words
+                      if frequencies[word]<=max_frequency] or words
+        if not rare_words:
+            signatures.append(None)
+            continue
+        vectors = []
+        for word in rare_words:
+            vector = minhashes.get(word)
+            if vector is None:
+                vector = minhashes[word] = _token_minhashes(word, num_hashes)
+            vectors.append(vector)
+        signatures.append(tuple(map(min, zip(*vectors))))
+    
+    # The same pair can share a bucket in many bands, it is compared once
+    pairs = set()
+    skipped = 0
+    for start in range(0, num_hashes, rows):
+        # Most of the buckets have one set, so they are not made lists
+        #  until another set falls in
+        first = {}
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            first_i = first.setdefault(signature[start:start+rows], i)
+            if first_i!=i:
+                buckets.setdefault(first_i, [first_i]).append(i)
+        for bucket in buckets.itervalues():
+            if len(bucket)>max_bucket:
+                skipped += 1
+                continue
+            pairs.update(combinations(bucket, 2))
+    
+    parents = range(len(word_sets))
+    def root(i):
+        while parents[i]!=i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+    
+    compared = 0
+    for j, i in pairs:
+        if root(i)==root(j):
+            continue
+        a, b = word_sets[i], word_sets[j]
+        common = len(a & b)
+        compared += 1
+        if common>=threshold*(len(a)+len(b)-common):
+            parents[root(i)] = root(j)
+    if stats:
+        stats.count("near-duplicate comparisons", compared)
+        stats.count("near-duplicate buckets skipped", skipped)
+    
+    clusters = {}
+    for i in range(len(word_sets)):
+        clusters.setdefault(root(i), []).append(i)
+    return sorted(cluster for cluster in clusters.itervalues()
+                  if len(cluster)>1)
+
+def _edit_distance(a, b, max_distance):
+    """ Returns the number of character insertions, deletions, substitutions
+    and swaps of adjacent characters that turn a into b (optimal string
+    alignment distance), or max_distance+1 if there are more than that.
+    """
+    if abs(len(a)-len(b))>max_distance:
+        return max_distance+1
+    # The common prefix and suffix need no edits
+    shortest = min(len(a), len(b))
+    start = 0
+    while start<shortest and a[start]==b[start]:
+        start += 1
+    end = 0
+    while end<shortest-start and a[-1-end]==b[-1-end]:
+        end += 1
+    if start+end==shortest:
+        # One is the other with characters added
+        return max(len(a), len(b))-shortest
+    if max_distance==0:
+        return 1
+    a, b = a[start:len(a)-end], b[start:len(b)-end]
+    # The first characters differ, so the first edit is to one of them. The
+    #  alternatives are searched only as deep as they could still be the
+    #  closest.
+    best = max_distance+1
+    if len(a)>1 and len(b)>1 and a[0]==b[1] and a[1]==b[0]:
+        best = 1+_edit_distance(a[2:], b[2:], best-2)
+    for rest_a, rest_b in ((a[1:], b[1:]), (a[1:], b), (a, b[1:])):
+        if best<=1:
+            break
+        best = min(best, 1+_edit_distance(rest_a, rest_b, best-2))
+    return best
+
+def _deletions(word, depth):
+    variants = set([word])
+    edge = variants
+    for d in range(depth):
+        edge = set(w[:i]+w[i+1:] for w in edge for i in range(len(w)))
+        variants |= edge
+    return variants
+
+class _SimilarWordIndex(object):
+    """ Finds the words that may be at most max_distance edits (see 
+    _edit_distance) away from a given word without comparing it to all of
+    them. Each word is stored under every variant that can be made by
+    deleting upto max_distance of its characters. Two words within the
+    distance always share such a variant, so only the words under the 
+    variants of the given word need to be compared.
+    """
     
-    return cite_matched, matched_refs
+    def __init__(self, words, max_distance):
+        self.max_distance = max_distance
+        self.variants = {}
+        for word in set(words):
+            for variant in _deletions(word, max_distance):
+                self.variants.setdefault(variant, []).append(word)
+    
+    def candidates(self, word):
+        """ Returns the sorted list of the words that may be within the
+        distance of the word, i.e. share a variant with it """
+        candidates = set()
+        for variant in _deletions(word, self.max_distance):
+            candidates.update(self.variants.get(variant, ()))
+        return sorted(candidates)
+
+def _to_ascii(line):
+    if isinstance(line, str):
+        line = line.decode('utf-8')
+    line = line.strip()
+    try:
+        # Most of the lines are ASCII, which is its own NFKD form
+        return line.encode('ascii')
+    except UnicodeEncodeError:
+        return normalize('NFKD', line).encode('ascii', 'ignore')
+
+def _to_ascii_lines(lines):
+    # The _to_ascii of each of the lines, but normalized all at once, which
+    #  is much faster when many of them are not ASCII
+    try:
+        text = u"\n".join(lines)
+    except UnicodeDecodeError:
+        return [_to_ascii(line) for line in lines]
+    texts = normalize('NFKD', text).encode('ascii', 'ignore').split("\n")
+    if len(texts)!=len(lines):
+        # Some of the lines had line breaks
+        return [_to_ascii(line) for line in lines]
+    return [folded.strip() for folded in texts]
+
+_nonasciire = re.compile(u"[^\x00-\x7f]")
+
+def _fold_with_offsets(line):
+    """ Normalizes the line to ASCII like _to_ascii (it folds the same char
+    by char) and returns it with the index of each of its characters in the
+    original line.
+    """
+    if isinstance(line, str):
+        line = line.decode('utf-8')
+    stripped = line.strip()
+    lead = len(line)-len(line.lstrip())
+    chars = []
+    offsets = []
+    # The runs of ASCII in between are taken as they are
+    run_start = 0
+    for nonascii in _nonasciire.finditer(stripped):
+        i = nonascii.start()
+        chars.append(stripped[run_start:i])
+        offsets.extend(xrange(lead+run_start, lead+i))
+        folded = normalize('NFKD', nonascii.group()).encode('ascii', 'ignore')
+        chars.append(folded)
+        offsets.extend([lead+i]*len(folded))
+        run_start = i+1
+    chars.append(stripped[run_start:])
+    offsets.extend(xrange(lead+run_start, lead+len(stripped)+1))
+    return "".join(chars).encode('ascii'), offsets
+
+# How many ASCII chars each non-ASCII char folds to
+_folded_lengths = {}
+
+def _folded_length(c):
+    folded_len = _folded_lengths.get(c)
+    if folded_len is None:
+        folded_len = _folded_lengths[c] = len(normalize('NFKD', c).encode(
+            'ascii', 'ignore'))
+    return folded_len
+
+def _original_spans(line, nonunicode_line, spans):
+    # The (start, end) spans in the normalized line as (offset, length) in
+    #  the original line
+    if isinstance(line, str):
+        line = line.decode('utf-8')
+    stripped = line.strip()
+    lead = len(line)-len(line.lstrip())
+    # The offsets do not move if all the chars fold to one char, like ASCII
+    #  and the accented letters do
+    if len(stripped)==len(nonunicode_line) and \
+       all(_folded_length(c)==1 for c in set(_nonasciire.findall(stripped))):
+        return [(lead+start, end-start) for start, end in spans]
+    
+    # Only the non-ASCII chars move the offsets. For each of them, where
+    #  its folded chars start and end in the normalized line, its offset 
+    #  and how much the offsets of the ASCII after it have moved.
+    folded_starts = []
+    folded_ends = []
+    offsets = []
+    shifts = []
+    shift = lead
+    for nonascii in _nonasciire.finditer(stripped):
+        offset = lead+nonascii.start()
+        folded_len = _folded_length(nonascii.group())
+        shift += 1-folded_len
+        folded_starts.append(offset-shift+1-folded_len)
+        folded_ends.append(offset-shift+1)
+        offsets.append(offset)
+        shifts.append(shift)
+    
+    def original(position):
+        j = bisect_right(folded_starts, position)-1
+        if j<0:
+            return lead+position
+        if position<folded_ends[j]:
+            return offsets[j]
+        return position+shifts[j]
+    
+    original_spans = []
+    for start, end in spans:
+        offset = original(start)
+        original_spans.append((offset, original(end-1)+1-offset))
+    return original_spans
+
+def _decompressor(compression):
+    if compression=="gzip":
+        return zlib.decompressobj(16+zlib.MAX_WBITS)
+    elif compression=="bzip2":
+        return bz2.BZ2Decompressor()
+    if lzma is None:
+        raise IOError("Reading xz files needs the lzma module "
+                      "(pip install backports.lzma)")
+    return lzma.LZMADecompressor()
+
+# The errors of the decompressors on corrupt data
+DECOMPRESSION_ERRORS = (IOError, zlib.error)+(
+    (lzma.LZMAError,) if lzma is not None else ())
+
+def _stream_ended(decompressor):
+    # Whether the decompressor has read its whole stream. The zlib and bz2
+    #  of Python 2 tell it only by what they do with more data.
+    if hasattr(decompressor, 'eof'):
+        return decompressor.eof
+    try:
+        decompressor.decompress("\x00")
+    except EOFError:
+        return True
+    except zlib.error:
+        return False
+    return decompressor.unused_data=="\x00"
+
+def _read_blocks(filename, chunk_size=READ_CHUNK_SIZE):
+    """ Generator that reads the file in big chunks and yields them. A 
+    gzip, bzip2 or xz compressed file (see COMPRESSION_MAGIC) is 
+    decompressed chunk by chunk, and "-" (STDIN_FILENAME) is read from the
+    standard input, so nothing is written to a temporary file.
+    """
+    if filename==STDIN_FILENAME:
+        src = sys.stdin
+        if sys.platform=="win32":
+            import msvcrt
+            msvcrt.setmode(src.fileno(), os.O_BINARY)
+    else:
+        src = open(filename, 'rb')
+    try:
+        # The first chunk has at least the magic bytes
+        chunk = src.read(max([chunk_size]+[len(magic) for magic, name 
+                                           in COMPRESSION_MAGIC]))
+        compression = None
+        for magic, name in COMPRESSION_MAGIC:
+            if chunk.startswith(magic):
+                compression = name
+        if compression is None:
+            while chunk:
+                yield chunk
+                chunk = src.read(chunk_size)
+            return
+        
+        decompressor = _decompressor(compression)
+        while chunk:
+            try:
+                block = decompressor.decompress(chunk)
+            except EOFError:
+                # The stream ended with the previous chunk
+                if chunk.strip("\x00"):
+                    decompressor = _decompressor(compression)
+                else:
+                    chunk = src.read(chunk_size)
+                continue
+            except DECOMPRESSION_ERRORS as error:
+                raise IOError("Can not decompress %s: %s" % (filename,
+                                                              error))
+            if block:
+                yield block
+            # Concatenated streams (e.g. cat a.gz b.gz, pbzip2) are read
+            #  one after another, padding zeros after the last are skipped
+            chunk = decompressor.unused_data
+            if chunk.strip("\x00"):
+                decompressor = _decompressor(compression)
+            else:
+                chunk = src.read(chunk_size)
+        # A truncated file (e.g. of an interrupted download) is not read
+        #  as if it ended there
+        if not _stream_ended(decompressor):
+            raise IOError("Can not decompress %s: the %s stream is "
+                          "truncated" % (filename, compression))
+    finally:
+        if src is not sys.stdin:
+            src.close()
+
+def _read_lines(filename, chunk_size=READ_CHUNK_SIZE):
+    """ Generator that reads the UTF-8 file in big chunks (see _read_blocks,
+    also compressed or from the standard input) and yields its lines as
+    unicode like the reader of codecs.open would, but without the line
+    breaks.
+    """
+    rest = ""
+    blocks = _read_blocks(filename, chunk_size)
+    while True:
+        chunk = next(blocks, None)
+        if chunk:
+            # A newline can not be a part of a multibyte character
+            chunk = rest+chunk
+            end = chunk.rfind("\n")+1
+            chunk, rest = chunk[:end], chunk[end:]
+            if not chunk:
+                continue
+        elif rest:
+            chunk, rest = rest, ""
+        else:
+            return
+        for line in chunk.decode('utf-8').splitlines():
+            yield line
+
+# The XML namespaces of the paragraphs of .docx and .odt files
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_ODF_TEXT_NS = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+class _ParagraphTarget(object):
+    """ An XMLParser target that collects the text of the paragraphs of a
+    document as the XML is fed to the parser. No tree is built, so the 
+    memory use does not grow with the size of the document. A paragraph 
+    inside another one (e.g. a note or a text box) is a paragraph of its 
+    own and it is finished before the one it is in.
+    
+    paragraph_tags
+        the tags of the paragraph elements
+    text_tags
+        the tags of the elements that have the text of the paragraphs, or
+         None if all the text inside the paragraphs is
+    skipped_tags
+        the tags of the elements whose text is not a part of the paragraphs
+    inline_text
+        a function that returns the text that an element (tag, attrib) 
+         stands for, e.g. u"\t" for a tab, or None
+    """
+    
+    def __init__(self, paragraph_tags, text_tags, skipped_tags, inline_text):
+        self.paragraph_tags = paragraph_tags
+        self.text_tags = text_tags
+        self.skipped_tags = skipped_tags
+        self.inline_text = inline_text
+        # The finished paragraphs, to be taken by the reader
+        self.paragraphs = []
+        self._open = []
+        self._skipped = 0
+        self._in_text = 0
+    
+    def start(self, tag, attrib):
+        if tag in self.paragraph_tags:
+            self._open.append([])
+        elif tag in self.skipped_tags:
+            self._skipped += 1
+        elif self.text_tags and tag in self.text_tags:
+            self._in_text += 1
+        elif self._open and not self._skipped:
+            text = self.inline_text(tag, attrib)
+            if text:
+                self._open[-1].append(text)
+    
+    def end(self, tag):
+        if tag in self.paragraph_tags:
+            self.paragraphs.append(u"".join(self._open.pop()))
+        elif tag in self.skipped_tags:
+            self._skipped -= 1
+        elif self.text_tags and tag in self.text_tags:
+            self._in_text -= 1
+    
+    def data(self, data):
+        if self._open and not self._skipped and \
+           (self._in_text or self.text_tags is None):
+            self._open[-1].append(data)
+    
+    def close(self):
+        pass
+
+def _xml_paragraphs(stream, target):
+    # Feeds the XML stream to the parser in chunks and yields the 
+    #  paragraphs of each as soon as they are finished
+    parser = etree.XMLParser(target=target)
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), ""):
+        parser.feed(chunk)
+        for paragraph in target.paragraphs:
+            yield paragraph
+        del target.paragraphs[:]
+    parser.close()
+    for paragraph in target.paragraphs:
+        yield paragraph
+
+_DOCX_INLINE_TEXT = {_WORD_NS+"tab":u"\t", _WORD_NS+"br":u" ", 
+                     _WORD_NS+"cr":u" ", _WORD_NS+"noBreakHyphen":u"-"}
+
+def _docx_inline_text(tag, attrib):
+    return _DOCX_INLINE_TEXT.get(tag)
+
+def _odt_inline_text(tag, attrib):
+    if tag==_ODF_TEXT_NS+"s":
+        return u" "*int(attrib.get(_ODF_TEXT_NS+"c", 1))
+    elif tag==_ODF_TEXT_NS+"tab":
+        return u"\t"
+    elif tag==_ODF_TEXT_NS+"line-break":
+        return u" "
+    return None
+
+def _docx_paragraphs(filename):
+    # The tab stops of the paragraph properties are not tabs
+    target = _ParagraphTarget((_WORD_NS+"p",), (_WORD_NS+"t",),
+                              (_WORD_NS+"pPr",), _docx_inline_text)
+    with zipfile.ZipFile(filename) as archive:
+        for paragraph in _xml_paragraphs(archive.open("word/document.xml"),
+                                         target):
+            yield paragraph
+
+def _odt_paragraphs(filename):
+    # The note citations are the numbers of the (foot)notes
+    target = _ParagraphTarget((_ODF_TEXT_NS+"p", _ODF_TEXT_NS+"h"), None,
+                              (_ODF_TEXT_NS+"note-citation",),
+                              _odt_inline_text)
+    with zipfile.ZipFile(filename) as archive:
+        for paragraph in _xml_paragraphs(archive.open("content.xml"), target):
+            yield paragraph
+
+# The readers of the manuscript files other than plain text
+_MANUSCRIPT_READERS = {".docx":_docx_paragraphs, ".odt":_odt_paragraphs}
+
+def _read_manuscript(filename):
+    """ Generator that yields the paragraphs of a plain text (1 line = 1
+    paragraph, see _read_lines, which can also be compressed or the 
+    standard input), .docx or .odt manuscript in the document order. The
+    empty paragraphs are yielded too, so the index of a paragraph is its
+    position in the document.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    reader = _MANUSCRIPT_READERS.get(extension, _read_lines)
+    return reader(filename)
+
+def _cite_key(cite):
+    if isinstance(cite, Citation):
+        return cite
+    return Citation(*cite)
+
+def _intern(string):
+    # Only byte strings can be interned
+    return intern(string) if type(string) is str else string
 
 def _unique(cites):
-    nolist_cites = [(" ".join(auths), year, cmpl) for auths, year, cmpl in cites]    
-    seen = set()
-    seen_add = seen.add
-    unique_nolist_cites  = [ x for x in nolist_cites if x not in seen and not seen_add(x)]    
-    return [(auths.split(), year, cmpl) for auths, year, cmpl in unique_nolist_cites]
+    return list(iter_unique_cites(cites))
+
+def _extension(filename):
+    # The extension of the file without the compression (see 
+    #  COMPRESSED_EXTENSIONS), in lower case
+    base, extension = os.path.splitext(filename)
+    if extension.lower() in COMPRESSED_EXTENSIONS:
+        extension = os.path.splitext(base)[1]
+    return extension.lower()
 
 def _file_exists(filename):
-    if os.path.exists(filename):
+    if filename==STDIN_FILENAME or os.path.exists(filename):
         return filename
     raise argparse.ArgumentError("%s does not exist" % filename)
     
+def _get_author_without_suffix(author, suffix_length):
+    suffix_length = min(len(author)/2, suffix_length)
+    return author[:-suffix_length]
+
 def _cite_to_str(cite, eat_cnt):
     #unpack
     authors, year, complete = cite
     if not complete and eat_cnt>0:
-        for i, a in enumerate(authors):
+        eaten_authors = []
+        for a in authors:
             aeat = min(len(a)/2, eat_cnt)
-            authors[i] = a[:-aeat]+"("+a[-aeat:]+"/-)"
+            eaten_authors.append(a[:-aeat]+"("+a[-aeat:]+"/-)")
+        authors = eaten_authors
     return "(%s %s)" % (", ".join(authors), year)  
+
+# The common abbreviations of the months BibTeX knows
+_BIBTEX_MONTHS = dict((month[:3].lower(), month) for month in 
+    ["January", "February", "March", "April", "May", "June", "July",
+     "August", "September", "October", "November", "December"])
+_bibtex_startre = re.compile(r"@\s*[a-zA-Z]+\s*([{(])")
+_bibtex_bracere = {"{":re.compile(r"[{}]"), "(":re.compile(r"[()]")}
+_bibtex_headre = re.compile(r"@\s*([a-zA-Z]+)\s*[{(]\s*")
+_bibtex_fieldre = re.compile(r"[\s,]*([^\s=,{}()\"#]+)\s*=\s*")
+_bibtex_wordre = re.compile(r"[^\s,#{}()\"]+")
+_bibtex_quotere = re.compile(r"[{}\"]")
+_bibtex_andre = re.compile(r"([{}])|\s+and\s+", re.IGNORECASE)
+_bibtex_commare = re.compile(r"([{}])|,")
+_bibtex_spacere = re.compile(r"([{}])|\s+")
+# LaTeX that is not text: accents (the letter is kept), escapes and commands
+_LATEX_LETTERS = {"ss":"ss", "o":"o", "O":"O", "aa":"a", "AA":"A",
+                  "ae":"ae", "AE":"AE", "oe":"oe", "OE":"OE", "l":"l",
+                  "L":"L", "i":"i", "j":"j"}
+_latexaccentre = re.compile(r"\\(?:[`'^\"~=.]|[cvuHkrdbt](?=[\s{]))\s*")
+_latexescapere = re.compile(r"\\([&%$#_])")
+_latexcommandre = re.compile(r"\\([a-zA-Z]+)\s*")
+_fieldyearre = re.compile(r"[0-9]{4}[a-z]?")
+
+def _bibtex_entries(lines):
+    # The text of each @entry{...} in the lines, the text between them is
+    #  ignored like BibTeX does
+    entry = []
+    bracere = None
+    for line in lines:
+        while line:
+            if bracere is None:
+                start = _bibtex_startre.search(line)
+                if not start:
+                    break
+                bracere = _bibtex_bracere[start.group(1)]
+                line = line[start.start():]
+                depth = 0
+            end = None
+            for brace in bracere.finditer(line):
+                depth += 1 if brace.group() in "{(" else -1
+                if depth==0:
+                    end = brace.end()
+                    break
+            if end is None:
+                entry.append(line)
+                break
+            entry.append(line[:end])
+            yield "\n".join(entry)
+            entry, bracere, line = [], None, line[end:]
+
+def _bibtex_group_end(text, pos):
+    # The position after the brace or the quote that closes the one at pos
+    depth = 0
+    if text[pos]=="{":
+        for brace in _bibtex_bracere["{"].finditer(text, pos):
+            depth += 1 if brace.group()=="{" else -1
+            if depth==0:
+                return brace.end()
+    else:
+        for match in _bibtex_quotere.finditer(text, pos+1):
+            if match.group()=='"' and depth==0:
+                return match.end()
+            depth += {"{":1, "}":-1}.get(match.group(), 0)
+    raise ValueError("unterminated value")
+
+def _bibtex_value(text, pos, macros):
+    # The value of a field from pos and the position after it. The parts
+    #  "like" # {this} are concatenated and the @string macros expanded.
+    parts = []
+    while True:
+        while text[pos].isspace():
+            pos += 1
+        if text[pos] in "{\"":
+            end = _bibtex_group_end(text, pos)
+            parts.append(text[pos+1:end-1])
+        else:
+            word = _bibtex_wordre.match(text, pos)
+            if not word:
+                break
+            end = word.end()
+            name = word.group().lower()
+            parts.append(macros.get(name, _BIBTEX_MONTHS.get(name,
+                                                             word.group())))
+        pos = end
+        while pos<len(text) and text[pos].isspace():
+            pos += 1
+        if text[pos:pos+1]!="#":
+            break
+        pos += 1
+    return "".join(parts), pos
+
+def _bibtex_fields(text, pos, macros):
+    fields = {}
+    while True:
+        field = _bibtex_fieldre.match(text, pos)
+        if not field:
+            return fields
+        value, pos = _bibtex_value(text, field.end(), macros)
+        fields[field.group(1).lower()] = value
+
+def _bibtex_split(value, sepre):
+    # Splits at the separators that are not inside braces
+    if "{" not in value:
+        parts = sepre.split(value)[::sepre.groups+1]
+        return [part.strip() for part in parts if part.strip()]
+    parts = []
+    depth = 0
+    start = 0
+    for match in sepre.finditer(value):
+        if match.group(1)=="{":
+            depth += 1
+        elif match.group(1)=="}":
+            depth -= 1
+        elif depth==0:
+            parts.append(value[start:match.start()])
+            start = match.end()
+    parts.append(value[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def _latex_to_ascii(text):
+    if "\\" not in text and "{" not in text and "~" not in text:
+        return " ".join(_to_ascii(text).split())
+    text = _latexaccentre.sub("", text)
+    text = _latexescapere.sub(r"\1", text)
+    text = _latexcommandre.sub(
+        lambda command: _LATEX_LETTERS.get(command.group(1), ""), text)
+    text = text.replace("{", "").replace("}", "").replace("~", " ")
+    return " ".join(_to_ascii(text).split())
+
+def _bibtex_name(name):
+    # The (last, first) names of a "First von Last", "von Last, First" or
+    #  "von Last, Jr, First" name
+    parts = _bibtex_split(name, _bibtex_commare)
+    if len(parts)>1:
+        return _latex_to_ascii(parts[0]), _latex_to_ascii(parts[-1])
+    words = [_latex_to_ascii(word)
+             for word in _bibtex_split(name, _bibtex_spacere)]
+    words = [word for word in words if word]
+    von = len(words)-1
+    for i, word in enumerate(words[:-1]):
+        if word[:1].islower():
+            von = i
+            break
+    return " ".join(words[von:]), " ".join(words[:von])
+
+def _bibtex_names(value):
+    names = [_bibtex_name(name) for name in _bibtex_split(value, _bibtex_andre)
+             if name.lower()!="others"]
+    return [(last, first) for last, first in names if last]
+
+def _bibtex_refs(lines):
+    # The (reference, key) of each entry of a BibTeX file
+    macros = {}
+    for entry in _bibtex_entries(lines):
+        head = _bibtex_headre.match(entry)
+        entry_type = head.group(1).lower()
+        if entry_type in ("comment", "preamble"):
+            continue
+        try:
+            if entry_type=="string":
+                for name, value in _bibtex_fields(entry, head.end(),
+                                                  macros).iteritems():
+                    macros[name] = value
+                continue
+            # Skip the citation key
+            fields = _bibtex_fields(entry, entry.find(",", head.end())+1,
+                                    macros)
+        except (ValueError, IndexError):
+            # A broken entry is skipped
+            continue
+        
+        names = _bibtex_names(fields.get("author", "")) or \
+                _bibtex_names(fields.get("editor", ""))
+        if not names:
+            for field in ("organization", "institution"):
+                if fields.get(field):
+                    names = [(_latex_to_ascii(fields[field]), "")]
+                    break
+        year = _fieldyearre.search(fields.get("year") or
+                                   fields.get("date", ""))
+        container = fields.get("journal") or fields.get("booktitle") or \
+                    fields.get("publisher") or ""
+        yield _format_reference(names, year.group() if year else None,
+                                _latex_to_ascii(fields.get("title", "")),
+                                _latex_to_ascii(container))
+
+_rislinere = re.compile(r"([A-Z][A-Z0-9])  -(?: (.*))?$")
+
+def _ris_name(name):
+    # RIS names are "Last, First, Suffix", organizations have no comma
+    parts = [_to_ascii(part) for part in name.split(",")]
+    return parts[0], parts[1] if len(parts)>1 else ""
+
+def _ris_field(record, *tags):
+    # The first value of the first of the tags the record has
+    for tag in tags:
+        if record.get(tag):
+            return record[tag][0]
+    return ""
+
+def _ris_refs(lines):
+    # The (reference, key) of each record of a RIS file
+    record = {}
+    for line in lines:
+        tag = _rislinere.match(line.lstrip(u"\ufeff"))
+        if not tag:
+            continue
+        name, value = tag.group(1), (tag.group(2) or "").strip()
+        if name=="TY":
+            record = {}
+        elif name=="ER":
+            names = [_ris_name(author) for author in 
+                     record.get("AU") or record.get("A1") or
+                     record.get("A2") or record.get("ED") or []]
+            year = _fieldyearre.search(_ris_field(record, "PY", "Y1", "DA"))
+            yield _format_reference([ris_name for ris_name in names
+                                     if ris_name[0]],
+                year.group() if year else None,
+                _to_ascii(_ris_field(record, "TI", "T1", "CT")),
+                _to_ascii(_ris_field(record, "T2", "JO", "JF", "JA", "BT",
+                                     "PB")))
+            record = {}
+        elif value:
+            record.setdefault(name, []).append(value)
+
+def _csl_names(names):
+    result = []
+    for name in names or []:
+        if name.get("family"):
+            last = name["family"]
+            if name.get("non-dropping-particle"):
+                last = name["non-dropping-particle"]+" "+last
+            result.append((_to_ascii(last), _to_ascii(name.get("given", ""))))
+        elif name.get("literal"):
+            result.append((_to_ascii(name["literal"]), ""))
+    return result
+
+def _csl_year(issued):
+    if not issued:
+        return None
+    try:
+        return str(int(issued["date-parts"][0][0]))
+    except (KeyError, IndexError, TypeError, ValueError):
+        year = _fieldyearre.search(unicode(issued.get("raw") or
+                                           issued.get("literal") or ""))
+        return year.group() if year else None
+
+def _csl_json_refs(filename):
+    # The (reference, key) of each item of a CSL-JSON file
+    items = json.loads("".join(_read_blocks(filename)))
+    for item in items:
+        names = _csl_names(item.get("author")) or \
+                _csl_names(item.get("editor"))
+        container = item.get("container-title") or item.get("publisher") or ""
+        if isinstance(container, list):
+            container = container[0] if container else ""
+        yield _format_reference(names, _csl_year(item.get("issued")),
+                                _to_ascii(item.get("title", "")),
+                                _to_ascii(container))
+
+def _initials(first):
+    # "Jussi Pekka" -> "J. P."
+    return " ".join(word if word.endswith(".") else 
+                    "-".join(part[0]+"." for part in word.split("-") if part)
+                    for word in first.split())
+
+def _format_reference(names, year, title="", container=""):
+    # A name-year reference like "Rasku, J. & Musliu, N. 2013. Title.
+    #  Journal." and its key (the part upto the year, None without a year).
+    #  The names are (last, first) tuples.
+    year = str(year) if year else None
+    authors = ["%s, %s" % (last, _initials(first)) if first else last
+               for last, first in names]
+    if len(authors)>1:
+        authors = ", ".join(authors[:-1])+" & "+authors[-1]
+    elif authors:
+        authors = authors[0]
+    else:
+        authors, title = title, ""
+    key = ("%s %s" % (authors, year)).strip() if year else None
+    reference = key or authors
+    for part in (title, container):
+        if part:
+            reference = reference.rstrip(".")+". "+part
+    if not reference.endswith((".", "?", "!")):
+        reference += "."
+    return reference, key
+
+def _bib_format(filename, bib_format=None):
+    if bib_format:
+        return bib_format
+    return BIB_FORMAT_EXTENSIONS.get(_extension(filename), "text")
+
+# Read-only state of the check_many worker processes
+_batch_state = None
+
+def _init_batch_worker(parser, bib_index, mutlicite_sep, suffix_eat_cnt,
+                       verbosity, cache, suggestions, with_stats):
+    global _batch_state
+    _batch_state = (parser, bib_index, mutlicite_sep, suffix_eat_cnt,
+                    verbosity, cache, suggestions, with_stats)
+
+# Read-only state of the cross_check worker processes
+_match_state = None
+
+def _init_match_worker(bib_index, suffix_eat_cnt, suggestions, with_stats):
+    global _match_state
+    _match_state = (bib_index, suffix_eat_cnt, suggestions, with_stats)
+
+def _match_chunk(cites):
+    bib_index, suffix_eat_cnt, suggestions, with_stats = _match_state
+    stats = CheckStats() if with_stats else None
+    return _match_cites(cites, bib_index, suffix_eat_cnt, suggestions,
+                        stats) + (stats,)
+
+def _match_cites(cites, bib, suffix_eat_cnt, suggestions, stats):
+    # Matches the citations against the BibIndex. Returns a tuple (problems,
+    #  refcnt, num_cites, suggestions_stopped) where refcnt counts how many 
+    #  citations each reference key has.
+    refcnt = Counter()
+    problems = []
+    num_cites = 0
+    suggestions_stopped = False
+    for cite in cites:
+        if stats:
+            cite_has_target, refs = stats.timed("match citations", bib.match,
+                                                cite, suffix_eat_cnt, stats)
+            stats.count("cites checked")
+            if not cite_has_target:
+                stats.count("missing")
+            elif len(refs)>1:
+                stats.count("ambiguous")
+        else:
+            cite_has_target, refs = bib.match(cite, suffix_eat_cnt)
+        num_cites += 1
+        
+        if cite_has_target:
+            if len(refs)>1:
+                problems.append(Problem("ambiguous", cite,
+                                        bib.full_refs(refs)))
+            for ref in refs:
+                refcnt[ref] += 1
+        else:
+            similar_refs = []
+            if suggestions:
+                cut = []
+                if stats:
+                    similar_refs = stats.timed("suggest", bib.suggest, cite,
+                                               suggestions, cut=cut)
+                else:
+                    similar_refs = bib.suggest(cite, suggestions, cut=cut)
+                suggestions_stopped |= bool(cut)
+            problems.append(Problem("missing-reference", cite,
+                [fullref for distance, fullref in similar_refs]))
+    return problems, refcnt, num_cites, suggestions_stopped
+
+def _check_document(textfile):
+    (parser, bib_index, mutlicite_sep, suffix_eat_cnt, verbosity,
+     cache, suggestions, with_stats) = _batch_state
+    stats = CheckStats() if with_stats else None
+    
+    # The detection output (verbosity>1) is collected per document 
+    stdout = sys.stdout
+    sys.stdout = log = StringIO()
+    try:
+        occurrences = OccurrenceIndex()
+        ucites = list(iter_unique_cites(
+            iter_cites(_read_manuscript(textfile), mutlicite_sep,
+                       verbosity=verbosity, parser=parser, cache=cache,
+                       stats=stats, occurrences=occurrences)))
+    finally:
+        sys.stdout = stdout
+    ucites.sort()
+    if cache:
+        cache.save()
+    
+    result = cross_check(ucites, bib_index, suffix_eat_cnt, parser,
+                         suggestions, stats)
+    result.textfile = textfile
+    result.num_cites = occurrences.total()
+    result.occurrences = occurrences
+    result.stats = stats
+    result.log = log.getvalue()
+    return result
+
+# Read-only state of the estimate_many worker processes
+_estimate_state = None
+
+def _init_estimate_worker(parser, bib_index, mutlicite_sep, suffix_eat_cnt,
+                          confidence, margin, with_stats):
+    global _estimate_state
+    _estimate_state = (parser, bib_index, mutlicite_sep, suffix_eat_cnt,
+                       confidence, margin, with_stats)
+
+def _estimate_document(textfile):
+    (parser, bib_index, mutlicite_sep, suffix_eat_cnt, confidence, margin,
+     with_stats) = _estimate_state
+    stats = CheckStats() if with_stats else None
+    estimate = estimate_check(_read_manuscript(textfile), bib_index,
+        mutlicite_sep, suffix_eat_cnt, parser, confidence, margin,
+        stats=stats)
+    estimate.textfile = textfile
+    estimate.stats = stats
+    return estimate
+
+def _normal_quantile(p):
+    # The inverse of the standard normal distribution function, by bisection
+    low, high = -40.0, 40.0
+    for i in range(100):
+        middle = (low+high)/2
+        if 0.5*math.erfc(-middle/math.sqrt(2))<p:
+            low = middle
+        else:
+            high = middle
+    return (low+high)/2
+
+def _wilson_interval(successes, n, z, population=None):
+    # Returns (rate, low, high), the Wilson score interval of the rate. If
+    #  the sample is drawn without replacement from a population of known
+    #  size, the finite population correction is applied.
+    if n==0:
+        return 0.0, 0.0, 1.0
+    rate = float(successes)/n
+    if population is not None:
+        if n>=population:
+            return rate, rate, rate
+        n = n*(population-1.0)/(population-n)
+    denominator = 1+z*z/n
+    center = (rate+z*z/(2*n))/denominator
+    half = z*math.sqrt(rate*(1-rate)/n+z*z/(4*n*n))/denominator
+    return rate, max(0.0, center-half), min(1.0, center+half)
+
+def _design_effect(n, sums, rate):
+    # How many times the variance of a share drawn in n clusters (e.g. the
+    #  citations of n paragraphs) is that of as many independent draws. 
+    #  sums are the sums of draws, successes**2, successes*draws and 
+    #  draws**2 over the clusters. It is at least one, so an interval is 
+    #  never narrower than with independent draws.
+    draws, ss, sd, dd = sums
+    if n<2 or not 0<rate<1:
+        return 1.0
+    residuals = (ss-2*rate*sd+rate*rate*dd)/(n-1)
+    return max(1.0, n*residuals/(draws*rate*(1-rate)))
+
+# The capitalized words of the paragraphs and of the names, "Rasku-Puttonen"
+#  and "O'Neil" are two of them
+_namewordre = re.compile(r"[A-Z\?][a-zA-Z\?]*")
+
+class _ManuscriptSample(object):
+    # The paragraphs of a manuscript for estimate_check. The paragraphs are
+    #  normalized (all at once) and indexed by their capitalized words up
+    #  front, but their citations are extracted only when they are needed.
+    
+    def __init__(self, lines, mutlicite_sep, parser, stats):
+        if stats:
+            started = time.time()
+        self.texts = _to_ascii_lines(lines)
+        self.mutlicite_sep = mutlicite_sep
+        self.parser = parser
+        self.stats = stats
+        self._cites = {}
+        self._word_ids = {}
+        for i, text in enumerate(self.texts):
+            for word in set(_namewordre.findall(text)):
+                self._word_ids.setdefault(word, []).append(i)
+        self._year_ids = {}
+        self._firsts = {}
+        self._stems = {}
+        if stats:
+            stats.add_time("index manuscript", time.time()-started)
+    
+    def cites(self, i):
+        """ The distinct citations of the paragraph, in the text order """
+        cites = self._cites.get(i)
+        if cites is None:
+            if self.stats:
+                started = time.time()
+            cites = []
+            for cite in _paragraph_cites(self.texts[i], self.mutlicite_sep, 0,
+                                         self.parser, None, self.stats):
+                if cite not in cites:
+                    cites.append(cite)
+            cites = self._cites[i] = tuple(cites)
+            if self.stats:
+                self.stats.add_time("find citations", time.time()-started)
+        return cites
+    
+    def num_read(self):
+        return len(self._cites)
+    
+    def match(self, cite, bib, suffix_eat_cnt):
+        """ bib.match of the citation (timed to the stats) """
+        if self.stats:
+            return self.stats.timed("match citations", bib.match, cite,
+                                    suffix_eat_cnt, self.stats)
+        return bib.match(cite, suffix_eat_cnt)
+    
+    def _year_set(self, year):
+        # The set of the paragraphs with the year
+        ids = self._year_ids.get(year)
+        if ids is None:
+            ids = self._year_ids[year] = frozenset([i for i, text in 
+                enumerate(self.texts) if year in text])
+        return ids
+    
+    def cited_before(self, cite, i):
+        """ True if a paragraph before the ith (that has the citation) has
+        the citation too """
+        first = self._firsts.get(cite)
+        if first is None:
+            first = self._firsts[cite] = self._first_paragraph(cite, i)
+        return first<i
+    
+    def _first_paragraph(self, cite, i):
+        # The first paragraph with the citation, i if none before it. Only
+        #  the paragraphs with the year and the rarest word of the authors
+        #  are looked at.
+        year_ids = self._year_set(cite.year[:4])
+        ids = None
+        for author in cite.authors:
+            for word in _namewordre.findall(author):
+                word_ids = self._word_ids.get(word, ())
+                if ids is None or len(word_ids)<len(ids):
+                    ids = word_ids
+        if ids is None:
+            ids = sorted(year_ids)
+        ids = year_ids.intersection(islice(ids, bisect_left(ids, i)))
+        for j in sorted(ids):
+            text = self.texts[j]
+            if all(author in text for author in cite.authors) and \
+               cite in self.cites(j):
+                return j
+        return i
+    
+    def _name_words(self, names, suffix_eat_cnt):
+        # The words of the paragraphs that can be a citation of one of the
+        #  names, i.e. (a prefix of) the name from one of its capitals, 
+        #  when upto suffix_eat_cnt letters are eaten (two are always kept).
+        #  The words are grouped by what is left of them when eaten.
+        stems = self._stems.get(suffix_eat_cnt)
+        if stems is None:
+            stems = self._stems[suffix_eat_cnt] = {}
+            for word in self._word_ids:
+                if len(word)>=2:
+                    stem = word[:max(2, len(word)-suffix_eat_cnt)]
+                    stems.setdefault(stem, []).append(word)
+        words = set()
+        for name in names:
+            for j, c in enumerate(name):
+                if c.isupper() or c=="?":
+                    for end in xrange(j+2, len(name)+1):
+                        words.update(stems.get(name[j:end], ()))
+        return words
+    
+    def is_cited(self, key, bib, suffix_eat_cnt):
+        """ True if some citation of the manuscript matches the key. Only
+        the paragraphs with the year and with a word that can be a citation
+        of one of the names of the key are looked at, those already read
+        first. """
+        yearmatch = self.parser.yearre.search(key)
+        if not yearmatch:
+            return False
+        year = yearmatch.group(1)[:4]
+        year_ids = self._year_set(year)
+        names = _namewordre.findall(key[:yearmatch.start()])
+        if names:
+            words = self._name_words(names, suffix_eat_cnt)
+            ids = set()
+            for word in words:
+                ids.update(year_ids.intersection(self._word_ids[word]))
+        else:
+            words = None
+            ids = year_ids
+        ids = sorted(ids, key=lambda i: (i not in self._cites, i))
+        for i in ids:
+            for cite in self.cites(i):
+                if cite.year[:4]!=year or words is not None and not any(
+                   word in words for author in cite.authors 
+                   for word in _namewordre.findall(author)):
+                    continue
+                if key in self.match(cite, bib, suffix_eat_cnt)[1]:
+                    return True
+        return False
+
+def _interval_tight(low, high, n, z, margin, population=None):
+    # The interval is tight enough if it would be so with any share inside 
+    #  it. The share of the first draws is not trusted, as stopping when it
+    #  happens to be near 0 or 1 would bias the estimate there.
+    share = min(max(0.5, low), high)
+    variance = share*(1-share)/n
+    if population and population>1:
+        variance *= max(0.0, population-n)/(population-1.0)
+    return z*z*variance<=margin*margin
         
         
 #############################
 # THE NYCCC DEVELOPER "API" #
 #############################
 
-def init_regexps(
-    and_word_list=AND_WORDS,
-    page_word_list=PAGE_NUM_ABBR_WORDS,
-    etal_word_list=ETAL_NOTATIONS ):
-    """ Call this function first to initialize regexps that are used to
-    detect name-year style citations from the text.
+class CitationParser(object):
+    """ Holds the compiled regexps that are used to detect name-year style
+    citations from the text. The parser is not modified after it has been
+    built, so one instance can be shared by threads. Use get_parser to 
+    reuse the already compiled parsers. Only the memo of the parsed
+    candidates (parse_memo, see PARSE_MEMO_SIZE) changes when it is used,
+    and the threads can at worst make it forget some of them.
 
     The regexes are derived from the c++/boost implementation of user Tex
     of the Q/A site stackoverflow. Thanks Tex!
     http://stackoverflow.com/a/10533527/1788710
+    
+    and_word_list
+        the words that separate the author names (in addition to & and ,)
+    page_word_list
+        the words that prefix the page numbers, "" makes the prefix optional
+    etal_word_list
+        the "more authors" designations
+    engine
+        how the regexps are applied to the paragraphs. "scan" only runs
+         the text citation regexp in front of each "(year" and skips 
+         paragraphs without parentheses, "regex" scans the whole
+         paragraph with each of them. Both give the same citations.
+         "anchored" finds the years first and looks for the names at most
+         ANCHORED_WINDOW characters before them, and its names can not end
+         in the middle of a word. This bounds the time per paragraph (e.g.
+         for long runs of capitalized words) and gives the same citations
+         unless the names of a citation are longer than the window.
     """
-    global textcitere
-    global authorre
-    global yearre
-    global likere
-    global citere
-
-    page_abbr = ""
-    if page_word_list:
-        page_abbr = r"(?:"+"|".join([re.escape(pw) for pw in page_word_list])+r")"
-    if "" in page_word_list:
-        page_abbr+="?" # make optional
-    
-    etal_abbr = ""
-    #(?:(?:et al\.)|(?:ym\.))
-    if etal_word_list:
-        etal_abbr = r"(?:"+"|".join([re.escape(pw) for pw in etal_word_list])+r")"
-        
-    # Apostrophes like in "D'Alembert" and hyphens like in "Flycht-Eriksson".
-    # Word txt export seems to produce question marks "?" in some names.
-    author = r"([A-Z\?][a-zA-Z'`\-\?]+)(?:'s)?"
-    # " 1990" or "(1990b)" or "1990."
-    year = r"(?:((?:18|19|20)[0-9][0-9][a-z]?)\.?,? ?)" 
-    # Some authors write citations like "A, B, et al. (1995)".
-    #  The comma before the "et al" pattern is not rare.
-    etal = r"(?:,? +"+etal_abbr+",?)"
-    # Optional page number. Of formats ", 1-3" or ", 1." or ", 112--12"  
-    if page_abbr[0].isalnum():
-        pagen = r"(?: +(?:"+page_abbr+r" *([0-9]+(?:-+?[0-9]+)?[ \.,]*)))?"
-    else:
-        pagen = r"(?: *(?:"+page_abbr+r" *([0-9]+(?:-+?[0-9]+)?[ \.,]*)))?"
-    nameconj = r"(?:"+author + r"(?: +"+" +| +".join(and_word_list)+r" +| +& +|, +)?)+"    
-    #totcit = nameconj+etal+r"?(?: ?[a-z]+ )*"+year+pagen+r"?",
-    # again, comma before the et al. pattern is not rare
-    totcit = nameconj+etal+r"?,? +"+year+"+"+pagen+r"?"
-    # Sounds like a citation but does not have names?
-    likecite = r"\(([^\)]*? +"+year+"+"+pagen+r"?[^\)]*?)\)"
-    # Descartes & Platon et al. write (2003) that ... (max 3 words)
-    textcite = nameconj+etal+r"?(?: ?[a-z]+){0,3} +\("+year+"+"+pagen+r"\)" 
-    
-    textcitere = re.compile(textcite)
-    authorre = re.compile(author)
-    yearre = re.compile(year)
-    likere = re.compile(likecite)
-    
-    citere = re.compile(totcit)
-    
-def get_bib_from_file(filename, verbosity=0):
+    
+    def __init__(self,
+        and_word_list=AND_WORDS,
+        page_word_list=PAGE_NUM_ABBR_WORDS,
+        etal_word_list=ETAL_NOTATIONS,
+        engine=EXTRACTION_ENGINE ):
+        
+        if engine not in EXTRACTION_ENGINES:
+            raise ValueError("Unknown extraction engine '%s'" % engine)
+        self.engine = engine
+        self.config = (tuple(and_word_list), tuple(page_word_list),
+                       tuple(etal_word_list), engine)
+
+        page_abbr = ""
+        if page_word_list:
+            page_abbr = r"(?:"+"|".join([re.escape(pw) for pw in page_word_list])+r")"
+        if "" in page_word_list:
+            page_abbr+="?" # make optional
+        
+        etal_abbr = ""
+        #(?:(?:et al\.)|(?:ym\.))
+        if etal_word_list:
+            etal_abbr = r"(?:"+"|".join([re.escape(pw) for pw in etal_word_list])+r")"
+            
+        # Apostrophes like in "D'Alembert" and hyphens like in "Flycht-Eriksson".
+        # Word txt export seems to produce question marks "?" in some names.
+        author = r"([A-Z\?][a-zA-Z'`\-\?]+)(?:'s)?"
+        # " 1990" or "(1990b)" or "1990."
+        year = r"(?:((?:18|19|20)[0-9][0-9][a-z]?)\.?,? ?)" 
+        # Some authors write citations like "A, B, et al. (1995)".
+        #  The comma before the "et al" pattern is not rare.
+        etal = r"(?:,? +"+etal_abbr+",?)"
+        # Optional page number. Of formats ", 1-3" or ", 1." or ", 112--12"  
+        if page_abbr[0].isalnum():
+            pagen = r"(?: +(?:"+page_abbr+r" *([0-9]+(?:-+?[0-9]+)?[ \.,]*)))?"
+        else:
+            pagen = r"(?: *(?:"+page_abbr+r" *([0-9]+(?:-+?[0-9]+)?[ \.,]*)))?"
+        name = author
+        if engine=="anchored":
+            # Otherwise a failing match tries all the ways to split a long
+            #  capitalized word into names. The greedy match never ends a
+            #  name in the middle of a word anyway.
+            name = r"([A-Z\?][a-zA-Z'`\-\?]+)(?![a-zA-Z'`\-\?])"
+        nameconj = r"(?:"+name + r"(?: +"+" +| +".join(and_word_list)+r" +| +& +|, +)?)+"    
+        #totcit = nameconj+etal+r"?(?: ?[a-z]+ )*"+year+pagen+r"?",
+        # again, comma before the et al. pattern is not rare
+        totcit = nameconj+etal+r"?,? +"+year+"+"+pagen+r"?"
+        # Sounds like a citation but does not have names?
+        likecite = r"\(([^\)]*? +"+year+"+"+pagen+r"?[^\)]*?)\)"
+        # Descartes & Platon et al. write (2003) that ... (max 3 words)
+        textcite = nameconj+etal+r"?(?: ?[a-z]+){0,3} +\("+year+"+"+pagen+r"\)" 
+        
+        self.textcitere = re.compile(textcite)
+        self.authorre = re.compile(author)
+        self.yearre = re.compile(year)
+        self.likere = re.compile(likecite)
+        
+        self.citere = re.compile(totcit)
+        
+        self.parse_memo = _Memo(PARSE_MEMO_SIZE)
+
+# The compiled parsers by their word lists
+_parser_cache = _LRUCache(PARSER_CACHE_SIZE)
+
+def get_parser(
+    and_word_list=AND_WORDS,
+    page_word_list=PAGE_NUM_ABBR_WORDS,
+    etal_word_list=ETAL_NOTATIONS,
+    engine=EXTRACTION_ENGINE ):
+    """ Returns a CitationParser for the word lists (see CitationParser).
+    The parsers are cached process wide, so calling this again with the
+    same lists does not recompile the regexps. This is thread-safe.
+    """
+    key = (tuple(and_word_list), tuple(page_word_list), tuple(etal_word_list),
+           engine)
+    parser = _parser_cache.get(key)
+    if parser is None:
+        parser = _parser_cache.setdefault(key, CitationParser(*key))
+    return parser
+
+def init_regexps(
+    and_word_list=AND_WORDS,
+    page_word_list=PAGE_NUM_ABBR_WORDS,
+    etal_word_list=ETAL_NOTATIONS,
+    engine=EXTRACTION_ENGINE ):
+    """ Sets the parser that is used to detect name-year style citations
+    from the text when no parser is explicitly given to the functions. 
+    Returns the parser. See CitationParser for the arguments.
+    """
+    global _default_parser
+    _default_parser = get_parser(and_word_list, page_word_list, etal_word_list,
+                                 engine)
+    return _default_parser
+    
+class CheckStats(object):
+    """ Counters and wall clock times of the phases of a check, to find out
+    where the time goes. Give one as the stats argument of iter_cites,
+    get_cites_from_file, get_bib_from_file, BibIndex, cross_check or
+    check_many and they record into it. With the default stats=None
+    nothing is recorded.
+    
+    counts
+        a Counter of the events, e.g. "lines read", "likere candidates",
+         "parse failures", "bib comparisons", "fallback searches", 
+         "suffix-eat retries" and "missing"/"ambiguous" citations.
+    seconds
+        the seconds spent in each phase, in the order they were entered.
+         The phase "a/b" is a part of the phase "a", e.g. the time of
+         "find citations/parse" is included in "find citations".
+    """
+    
+    def __init__(self):
+        self.counts = Counter()
+        self.seconds = OrderedDict()
+    
+    def count(self, event, n=1):
+        self.counts[event] += n
+    
+    def add_time(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0)+seconds
+        
+    def timed(self, phase, function, *args, **kwargs):
+        """ Returns function(*args, **kwargs) and adds the time it took to
+        phase """
+        started = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.add_time(phase, time.time()-started)
+    
+    def merge(self, other):
+        """ Adds the counts and times of another CheckStats to these """
+        self.counts.update(other.counts)
+        for phase, seconds in other.seconds.iteritems():
+            self.add_time(phase, seconds)
+    
+    def as_dict(self):
+        return {"seconds":OrderedDict(self.seconds),
+                "counts":OrderedDict(sorted(self.counts.items()))}
+    
+    def report(self, out=None):
+        """ Writes the phase times and the counters as a table to out
+        (sys.stdout by default) """
+        out = out if out is not None else sys.stdout
+        lines = ["%-34s %8s" % ("Phase", "Seconds")]
+        # The parts of a phase are listed (indented) after it, in the order
+        #  they were entered. A phase that has only its parts timed is
+        #  listed without the seconds.
+        entered = {}
+        for i, phase in enumerate(self.seconds):
+            name = phase.split("/")
+            for depth in range(1, len(name)+1):
+                entered.setdefault("/".join(name[:depth]), i)
+        def position(phase):
+            name = phase.split("/")
+            return [entered["/".join(name[:depth])] 
+                    for depth in range(1, len(name)+1)]
+        for phase in sorted(entered, key=position):
+            name = phase.split("/")
+            seconds = self.seconds.get(phase)
+            lines.append("%-34s %8s" % ("  "*(len(name)-1)+name[-1],
+                "%.3f" % seconds if seconds is not None else ""))
+        lines.append("")
+        lines.append("%-34s %8s" % ("Counter", "Count"))
+        for event, n in sorted(self.counts.items()):
+            lines.append("%-34s %8d" % (event, n))
+        out.write("\n".join(lines)+"\n")
+
+# A problem found by a check. The kinds and what the references are:
+#  "duplicate"          [the reference, the earlier one with the same key]
+#  "missing-year"       [the reference]
+#  "missing-reference"  the similar references (if suggestions were asked)
+#  "ambiguous"          the alternative references
+#  "uncited"            [the reference]
+#  "near-duplicate"     the references that seem to be the same
+#  The cite is the Citation or None.
+Problem = namedtuple("Problem", ["kind", "cite", "references"])
+
+class CheckResult(object):
+    """ What cross_check found for a manuscript.
+    
+    problems
+        a list of Problems, first the "missing-reference" and "ambiguous"
+         citations in the order they were checked and then the "uncited"
+         references in the bibliography order. The problems of the
+         bibliography itself are in BibIndex.problems.
+    num_cites, num_unique_cites, num_refs
+        the number of citations (with and without repeats) and references.
+    suffix_eat_cnt
+        the -e used in the check, for showing the eaten citations
+    suggestions_stopped
+        True if the search for the suggestions of some citation was cut
+         short at SUGGESTION_MAX_EVALUATIONS, so they may be incomplete.
+    textfile
+        the checked file (if known), and in the results of check_many
+         also the stats (a CheckStats or None) and log (what was printed
+         while reading the file, with a higher verbosity).
+    occurrences
+        the OccurrenceIndex of the citations (if known), so that the
+         reports can tell where the problematic citations are.
+    ref_counts
+        a Counter of how many of the (unique) citations matched each
+         reference key, e.g. for collecting the usage of the references
+         over an archive (see nyccc_analysis.py).
+    
+    For compatibility with the older versions that returned only the 
+    counts, iterating the result gives missing_ref_cnt, missing_cite_cnt.
+    """
+    
+    def __init__(self, num_refs=0, suffix_eat_cnt=0, textfile=None):
+        self.textfile = textfile
+        self.problems = []
+        self.num_cites = 0
+        self.num_unique_cites = 0
+        self.num_refs = num_refs
+        self.suffix_eat_cnt = suffix_eat_cnt
+        self.suggestions_stopped = False
+        self.stats = None
+        self.log = ""
+        self.occurrences = None
+        self.ref_counts = Counter()
+    
+    def of_kind(self, kind):
+        return [problem for problem in self.problems if problem.kind==kind]
+    
+    @property
+    def missing_ref_cnt(self):
+        return len(self.of_kind("missing-reference"))
+    
+    @property
+    def missing_cite_cnt(self):
+        return len(self.of_kind("uncited"))
+    
+    def __iter__(self):
+        return iter((self.missing_ref_cnt, self.missing_cite_cnt))
+
+class ExtractionCache(object):
+    """ An on-disk cache for the citations extracted from the paragraphs
+    and for the bibliography keys. The paragraphs are keyed by the hash of
+    their normalized text, and their citations are stored separately for
+    each parser configuration and list of multiple citation separators, so
+    changing those options never serves stale results. Bibliographies are
+    keyed by the hash of the file contents. New citations are written to 
+    the disk by calling save().
+    
+    The citations are kept in CACHE_SHARDS files by the hash of the 
+    paragraph, and a file is loaded only when a paragraph of it is looked
+    up. save() merges the new citations to the files under a lock (where
+    the platform has file locks), so the processes that share the cache 
+    keep the entries of each other, and writes them through a temporary
+    file. At most CACHE_MAX_PARAGRAPHS paragraphs are kept, and the keys of
+    CACHE_MAX_BIBLIOGRAPHIES bibliographies, the least recently used are
+    dropped. The caches of the other parser configurations are not.
+    
+    directory
+        where the cache files are kept (created if missing)
+    parser
+        the CitationParser the citations are extracted with
+    mutlicite_sep
+        the multiple citation separators the citations are extracted with
+    """
+    
+    def __init__(self, directory, parser=None,
+                 mutlicite_sep=MULTICITE_DELIMETER):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.parser = _use_parser(parser)
+        
+        config = repr((CACHE_FORMAT, self.parser.config, tuple(mutlicite_sep)))
+        self._cites_dir = os.path.join(directory, 
+            "cites-%s" % hashlib.sha1(config).hexdigest())
+        if not os.path.isdir(self._cites_dir):
+            try:
+                os.makedirs(self._cites_dir)
+            except OSError:
+                # Made by another process meanwhile
+                if not os.path.isdir(self._cites_dir):
+                    raise
+        # The single cites file of the older versions would never be dropped
+        for name in os.listdir(directory):
+            if name.startswith("cites-") and name.endswith(".pickle"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        # The loaded shards, and the new and the used paragraphs of each
+        self._shards = {}
+        self._new_cites = {}
+        self._used = {}
+        
+    def _shard_file(self, shard):
+        return os.path.join(self._cites_dir, "%02x.pickle" % shard)
+    
+    def _load_shard(self, shard):
+        # The paragraphs of the shard from the least recently used
+        cites = _load_pickle(self._shard_file(shard), None)
+        return cites if isinstance(cites, OrderedDict) else OrderedDict()
+    
+    def _shard(self, key):
+        # The shard of the key and its paragraphs, loaded when first needed
+        shard = ord(key[0])%CACHE_SHARDS
+        if shard not in self._shards:
+            self._shards[shard] = self._load_shard(shard)
+        return shard, self._shards[shard]
+    
+    def get_cites(self, paragraph, spans=None):
+        """ Returns the cached citations of the (normalized) paragraph or
+        None if the paragraph is not in the cache. If a list is given as
+        spans, the (start, end) positions of the citations are appended to
+        it (and None is returned if they were not cached).
+        """
+        key = hashlib.sha1(paragraph).digest()
+        shard, shard_cites = self._shard(key)
+        cached = shard_cites.get(key)
+        if cached is None:
+            return None
+        self._used.setdefault(shard, set()).add(key)
+        if spans is not None:
+            if any(start is None for a, y, c, start, end in cached):
+                return None
+            spans.extend((start, end) for a, y, c, start, end in cached)
+        return [Citation(authors, year, complete)
+                for authors, year, complete, start, end in cached]
+    
+    def put_cites(self, paragraph, cites, spans=None):
+        # Plain tuples, so that the pickles do not depend on the module name
+        key = hashlib.sha1(paragraph).digest()
+        shard, shard_cites = self._shard(key)
+        if spans is None:
+            spans = [(None, None)]*len(cites)
+        cached = tuple((tuple(authors), year, complete, start, end)
+            for (authors, year, complete), (start, end) in zip(cites, spans))
+        shard_cites[key] = cached
+        self._new_cites.setdefault(shard, OrderedDict())[key] = cached
+    
+    def _bib_cache_file(self, filename):
+        return os.path.join(self.directory, "bib-%s.pickle" % 
+                            _file_digest(filename, str(CACHE_FORMAT)))
+    
+    def get_bib(self, filename):
+        """ Returns a tuple (bib, keys) for the bibliography file, or None
+        if it is not in the cache. See BibIndex for the keys. 
+        """
+        cache_file = self._bib_cache_file(filename)
+        cached = _load_pickle(cache_file, None)
+        if cached is not None:
+            # The least recently used are dropped, see put_bib
+            try:
+                os.utime(cache_file, None)
+            except OSError:
+                pass
+        return cached
+        
+    def put_bib(self, filename, bib_index):
+        # References without a year get their key (and problem) again 
+        keys = [key if self.parser.yearre.search(key) else None
+                for key in bib_index.keys]
+        _save_pickle(self._bib_cache_file(filename), (bib_index.bib, keys))
+        saved = []
+        for name in os.listdir(self.directory):
+            if name.startswith("bib-") and name.endswith(".pickle"):
+                try:
+                    path = os.path.join(self.directory, name)
+                    saved.append( (os.path.getmtime(path), path) )
+                except OSError:
+                    # Removed by another process meanwhile
+                    pass
+        saved.sort()
+        for mtime, path in saved[:max(0, len(saved)-CACHE_MAX_BIBLIOGRAPHIES)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def save(self):
+        """ Writes the new citations to the disk. The entries that other
+        processes have written meanwhile are kept, and the paragraphs that
+        were new or used become the most recently used.
+        """
+        if not self._new_cites:
+            return
+        max_paragraphs = max(1, CACHE_MAX_PARAGRAPHS//CACHE_SHARDS)
+        with _locked(os.path.join(self._cites_dir, "lock")):
+            for shard, new_cites in self._new_cites.iteritems():
+                cites = self._load_shard(shard)
+                for key in self._used.get(shard, ()):
+                    if key in cites:
+                        cites[key] = cites.pop(key)
+                for key, cached in new_cites.iteritems():
+                    cites.pop(key, None)
+                    cites[key] = cached
+                while len(cites)>max_paragraphs:
+                    cites.popitem(last=False)
+                _save_pickle(self._shard_file(shard), cites)
+                self._shards[shard] = cites
+        self._new_cites = {}
+        self._used = {}
+    
+def get_bib_from_file(filename, verbosity=0, stats=None, bib_format=None):
     """ Read bibliograpy file where each row contains one (1) reference to
     some academic publication. It must be of the name-year format, so
     number.
@@ -315,54 +2078,481 @@ def get_bib_from_file(filename, verbosity=0):
         the file to read
     verbosity
         change the output detail level
+    stats
+        a CheckStats to record the time and the number of references to
+    bib_format
+        the format of the file, see load_bibliography
     """
-    src = codecs.open(filename, 'r',  'utf-8')
+    if _bib_format(filename, bib_format)!="text":
+        return load_bibliography(filename, bib_format, verbosity, stats)[0]
+    if stats:
+        started = time.time()
     bib = []
-    while 1:
-        line = src.readline()
-        if not line:
-            break
-        
+    for line in _read_lines(filename):
         #line = unicode(line)
         #nonunicode_line = _strip_accents(line).strip()
         #nonunicode_line = line.decode('utf8', 'ignore').encode('ascii', 'ignore')
-        nonunicode_line = normalize('NFKD', line.strip()).encode('ascii', 'ignore')
+        nonunicode_line = _to_ascii(line)
         if nonunicode_line != "":
             bib.append(nonunicode_line)
+    if stats:
+        stats.add_time("read bibliography", time.time()-started)
+        stats.count("references read", len(bib))
     return bib
 
+def load_bibliography(filename, bib_format=None, verbosity=0, stats=None,
+                      sidecar=True):
+    """ Reads a bibliography file. Returns a tuple (bib, keys) for BibIndex:
+    the references as strings and their keys, or None as the keys if they
+    are to be derived from the references (see BibIndex).
+    
+    The author surnames and the year of each BibTeX entry, RIS record and
+    CSL-JSON item are read from their fields, so their keys need no
+    guessing. The references are written in the name-year format, e.g.
+    "Rasku, J. & Musliu, N. 2013. Title. Journal.".
+    
+    filename
+        the file to read
+    bib_format
+        one of BIB_FORMATS. By default it is told by the file extension 
+         (see BIB_FORMAT_EXTENSIONS) and the other files are plain text with
+         one reference per line (see get_bib_from_file).
+    verbosity, stats
+        see get_bib_from_file
+    sidecar
+        the references and keys of a BibTeX, RIS or CSL-JSON file are 
+         saved to a file next to it (see BIB_SIDECAR_SUFFIX) and loaded
+         from there as long as the size and modification time, or the 
+         content, of the file are the same. The file is plain JSON, so
+         it can be shared with the others that use the bibliography.
+    """
+    bib_format = _bib_format(filename, bib_format)
+    if bib_format=="text":
+        return get_bib_from_file(filename, verbosity, stats, "text"), None
+    if stats:
+        started = time.time()
+    
+    # The standard input can be read only once
+    sidecar_file = filename+BIB_SIDECAR_SUFFIX \
+                   if sidecar and filename!=STDIN_FILENAME else None
+    bib = keys = digest = None
+    up_to_date = False
+    saved = None
+    if sidecar_file:
+        stat = os.stat(filename)
+        signature = (CACHE_FORMAT, bib_format, stat.st_size)
+        saved = _load_sidecar(sidecar_file, signature)
+    if saved:
+        mtime, saved_digest = saved[:2]
+        up_to_date = mtime==stat.st_mtime
+        if not up_to_date:
+            # e.g. copied or checked out again
+            digest = _file_digest(filename)
+        if up_to_date or digest==saved_digest:
+            bib, keys = saved[2:]
+            if stats:
+                stats.count("bibliography sidecar loads")
+    
+    if bib is None:
+        if bib_format=="csl-json":
+            refs = _csl_json_refs(filename)
+        elif bib_format=="bibtex":
+            refs = _bibtex_refs(_read_lines(filename))
+        else:
+            refs = _ris_refs(_read_lines(filename))
+        bib, keys = [], []
+        for reference, key in refs:
+            bib.append(reference)
+            keys.append(key)
+    if sidecar_file and not up_to_date:
+        try:
+            _save_sidecar(sidecar_file, signature, stat.st_mtime,
+                          digest or _file_digest(filename), bib, keys)
+        except (IOError, OSError):
+            # e.g. a read-only directory, it is parsed again the next time
+            pass
+    
+    if stats:
+        stats.add_time("read bibliography", time.time()-started)
+        stats.count("references read", len(bib))
+    return bib, keys
+
+def _json_str(value):
+    # JSON gives unicode, the references are (ASCII) str when parsed
+    if not isinstance(value, basestring):
+        raise TypeError("not a string: %r" % (value,))
+    try:
+        return value.encode('ascii')
+    except UnicodeError:
+        return value
+
+def _load_sidecar(filename, signature):
+    # The saved (mtime, digest, bib, keys) of a bibliography, or None if the
+    #  sidecar is missing, broken or for another kind of file. It is JSON
+    #  and not a pickle, as anyone who can write next to the bibliography
+    #  could make a pickle that runs code when loaded.
+    try:
+        with open(filename, 'rb') as f:
+            saved = json.load(f)
+        if [saved["format"], saved["bib_format"], saved["size"]]!=\
+                list(signature):
+            return None
+        bib = [_json_str(reference) for reference in saved["references"]]
+        keys = [None if key is None else _json_str(key)
+                for key in saved["keys"]]
+        if len(keys)!=len(bib):
+            return None
+        return saved["mtime"], _json_str(saved["sha1"]), bib, keys
+    except (IOError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def _save_sidecar(filename, signature, mtime, digest, bib, keys):
+    saved = {"format":signature[0], "bib_format":signature[1],
+             "size":signature[2], "mtime":mtime, "sha1":digest,
+             "references":bib, "keys":keys}
+    _save_file(filename, lambda f: json.dump(saved, f), shared=True)
+
+class Citation(namedtuple("Citation", ["authors", "year", "complete"])):
+    """ A citation found from the manuscript. It is an immutable (and
+    hashable) tuple, so that the citations can be deduplicated with a set
+    or a Counter and sorted as such. The author names and the year are
+    interned, as the same few thousand surnames are cited over and over.
+    
+    authors
+        a tuple of the author names, e.g. ("Smith", "Jones")
+    year
+        the year as a string, e.g. "2006" or "2006a"
+    complete
+        False if the author names were taken from the text and might have
+         a suffix (e.g. "Raskun (2013) mukaan"), True otherwise
+    """
+    __slots__ = ()
+    
+    def __new__(cls, authors, year, complete):
+        try:
+            authors, year = tuple(map(intern, authors)), intern(year)
+        except TypeError:
+            # unicode can not be interned
+            authors, year = tuple(map(_intern, authors)), _intern(year)
+        return tuple.__new__(cls, (authors, year, complete))
+
 # Parse textual citation
-def parse_citet(citationstr):
-    year = yearre.findall(citationstr)[0]
+def parse_citet(citationstr, parser=None):
+    parser = _use_parser(parser)
+    
+    year = parser.yearre.findall(citationstr)[0]
     complete = False
-    posfixed_authors = authorre.findall( citationstr )
-    tcite = (posfixed_authors, year, complete)
+    posfixed_authors = parser.authorre.findall( citationstr )
+    tcite = Citation(posfixed_authors, year, complete)
     
     return tcite
 
 
-def parse_citep(citationstr):
-    global citere
-    global authorre
+def parse_citep(citationstr, parser=None):
+    parser = _use_parser(parser)
     
-    cres = citere.search(citationstr)
+    cres = parser.citere.search(citationstr)
 
     if not cres or len(cres.groups())<2: 
         return None
     
-    authors = authorre.findall( cres.group(0) )
+    authors = parser.authorre.findall( cres.group(0) )
     year = cres.group(2)
     complete = True
-    pcite = (authors, year, complete)
+    pcite = Citation(authors, year, complete)
     
     return pcite
         
-def get_cites_from_file(filename, mutlicite_sep, max_cites=None, verbosity=0):
-    """ Read the text file that has name-year style citations. Returns 
-    the detected citations. 
+# A parenthesis that is followed by a year
+_yearparenre = re.compile(r"\((?=(?:18|19|20)[0-9][0-9])")
+# The compiled multiple citation separators
+_multicite_splitters = {}
+
+def _multicite_splitter(mutlicite_sep):
+    key = tuple(mutlicite_sep)
+    if key not in _multicite_splitters:
+        _multicite_splitters[key] = re.compile("|".join(mutlicite_sep))
+    return _multicite_splitters[key]
+
+def _parse_candidate(parse, citationstr, parser, stats):
+    # The same citations are repeated in a manuscript, so the parsed 
+    #  candidates are memoized. A text citation candidate ends in ")" and 
+    #  a parenthetical one has none, so they can share the memo.
+    cite = parser.parse_memo.get(citationstr, _MISSING)
+    if cite is not _MISSING:
+        if stats:
+            stats.count("parse memo hits")
+        return cite
+    if stats:
+        stats.count("parse memo misses")
+        cite = stats.timed("find citations/parse", parse, citationstr, parser)
+    else:
+        cite = parse(citationstr, parser)
+    parser.parse_memo.put(citationstr, cite)
+    return cite
+
+def _add_textcite(tc_candidate, verbosity, parser, paragraph_cites, spans,
+                  stats):
+    tcite_text = tc_candidate.group(0)
+    if verbosity > 2:
+        print "Detected a text citation:" 
+        print tcite_text
     
-    filename
-        the file to read
+    # Parse the text for a citation
+    if stats:
+        stats.count("textcitere candidates")
+    tcite = _parse_candidate(parse_citet, tcite_text, parser, stats)
+    paragraph_cites.append(tcite)
+    if spans is not None:
+        spans.append(tc_candidate.span())
+    
+    if verbosity > 2:
+        print "Extracted citation:" 
+        print tcite
+        print  
+
+def _add_likecites(ny_match, mutlicite_sep, verbosity, parser,
+                   paragraph_cites, spans, stats):
+    if stats:
+        stats.count("likere candidates")
+    ny_candidate = ny_match.groups()
+    # if citation like (2009), then we have used the textcite_candidates
+    if ny_candidate[0] == ny_candidate[1]:
+        return
+    
+    if verbosity > 2:
+        print "Detected something that seems to be a citation:" 
+        print ny_candidate[0]
+        
+    detected_author_count  = 0
+
+    # Citations in parenthesis (as opposed to citations within text)            
+    #  are parsed here
+    cites = []
+    scc_end = 0
+    for scc in _multicite_splitter(mutlicite_sep).split(ny_candidate[0]):
+        citationstr = scc
+        if parser.engine=="anchored":
+            citationstr = _anchored_window(scc)
+        if citationstr is None:
+            pcite = None
+            if stats:
+                stats.count("parse failures")
+        else:
+            pcite = _parse_candidate(parse_citep, citationstr, parser, stats)
+            if stats:
+                stats.count("parse successes" if pcite else "parse failures")
+        if pcite:
+            detected_author_count += len(pcite[0])
+            cites.append(pcite)
+            paragraph_cites.append(pcite)
+        if spans is not None:
+            scc_start = ny_candidate[0].find(scc, scc_end)
+            scc_end = scc_start+len(scc)
+            if pcite:
+                spans.append((
+                    ny_match.start(1)+scc_start+len(scc)-len(scc.lstrip()),
+                    ny_match.start(1)+scc_start+len(scc.rstrip())))
+    
+    # Just some output
+    if (verbosity==2 and detected_author_count!=
+            len(parser.authorre.findall( ny_candidate[0] ))):
+        print "Detected something that seems to be a citation:" 
+        print ny_candidate[0]
+        print "Extracted citations:" 
+        print cites
+        print
+    elif (verbosity>2):
+        print "Extracted citations:" 
+        print cites
+        print
+
+def _regex_paragraph_cites(nonunicode_line, mutlicite_sep, verbosity, parser,
+                           spans, stats):
+    paragraph_cites = []
+    
+    nameyear_candidates = parser.likere.finditer(nonunicode_line)
+    textcite_candidates = parser.textcitere.finditer(nonunicode_line)
+    
+    for tc_candidate in textcite_candidates:
+        _add_textcite(tc_candidate, verbosity, parser, paragraph_cites, spans,
+                      stats)
+    
+    for ny_match in nameyear_candidates:
+        _add_likecites(ny_match, mutlicite_sep, verbosity, parser,
+                       paragraph_cites, spans, stats)
+            
+    return paragraph_cites
+
+def _scan_paragraph_cites(nonunicode_line, mutlicite_sep, verbosity, parser,
+                          spans, stats):
+    paragraph_cites = []
+    if "(" not in nonunicode_line:
+        return paragraph_cites
+    
+    # Text citations "Descartes & Platon et al. write (2003)" end to a 
+    #  year in parenthesis and their names can not contain parentheses. 
+    #  Hence, the regexp is only run from the previous parenthesis upto
+    #  each "(year ...)" instead of over the whole paragraph.
+    last_end = 0
+    for anchor in _yearparenre.finditer(nonunicode_line):
+        open_pos = anchor.start()
+        if open_pos<last_end:
+            continue
+        close_pos = nonunicode_line.find(")", open_pos)
+        if close_pos==-1:
+            break
+        prev_paren = max(nonunicode_line.rfind("(", last_end, open_pos),
+                         nonunicode_line.rfind(")", last_end, open_pos))
+        tc_candidate = parser.textcitere.search(nonunicode_line,
+            max(prev_paren+1, last_end), close_pos+1)
+        if tc_candidate:
+            _add_textcite(tc_candidate, verbosity, parser,
+                          paragraph_cites, spans, stats)
+            last_end = tc_candidate.end()
+    
+    # Citations in parenthesis "(Rasku 2013; Smith 2001, p. 10)"
+    for ny_match in parser.likere.finditer(nonunicode_line):
+        _add_likecites(ny_match, mutlicite_sep, verbosity, parser,
+                       paragraph_cites, spans, stats)
+    
+    return paragraph_cites
+
+# A year, a year after a space like likere wants and a parenthesis from 
+#  a "(" upto the next ")"
+_yearanchorre = re.compile(r"(?:18|19|20)[0-9][0-9]")
+_spaceyearre = re.compile(r" (?:18|19|20)[0-9][0-9]")
+_parengroupre = re.compile(r"\([^)]*\)")
+
+def _anchored_window(citationstr):
+    # The names of a citation in parenthesis are before its year, so citere
+    #  only needs to search from ANCHORED_WINDOW chars before the first 
+    #  year. None if there is no year, as then there is no citation either.
+    year = _yearanchorre.search(citationstr)
+    if not year:
+        return None
+    return citationstr[max(0, year.start()-ANCHORED_WINDOW):]
+
+def _anchored_paragraph_cites(nonunicode_line, mutlicite_sep, verbosity,
+                              parser, spans, stats):
+    paragraph_cites = []
+    if "(" not in nonunicode_line:
+        return paragraph_cites
+    
+    # Text citations, like in _scan_paragraph_cites but the names are looked
+    #  for only ANCHORED_WINDOW chars before the "(year"
+    last_end = 0
+    close_pos = -1
+    for anchor in _yearparenre.finditer(nonunicode_line):
+        open_pos = anchor.start()
+        if open_pos<last_end:
+            continue
+        if close_pos<open_pos:
+            close_pos = nonunicode_line.find(")", open_pos)
+            if close_pos==-1:
+                break
+        window_start = max(last_end, open_pos-ANCHORED_WINDOW)
+        prev_paren = max(nonunicode_line.rfind("(", window_start, open_pos),
+                         nonunicode_line.rfind(")", window_start, open_pos))
+        tc_candidate = parser.textcitere.search(nonunicode_line,
+            max(prev_paren+1, window_start), close_pos+1)
+        if tc_candidate:
+            _add_textcite(tc_candidate, verbosity, parser,
+                          paragraph_cites, spans, stats)
+            last_end = tc_candidate.end()
+    
+    # Citations in parenthesis. These are the matches of likere: from the
+    #  first "(" after the previous ")" upto the next ")" if there is a 
+    #  " year" in between. Searching only upto the last ")" means that no
+    #  "(" is scanned to the end of the paragraph in vain.
+    for paren in _parengroupre.finditer(nonunicode_line, 0,
+                                        nonunicode_line.rfind(")")+1):
+        if _spaceyearre.search(nonunicode_line, paren.start(), paren.end()):
+            ny_match = parser.likere.match(nonunicode_line, paren.start(),
+                                           paren.end())
+            _add_likecites(ny_match, mutlicite_sep, verbosity, parser,
+                           paragraph_cites, spans, stats)
+    
+    return paragraph_cites
+
+def _paragraph_cites(nonunicode_line, mutlicite_sep, verbosity, parser,
+                     spans=None, stats=None):
+    # If a list is given as spans, the (start, end) positions of the 
+    #  citations in the line are appended to it.
+    if parser.engine=="regex":
+        return _regex_paragraph_cites(nonunicode_line, mutlicite_sep,
+                                      verbosity, parser, spans, stats)
+    elif parser.engine=="anchored":
+        return _anchored_paragraph_cites(nonunicode_line, mutlicite_sep,
+                                         verbosity, parser, spans, stats)
+    return _scan_paragraph_cites(nonunicode_line, mutlicite_sep, verbosity,
+                                 parser, spans, stats)
+
+class OccurrenceIndex(object):
+    """ Where in the manuscript each citation was found. An occurrence is
+    (paragraph, offset, length): the index of the paragraph (the line of a
+    text file, from 0) and the position and length of the citation in it,
+    in characters of the original text (not of the normalized ASCII). The
+    occurrences of a citation are kept in a single array of integers
+    instead of objects and no text is kept, so that the index stays small 
+    even for very long manuscripts. It still grows by three integers for
+    each citation in the text, so the memory of a check is not constant in
+    the length of the manuscript. Give one to iter_cites to fill it.
+    """
+    
+    def __init__(self):
+        self._occurrences = {}
+    
+    def add(self, cite, paragraph, offset, length):
+        """ Records an occurrence of a Citation (or a triplet) """
+        cite = _cite_key(cite)
+        occurrences = self._occurrences.get(cite)
+        if occurrences is None:
+            occurrences = self._occurrences[cite] = array(OCCURRENCE_TYPECODE)
+        occurrences.extend((paragraph, offset, length))
+    
+    def count(self, cite):
+        """ Returns how many times the citation occurs """
+        return len(self._occurrences.get(_cite_key(cite), ()))//3
+    
+    def locations(self, cite, limit=None):
+        """ Returns the occurrences of the citation as a list of tuples
+        (paragraph, offset, length) in the order they were found, upto
+        limit of them.
+        """
+        occurrences = self._occurrences.get(_cite_key(cite), ())
+        end = len(occurrences)
+        if limit is not None:
+            end = min(end, 3*limit)
+        return [tuple(occurrences[i:i+3]) for i in xrange(0, end, 3)]
+    
+    def total(self):
+        """ Returns the number of occurrences of all the citations """
+        return sum(len(occurrences) for occurrences in
+                   self._occurrences.itervalues())//3
+    
+    def __contains__(self, cite):
+        return _cite_key(cite) in self._occurrences
+    
+    def __iter__(self):
+        return iter(self._occurrences)
+    
+    def __len__(self):
+        return len(self._occurrences)
+
+def iter_cites(source, mutlicite_sep=MULTICITE_DELIMETER, max_cites=None,
+               verbosity=0, parser=None, cache=None, stats=None,
+               occurrences=None):
+    """ Generator that detects the name-year style citations from the
+    text and yields them one by one as they are found. The text is read
+    lazily and no citation is kept, so this can be used to read
+    arbitrarily large inputs. Note that a check still keeps the unique
+    citations (see iter_unique_cites) and, if given, the occurrences.
+    
+    source
+        an iterable of lines (1 line = 1 paragraph), e.g. an opened file,
+         sys.stdin or a stream of decompressed data. Lines can be unicode
+         or UTF-8 encoded strings.
     mutlicite_sep
         parenthesis can contain be multiple cites if they are separated
          with the chars (or strings) in this list
@@ -370,140 +2560,214 @@ def get_cites_from_file(filename, mutlicite_sep, max_cites=None, verbosity=0):
         specify how many citations are read before stopping.
     verbosity
         change the output detail level
+    parser
+        the CitationParser to use, by default the one set by init_regexps
+    cache
+        an ExtractionCache for the citations of the paragraphs. Note that
+         the paragraphs served from the cache produce no detection output.
+    stats
+        a CheckStats to record the time and the candidates to. The time
+         it takes to consume the yielded citations is not included.
+    occurrences
+        an OccurrenceIndex where the location of each citation is added.
+         The lines of the source are the paragraphs.
     """
+    parser = _use_parser(parser)
     
-    global textcitere
-    global authorre
-    global yearre
-    global likere
-    global citere
-    if not (textcitere and authorre and yearre and likere and citere):
-       init_regexps()
-    
-    src = codecs.open(filename, 'r',  'utf-8')
-    allcites = []
     counter = 0
-    while 1:
-        line = src.readline()
-        if not line or (max_cites and counter>max_cites):
-            break
+    spans = None
+    for paragraph, line in enumerate(source):
+        if max_cites and counter>=max_cites:
+            return
             
         #nonunicode_line = line.decode('utf8', 'ignore').encode('ascii', 'ignore')
         #unicode_line = unicode(line)
         #nonunicode_line = _strip_accents(unicode_line)
-        nonunicode_line = normalize('NFKD', line.strip()).encode('ascii', 'ignore')
+        if stats:
+            started = time.time()
+        nonunicode_line = _to_ascii(line)
         #print nonunicode_line
+        if stats:
+            normalized = time.time()
+            stats.add_time("normalize text", normalized-started)
+            stats.count("lines read")
         
-        nameyear_candidates = likere.findall(nonunicode_line)
-        textcite_candidates = textcitere.finditer(nonunicode_line)
+        # The cache keeps the spans too in case they are needed later
+        if cache or occurrences is not None:
+            spans = []
+        paragraph_cites = cache.get_cites(nonunicode_line, spans) \
+                          if cache else None
+        if paragraph_cites is None:
+            paragraph_cites = _paragraph_cites(nonunicode_line, mutlicite_sep,
+                                               verbosity, parser, spans, stats)
+            if cache:
+                cache.put_cites(nonunicode_line, paragraph_cites, spans)
+        elif stats:
+            stats.count("cached paragraphs")
+        if occurrences is not None and paragraph_cites:
+            for cite, (offset, length) in zip(paragraph_cites,
+                    _original_spans(line, nonunicode_line, spans)):
+                occurrences.add(cite, paragraph, offset, length)
+        if stats:
+            stats.add_time("find citations", time.time()-normalized)
+            stats.count("cites found", len(paragraph_cites))
         
-        for tc_candidate in textcite_candidates:
-            tcite_text = tc_candidate.group(0)
-            if verbosity > 2:
-                print "Detected a text citation:" 
-                print tcite_text
-            
-            # Parse the text for a citation
-            tcite = parse_citet(tcite_text)
-            allcites.append(tcite)
+        for cite in paragraph_cites:
+            yield cite
             counter += 1
-            
-            if verbosity > 2:
-                print "Extracted citation:" 
-                print tcite
-                print  
-        
-        for ny_candidate in nameyear_candidates:
-            # if citation like (2009), then we have used the textcite_candidates
-            if ny_candidate[0] == ny_candidate[1]:
-                continue
-            
-            if verbosity > 2:
-                print "Detected something that seems to be a citation:" 
-                print ny_candidate[0]
-                
-            predetected_author_count = len(authorre.findall( ny_candidate[0] ))
-            detected_author_count  = 0
+            if max_cites and counter>=max_cites:
+                return
 
-            # Citations in parenthesis (as opposed to citations within text)            
-            #  are parsed here
-            cites = []
-            for scc in re.split( "|".join(mutlicite_sep), ny_candidate[0]):
-                pcite = parse_citep(scc)
-                if pcite:
-                    detected_author_count += len(pcite[0])
-                    cites.append(pcite)
-                    allcites.append(pcite)
-                    counter += 1
-            
-            # Just some output
-            if (verbosity==2 and detected_author_count!=predetected_author_count):
-                print "Detected something that seems to be a citation:" 
-                print ny_candidate[0]
-                print "Extracted citations:" 
-                print cites
-                print
-            elif (verbosity>2):
-                print "Extracted citations:" 
-                print cites
-                print
-                
-                
-    return allcites
+def iter_unique_cites(cites, counts=None):
+    """ Generator that passes through each citation of the iterable the
+    first time it is seen and drops the repeats. Only the unique citations
+    and their occurrence counts are kept in memory.
     
-def _get_author_without_suffix(author, suffix_length):
-    suffix_length = min(len(author)/2, suffix_length)
-    return author[:-suffix_length]
+    cites
+        an iterable of Citations or triplets: (author_list, year, complete),
+         e.g. the iter_cites generator. The triplets are passed through as 
+         Citations.
+    counts
+        a Counter that is updated with the number of occurrences of each
+         Citation while the iteration proceeds.
+    """
+    if counts is None:
+        counts = Counter()
+    for cite in cites:
+        cite = _cite_key(cite)
+        counts[cite] += 1
+        if counts[cite]==1:
+            yield cite
+
+def get_cites_from_file(filename, mutlicite_sep, max_cites=None, verbosity=0,
+                        parser=None, stats=None):
+    """ Read the text file that has name-year style citations. Returns 
+    the detected citations. The file can also be a .docx or .odt document,
+    whose paragraphs are read as lines. See iter_cites for the arguments.
+    """
+    return list(iter_cites(_read_manuscript(filename), mutlicite_sep,
+                           max_cites, verbosity, parser, stats=stats))
     
-def cross_check(cites, bib, suffix_eat_cnt=0):
-    """ This function does the actual verification of the citations and 
-    references. 
+class BibIndex(object):
+    """ The bibliography prepared for matching citations. Build it once from
+    the output of get_bib_from_file and pass it to cross_check instead of
+    the plain list to avoid rebuilding it.
+    
+    The references are shortened to keys (the part upto the publication
+    year) and indexed by author name stems and years, so that a lookup only
+    compares the citation against the references that can possibly match.
+    The full references are indexed the same way for the fallback search
+    (when no key matches, e.g. if the cited names are editors).
+    
+    The duplicate references and those without a publication year are
+    listed in problems (see CheckResult) in the bibliography order.
+    
+    The matches of the citations and their full references are memoized
+    (see MATCH_MEMO_SIZE), so a citation that is in many manuscripts is
+    looked up only once. The hits and misses are in match_memo.
     
-    cites
-        is a list of triplets: (author_list, year, complete), where
-        complete states wether the author names are complete (not partial)
-        
     bib 
         is a list of strings. Each string is a reference in some relatively 
         standard name-year bibliography format.
-        
-    eat_suffix_cnt
-        this many characters are removed from the end of authors names for
-         names parsed straight from the text (not in parenthesis). This is
-         needed, e.g., to properly cross check names when finnish possessive
-         suffixes are used.
+    parser
+        the CitationParser used to find the publication years
+    keys
+        the keys of the references if they are already known (e.g. from an
+        ExtractionCache). The keys that are None are derived again.
+    stats
+        a CheckStats to record the time of building the index to
     """
     
-    ## For faster search use the reference only upto the year ##
-    bib_keys = []
-    key_to_bib = {}
-    key_to_non_uniq_bibs = {}
-    for bibref in bib:
-        key = _bib_to_key(bibref)
-        bib_keys.append( key )
-        if key in key_to_bib: 
-            print "Non-unique or duplicate bibliography entry:"
-            print "\t"+bibref
-            print "\t"+key_to_bib[key]
-            
-            if not key in key_to_non_uniq_bibs: 
-                key_to_non_uniq_bibs[key] = [key_to_bib[key]]
-            key_to_non_uniq_bibs[key].append(bibref)
-        else:
-            key_to_bib[key] = bibref
+    def __init__(self, bib, parser=None, keys=None, stats=None):
+        if stats:
+            started = time.time()
+        self.bib = bib
+        self.parser = parser
+        self.keys = []
+        self.key_to_bib = {}
+        self.key_to_non_uniq_bibs = {}
+        self.problems = []
+        for i, bibref in enumerate(bib):
+            key = keys[i] if keys else None
+            if key is None:
+                if stats:
+                    key = stats.timed("index bibliography/keys", _bib_to_key,
+                                      bibref, parser)
+                else:
+                    key = _bib_to_key(bibref, parser)
+                if key is None:
+                    self.problems.append(Problem("missing-year", None,
+                                                 [bibref]))
+                    key = bibref[:-1]
+            self.keys.append( key )
+            if key in self.key_to_bib: 
+                self.problems.append(Problem("duplicate", None,
+                                             [bibref, self.key_to_bib[key]]))
+                
+                if not key in self.key_to_non_uniq_bibs: 
+                    self.key_to_non_uniq_bibs[key] = [self.key_to_bib[key]]
+                self.key_to_non_uniq_bibs[key].append(bibref)
+            else:
+                self.key_to_bib[key] = bibref
+                
+        self._key_index = _SubstringIndex(self.keys)
+        self._full_index = None 
+        self._suggestion_index = None
+        self.match_memo = _Memo(MATCH_MEMO_SIZE)
+        self._full_refs_memo = _Memo(MATCH_MEMO_SIZE)
+        if stats:
+            stats.add_time("index bibliography", time.time()-started)
+        
+    def find(self, authors, year, full_search=True, stats=None):
+        """ Returns a tuple (cite_matched, matched_refs), where matched_refs
+        are the keys of the references that have the authors (in the right
+        order) and the year. As a backup, if full_search is set and there
+        are no such keys, the authors and year are searched for from the
+        full references in any order. The comparisons and full searches
+        are counted to stats (a CheckStats) if given.
+        """
+        ids = self._key_index.candidates(authors, year)
+        matched_refs = self._key_matches(ids, authors, year)
+        if stats:
+            stats.count("bib comparisons", len(ids))
+        
+        # As a backup, do a full search (for example if names are editors)
+        if full_search and not matched_refs:
+            if stats:
+                started = time.time()
+            ids = self._full_candidates(authors, year)
+            matched_refs = self._full_matches(ids, authors, year)
+            if stats:
+                stats.add_time("match citations/fallback search",
+                               time.time()-started)
+                stats.count("fallback searches")
+                stats.count("bib comparisons", len(ids))
+                
+        return len(matched_refs)>0, matched_refs
     
-    ## Validate citations and bibliography ##
-    #  and calcluate some statistics while you are at it!
-    refcnt = Counter()
-    missing_ref_cnt = 0
-    missing_cite_cnt = 0
+    def match(self, cite, suffix_eat_cnt=0, stats=None):
+        """ Finds the references for a Citation (or a triplet (author_list,
+        year, complete)). For incomplete citations (i.e. those from the text) upto
+        suffix_eat_cnt characters are removed from the end of the author
+        names if there is no match otherwise. Returns a tuple like find.
+        """
+        key = (_cite_key(cite), suffix_eat_cnt)
+        matched = self.match_memo.get(key)
+        if matched is None:
+            if stats:
+                stats.count("match memo misses")
+            matched = self._match(cite, suffix_eat_cnt, stats)
+            matched = (matched[0], tuple(matched[1]))
+            self.match_memo.put(key, matched)
+        elif stats:
+            stats.count("match memo hits")
+        return matched[0], list(matched[1])
     
-    print
-    for cite in cites:
+    def _match(self, cite, suffix_eat_cnt, stats):
         authors, year, complete = cite
     
         # Check if authors with the correct year is in bibliography (in right oder)
-        cite_has_target, refs = _find_cite_in_bib(authors, year, bib_keys, bib)
+        cite_has_target, refs = self.find(authors, year, stats=stats)
         
         # For incomplete (text based) references, allow some characters to 
         #  be eaten from the end of the author names
@@ -511,48 +2775,869 @@ def cross_check(cites, bib, suffix_eat_cnt=0):
         #   "Raskun (2019) mukaan", i.e., According to Rasku (2019)
         #  Note, however that half of the letters are still always used.
         #  (this is a special case for very short names).
-        if not cite_has_target and not complete:
+        if not cite_has_target and not complete and suffix_eat_cnt>0:
+            eaten_author_lists = []
             for eat in range(1, suffix_eat_cnt+1):
                 authors_wo_suffix = [_get_author_without_suffix(author,eat)
                                      for author in authors]
-                # Find the citations in the bibliography
-                cite_has_target, refs = _find_cite_in_bib(authors_wo_suffix, year, bib_keys, bib)
-                if cite_has_target:
+                # Short names stop shrinking, no need to try them again
+                if not eaten_author_lists or \
+                   eaten_author_lists[-1]!=authors_wo_suffix:
+                    eaten_author_lists.append(authors_wo_suffix)
+            
+            # The most eaten names are prefixes of all the less eaten ones,
+            #  so their candidates are looked up only once and each eat
+            #  level is checked against them (least eaten first).
+            shortest_authors = eaten_author_lists[-1]
+            key_ids = self._key_index.candidates(shortest_authors, year)
+            full_ids = None
+            for authors_wo_suffix in eaten_author_lists:
+                refs = self._key_matches(key_ids, authors_wo_suffix, year)
+                if stats:
+                    stats.count("suffix-eat retries")
+                    stats.count("bib comparisons", len(key_ids))
+                if not refs:
+                    if stats:
+                        started = time.time()
+                    if full_ids is None:
+                        full_ids = self._full_candidates(shortest_authors, year)
+                    refs = self._full_matches(full_ids, authors_wo_suffix, year)
+                    if stats:
+                        stats.add_time("match citations/fallback search",
+                                       time.time()-started)
+                        stats.count("fallback searches")
+                        stats.count("bib comparisons", len(full_ids))
+                if refs:
+                    return True, refs
+        
+        return cite_has_target, refs
+    
+    def _key_matches(self, ids, authors, year):
+        return [self.keys[i] for i in ids 
+                if _ordered_match(self.keys[i], authors, year)]
+    
+    def _full_matches(self, ids, authors, year):
+        return [self.keys[i] for i in ids 
+                if _unordered_match(self.bib[i], authors, year)]
+    
+    def _full_candidates(self, authors, year):
+        self.build_full_index()
+        return self._full_index.candidates(authors, year)
+    
+    def full_refs(self, refs):
+        """ Returns the full references of the matched keys (all of them
+        for non-unique keys), without repeats.
+        """
+        key = tuple(refs)
+        fullrefs = self._full_refs_memo.get(key)
+        if fullrefs is None:
+            fullrefs = tuple(self._full_refs(refs))
+            self._full_refs_memo.put(key, fullrefs)
+        return list(fullrefs)
+    
+    def _full_refs(self, refs):
+        fullrefs = []
+        for ref in refs:
+            #print("DEBUG", cite, ref)
+            available_refs = self.key_to_non_uniq_bibs[ref] if ref in self.key_to_non_uniq_bibs else [self.key_to_bib[ref]]
+            for fullref in available_refs:
+                already_added = fullref in fullrefs 
+                # TODO: whait if it is et.al. cite?    
+                if not already_added: 
+                    fullrefs.append(fullref) 
+        return fullrefs
+    
+    def near_duplicates(self, threshold=NEAR_DUPLICATE_THRESHOLD,
+                        bands=MINHASH_BANDS, rows=MINHASH_ROWS, stats=None):
+        """ Returns the groups of references that are likely duplicates of
+        each other as "near-duplicate" Problems, although their keys differ
+        (e.g. different initials, "&" vs "and", missing punctuation or
+        typos). Two references are near-duplicates if at least threshold
+        of their words (of the words in either of them) are the same. The
+        groups are in the bibliography order. See _near_duplicate_clusters
+        for the bands and rows.
+        """
+        if stats:
+            started = time.time()
+        and_words = [word.lower() for word in
+                     _use_parser(self.parser).config[0]]
+        word_sets = [_near_duplicate_words(bibref, and_words)
+                     for bibref in self.bib]
+        problems = []
+        for cluster in _near_duplicate_clusters(word_sets, threshold, bands,
+                                                rows, stats=stats):
+            # The references with the same key are already duplicates
+            if len(set(self.keys[i] for i in cluster))>1:
+                problems.append(Problem("near-duplicate", None,
+                                        [self.bib[i] for i in cluster]))
+        if stats:
+            stats.add_time("near duplicates", time.time()-started)
+            stats.count("near-duplicate groups", len(problems))
+        return problems
+    
+    def build_full_index(self):
+        """ The index of the full references is built on the first fallback
+        search. Call this to build it beforehand, e.g. before forking.
+        """
+        if self._full_index is None:
+            self._full_index = _SubstringIndex(self.bib)
+    
+    def suggest(self, cite, max_suggestions=3,
+                max_distance=SUGGESTION_MAX_DISTANCE,
+                max_evaluations=SUGGESTION_MAX_EVALUATIONS, cut=None):
+        """ Returns upto max_suggestions references that are the closest to
+        the Citation (or (author_list, year, complete) triplet) as a list of
+        tuples (distance, reference), closest first. The distance is the sum of
+        the edit distances of the cited authors to the closest author names
+        of the reference and of the cited year to the publication year
+        (so 2008 vs 2009 and 1993 vs 1993a both count as one), and it may
+        be at most max_distance. The names are compared case insensitively.
+        
+        At most max_evaluations names are compared, in the same order every
+        time, so the suggestions do not depend on the machine or its load.
+        If a list is given as cut, True is appended to it if the search was
+        cut short.
+        """
+        authors, year, complete = cite
+        if not authors:
+            return []
+        self.build_suggestion_index(max_distance)
+        
+        authors = [author.lower() for author in authors]
+        first_author = authors[0]
+        evaluations = 0
+        # Only the references with a name similar to the first author can
+        #  be within the distance. The year is compared first (the years
+        #  are few, so their distances are remembered), and the name
+        #  needs to be only as close as the closest year leaves room for.
+        #  E.g. 2008 vs 2013 is already two edits, so a name of only such
+        #  references must be the same as the cited one.
+        candidates = {}
+        for name in self._suggestion_index.candidates(first_author):
+            year_distances = []
+            for i in self._name_to_ids[name]:
+                if self._ref_years[i] is not None:
+                    year_distances.append( (self._year_distance(year,
+                        self._ref_years[i], max_distance), i) )
+            if not year_distances:
+                continue
+            name_budget = max_distance-min(year_distances)[0]
+            if name_budget<0 or abs(len(name)-len(first_author))>name_budget:
+                continue
+            if evaluations>=max_evaluations:
+                if cut is not None:
+                    cut.append(True)
+                break
+            evaluations += 1
+            name_distance = _edit_distance(first_author, name, name_budget)
+            for year_distance, i in year_distances:
+                distance = name_distance+year_distance
+                if distance<=max_distance and \
+                   distance<candidates.get(i, max_distance+1):
+                    candidates[i] = distance
+        
+        suggestions = []
+        for i in sorted(candidates):
+            distance = candidates[i]
+            ref_names = self._ref_names[i]
+            for author in authors[1:]:
+                if distance>max_distance:
                     break
-                
-        if cite_has_target:
-            if len(refs)>1:
-                print "Citation (%s) might not be unique, alternatives..." % _cite_to_str(cite, suffix_eat_cnt)                
-                fullrefs = []
-                for ref in refs:
-                    #print("DEBUG", cite, ref)
-                    available_refs = key_to_non_uniq_bibs[ref] if ref in key_to_non_uniq_bibs else [key_to_bib[ref]]
-                    for fullref in available_refs:
-                        already_added = fullref in fullrefs 
-                        single_author_is_first = False
-                        # TODO: whait if it is et.al. cite?    
-                        if not already_added: 
-                            fullrefs.append(fullref) 
-                    
-                for fullref in fullrefs: 
-                    #print fullref 
-                    print "\t%s...'" % (fullref[:min(len(fullref), 60)])  
-            for ref in refs:
-                refcnt[ref] += 1
+                distance += min(_edit_distance(author, name,
+                                               max_distance-distance)
+                                for name in ref_names)
+            if distance<=max_distance:
+                suggestions.append( (distance, i) )
+        suggestions.sort()
+        return [(ref_distance, self.bib[i])
+                for ref_distance, i in suggestions[:max_suggestions]]
+    
+    def _year_distance(self, year, ref_year, max_distance):
+        key = (year, ref_year, max_distance)
+        distance = self._year_distances.get(key)
+        if distance is None:
+            distance = self._year_distances[key] = _edit_distance(year,
+                ref_year, max_distance)
+        return distance
+    
+    def build_suggestion_index(self, max_distance=SUGGESTION_MAX_DISTANCE):
+        """ The index of the author names for suggest is built on the first
+        suggestion (or again if max_distance changes). Call this to build it
+        beforehand, e.g. before forking.
+        """
+        if self._suggestion_index is not None and \
+           self._suggestion_index.max_distance==max_distance:
+            return
+        parser = _use_parser(self.parser)
+        self._ref_names = []
+        self._ref_years = []
+        self._year_distances = {}
+        self._name_to_ids = {}
+        for i, key in enumerate(self.keys):
+            names = [name.lower() for name in parser.authorre.findall(key)]
+            yearmatch = parser.yearre.search(key)
+            self._ref_names.append(names)
+            self._ref_years.append(yearmatch.group(1) if yearmatch else None)
+            for name in names:
+                self._name_to_ids.setdefault(name, set()).add(i)
+        self._suggestion_index = _SimilarWordIndex(self._name_to_ids,
+                                                   max_distance)
+
+def cross_check(cites, bib, suffix_eat_cnt=0, parser=None,
+                suggestions=SUGGESTIONS, stats=None, jobs=1):
+    """ This function does the actual verification of the citations and 
+    references. Returns a CheckResult with the citations that have no
+    reference or many, and the references that are not cited. Use one of
+    the REPORT_WRITERS to output it.
+    
+    cites
+        is an iterable of Citations (or triplets: (author_list, year,
+        complete)), where complete states wether the author names are
+        complete (not partial).
+        The citations are checked as they are iterated, so a generator
+        such as iter_unique_cites(iter_cites(...)) can be given directly.
+        
+    bib 
+        is a BibIndex, or a list of strings. Each string is a reference in
+        some relatively standard name-year bibliography format.
+        
+    eat_suffix_cnt
+        this many characters are removed from the end of authors names for
+         names parsed straight from the text (not in parenthesis). This is
+         needed, e.g., to properly cross check names when finnish possessive
+         suffixes are used.
+        
+    parser
+        the CitationParser used to build the BibIndex (if not given one)
+        
+    suggestions
+        for the citations without a reference, list upto this many similar
+         references (see BibIndex.suggest).
+        
+    stats
+        a CheckStats to record the matching times and results to
+        
+    jobs
+        the number of worker processes to match the citations in (None 
+         uses all the CPUs). The workers share the bibliography index and
+         the results are the same and in the same order as with 1. Only
+         used if there are at least PARALLEL_MATCH_MIN_CITES citations, and
+         then they are all read before matching.
+    """
+    
+    ## For faster search use the reference only upto the year ##
+    if not isinstance(bib, BibIndex):
+        bib = BibIndex(bib, parser, stats=stats)
+    if suggestions:
+        if stats:
+            stats.timed("suggest", bib.build_suggestion_index)
         else:
-            print "No reference for citation %s" % _cite_to_str(cite, suffix_eat_cnt)
-            missing_ref_cnt += 1
-    print 
+            bib.build_suggestion_index()
+    
+    ## Validate citations and bibliography ##
+    #  and calcluate some statistics while you are at it!
+    result = CheckResult(len(bib.bib), suffix_eat_cnt)
+    if jobs!=1:
+        cites = list(cites)
+    if jobs==1 or len(cites)<PARALLEL_MATCH_MIN_CITES:
+        (result.problems, refcnt, result.num_unique_cites,
+         result.suggestions_stopped) = _match_cites(cites, bib,
+            suffix_eat_cnt, suggestions, stats)
+    else:
+        # The workers are forked with the indices already built. Each gets
+        #  a consecutive chunk of the citations and the chunks are put 
+        #  back together in order.
+        bib.build_full_index()
+        jobs = jobs or multiprocessing.cpu_count()
+        chunk_size = -(-len(cites)//(jobs*PARALLEL_MATCH_CHUNKS_PER_JOB))
+        chunks = [cites[i:i+chunk_size]
+                  for i in range(0, len(cites), chunk_size)]
+        pool = multiprocessing.Pool(jobs, _init_match_worker,
+            (bib, suffix_eat_cnt, suggestions, stats is not None))
+        try:
+            chunk_results = pool.map(_match_chunk, chunks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        refcnt = Counter()
+        for (problems, chunk_refcnt, num_cites, suggestions_stopped,
+             chunk_stats) in chunk_results:
+            result.problems.extend(problems)
+            refcnt.update(chunk_refcnt)
+            result.num_unique_cites += num_cites
+            result.suggestions_stopped |= suggestions_stopped
+            if stats:
+                stats.merge(chunk_stats)
+    result.ref_counts = refcnt
     
-    for key in bib_keys:
+    for key in bib.keys:
         if refcnt[key] == 0:
-            fullref = key_to_bib[key] 
-            shortref = fullref[:min(len(fullref), 50)]
-            print "Reference '%s...' is not cited" % shortref
-            missing_cite_cnt += 1
-    print 
+            result.problems.append(Problem("uncited", None,
+                                           [bib.key_to_bib[key]]))
+    result.num_cites = result.num_unique_cites
+    if stats:
+        stats.count("uncited references", result.missing_cite_cnt)
+    
+    return result
+
+def check_many(textfiles, bib, mutlicite_sep=MULTICITE_DELIMETER,
+               suffix_eat_cnt=0, jobs=None, verbosity=0, parser=None,
+               cache=None, suggestions=SUGGESTIONS, stats=None):
+    """ Cross checks many manuscripts against the same bibliography. The
+    bibliography is indexed only once and the documents are checked in
+    parallel by a pool of worker processes that share the index. Returns
+    a tuple (results, summary), where results has a CheckResult for each
+    of the documents (in the given order) and summary a dict with the 
+    totals.
+    
+    textfiles
+        a list of the manuscript files to check.
+    bib 
+        is a BibIndex, or a list of strings (see cross_check).
+    mutlicite_sep, suffix_eat_cnt, verbosity, parser, cache, suggestions
+        see iter_cites and cross_check. The cache is saved after each
+         document.
+    jobs
+        the number of worker processes. None uses all the CPUs and with 1
+         the documents are checked one by one in this process.
+    stats
+        a CheckStats where the stats of all the documents are added. The
+         stats of each document are also in its result. The times are the
+         sums over the worker processes.
+    """
+    parser = _use_parser(parser)
+    if not isinstance(bib, BibIndex):
+        bib = BibIndex(bib, parser)
+    bib.build_full_index()
+    if suggestions:
+        bib.build_suggestion_index()
+    
+    initargs = (parser, bib, mutlicite_sep, suffix_eat_cnt, verbosity, cache,
+                suggestions, stats is not None)
+    if jobs==1 or len(textfiles)<2:
+        _init_batch_worker(*initargs)
+        results = map(_check_document, textfiles)
+    else:
+        pool = multiprocessing.Pool(jobs, _init_batch_worker, initargs)
+        try:
+            results = pool.map(_check_document, textfiles, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    
+    summary = {"num_documents":len(results),
+               "num_refs":len(bib.bib)}
+    for field in ("num_cites", "num_unique_cites",
+                  "missing_ref_cnt", "missing_cite_cnt"):
+        summary[field] = sum(getattr(result, field) for result in results)
+    if stats:
+        for result in results:
+            stats.merge(result.stats)
+    return results, summary
+
+# An estimated share (see estimate_check): the share in the sample and its
+#  confidence interval, the sample size and whether it is exact (i.e. all
+#  of them were checked and low==rate==high).
+Estimate = namedtuple("Estimate", ["rate", "low", "high", "sample_size",
+                                   "exact"])
+
+class CheckEstimate(object):
+    """ What estimate_check found for a manuscript.
+    
+    missing_ref
+        the Estimate of the share of the (unique) citations that have no 
+         reference, the missing_ref_cnt/num_unique_cites of a CheckResult.
+    missing_cite
+        the Estimate of the share of the references that are not cited, 
+         the missing_cite_cnt/num_refs of a CheckResult.
+    num_paragraphs, paragraphs_read
+        the number of paragraphs and how many of them were checked
+    num_refs, confidence
+        the number of references and the confidence of the intervals
+    textfile, stats
+        the checked file and its CheckStats (in the results of 
+         estimate_many)
+    """
+    
+    def __init__(self, num_paragraphs=0, num_refs=0, 
+                 confidence=ESTIMATE_CONFIDENCE, textfile=None):
+        self.textfile = textfile
+        self.num_paragraphs = num_paragraphs
+        self.paragraphs_read = 0
+        self.num_refs = num_refs
+        self.confidence = confidence
+        self.missing_ref = None
+        self.missing_cite = None
+        self.stats = None
+
+def estimate_check(source, bib, mutlicite_sep=MULTICITE_DELIMETER,
+                   suffix_eat_cnt=0, parser=None,
+                   confidence=ESTIMATE_CONFIDENCE, margin=ESTIMATE_MARGIN,
+                   seed=ESTIMATE_SEED, stats=None):
+    """ Estimates the shares of the citations without a reference and of
+    the references that are not cited (see the summary of cross_check) 
+    from a random sample of the manuscript, without checking all of it.
+    Returns a CheckEstimate.
+    
+    The paragraphs are drawn in a random order, and with each the 
+    citations that are not in the paragraphs before it, so that all the 
+    citations are as likely to be drawn however often they are cited. This
+    is until the confidence interval of the share of the drawn citations
+    without a reference is at most +-margin. The citations of a paragraph
+    are not independent draws (e.g. a paragraph on a topic that the 
+    bibliography misses has many of them), so the interval is that of as
+    many fewer draws as the variation between the paragraphs tells (the
+    design effect). Only the drawn paragraphs and those that have the
+    names and the year of a drawn citation (or reference) are read, but
+    to find them the whole manuscript is normalized and indexed by its
+    capitalized words first. The references are drawn in a
+    random order too, and each is looked for from the paragraphs that have
+    its year and (a prefix of) one of its names, until the interval of the
+    uncited share is at most +-margin. If ESTIMATE_MAX_SHARE of the 
+    paragraphs has been read before that, all of them are checked instead
+    and the shares are exact, and the same when all the references are
+    drawn. The references that are only matched by the names outside of
+    their key (e.g. editors) or by a one letter name are not found this 
+    way, they count as not cited.
+    
+    source
+        an iterable of the paragraphs (see iter_cites)
+    bib 
+        is a BibIndex, or a list of strings (see cross_check).
+    mutlicite_sep, suffix_eat_cnt, parser
+        see iter_cites and cross_check
+    confidence, margin
+        the confidence level of the intervals and their half width 
+    seed
+        the seed of the random sampling
+    stats
+        a CheckStats to record the time and the sample sizes to
+    """
+    if stats:
+        started = time.time()
+    parser = _use_parser(parser)
+    if not isinstance(bib, BibIndex):
+        bib = BibIndex(bib, parser)
+    sample_stats = CheckStats() if stats else None
+    sample = _ManuscriptSample(list(source), mutlicite_sep, parser,
+                               sample_stats)
+    num_paragraphs = len(sample.texts)
+    estimate = CheckEstimate(num_paragraphs, len(bib.keys), confidence)
+    rnd = random.Random(seed)
+    z = _normal_quantile(0.5+confidence/2)
+    
+    ## The citations without a reference ##
+    order = range(num_paragraphs)
+    rnd.shuffle(order)
+    drawn = missing = 0
+    sums = [0, 0, 0, 0]
+    read = 0
+    budget = ESTIMATE_MAX_SHARE*num_paragraphs
+    exact = True
+    while read<num_paragraphs and sample.num_read()<budget:
+        for i in order[read:read+ESTIMATE_ROUND]:
+            paragraph_drawn = paragraph_missing = 0
+            for cite in sample.cites(i):
+                # Each citation is drawn with its first paragraph
+                if not sample.cited_before(cite, i):
+                    paragraph_drawn += 1
+                    if not sample.match(cite, bib, suffix_eat_cnt)[0]:
+                        paragraph_missing += 1
+            drawn += paragraph_drawn
+            missing += paragraph_missing
+            sums[0] += paragraph_drawn
+            sums[1] += paragraph_missing*paragraph_missing
+            sums[2] += paragraph_missing*paragraph_drawn
+            sums[3] += paragraph_drawn*paragraph_drawn
+        read = min(read+ESTIMATE_ROUND, num_paragraphs)
+        # The citations of a paragraph are not independent draws, so the
+        #  interval is that of fewer draws (by the design effect)
+        rate = float(missing)/drawn if drawn else 0.0
+        effect = _design_effect(read, sums, rate)
+        rate, low, high = _wilson_interval(missing/effect, drawn/effect, z)
+        if drawn and _interval_tight(low, high, drawn/effect, z, margin):
+            exact = False
+            estimate.missing_ref = Estimate(rate, low, high, drawn, False)
+            break
+    
+    ## The references that are not cited ##
+    if not exact:
+        order = range(len(bib.keys))
+        rnd.shuffle(order)
+        uncited = sampled = 0
+        rate = low = high = 0.0
+        for sampled, i in enumerate(order, 1):
+            if sample.num_read()>=budget:
+                exact = True
+                break
+            if not sample.is_cited(bib.keys[i], bib, suffix_eat_cnt):
+                uncited += 1
+            if sampled%ESTIMATE_ROUND==0 or sampled==len(order):
+                rate, low, high = _wilson_interval(uncited, sampled, z,
+                                                   len(order))
+                if _interval_tight(low, high, sampled, z, margin, 
+                                   len(order)):
+                    break
+        estimate.missing_cite = Estimate(rate, low, high, sampled,
+                                         sampled==len(order))
+    
+    # Too much of the manuscript had to be read, check all of it
+    if exact:
+        cites = set()
+        for i in xrange(num_paragraphs):
+            cites.update(sample.cites(i))
+        matches = [sample.match(cite, bib, suffix_eat_cnt) for cite in cites]
+        missing = sum(1 for has_target, refs in matches if not has_target)
+        rate = float(missing)/len(cites) if cites else 0.0
+        estimate.missing_ref = Estimate(rate, rate, rate, len(cites), True)
+        
+        cited = set()
+        for has_target, refs in matches:
+            cited.update(refs)
+        uncited = sum(1 for key in bib.keys if key not in cited)
+        rate = float(uncited)/len(bib.keys) if bib.keys else 0.0
+        estimate.missing_cite = Estimate(rate, rate, rate, len(bib.keys), True)
+    
+    estimate.paragraphs_read = sample.num_read()
+    if stats:
+        stats.add_time("estimate", time.time()-started)
+        # The phases of the sample are parts of the estimate
+        for phase, seconds in sample_stats.seconds.iteritems():
+            stats.add_time("estimate/"+phase, seconds)
+        stats.counts.update(sample_stats.counts)
+        stats.count("estimate paragraphs read", estimate.paragraphs_read)
+        stats.count("estimate citations drawn", 
+                    estimate.missing_ref.sample_size)
+        stats.count("estimate references drawn", 
+                    estimate.missing_cite.sample_size)
+    return estimate
+
+def estimate_many(textfiles, bib, mutlicite_sep=MULTICITE_DELIMETER,
+                  suffix_eat_cnt=0, jobs=None, parser=None,
+                  confidence=ESTIMATE_CONFIDENCE, margin=ESTIMATE_MARGIN,
+                  stats=None):
+    """ Runs estimate_check for many manuscripts in parallel like 
+    check_many. Returns a list of CheckEstimates (in the given order).
+    See check_many and estimate_check for the arguments.
+    """
+    parser = _use_parser(parser)
+    if not isinstance(bib, BibIndex):
+        bib = BibIndex(bib, parser)
+    bib.build_full_index()
+    
+    initargs = (parser, bib, mutlicite_sep, suffix_eat_cnt, confidence, 
+                margin, stats is not None)
+    if jobs==1 or len(textfiles)<2:
+        _init_estimate_worker(*initargs)
+        estimates = map(_estimate_document, textfiles)
+    else:
+        pool = multiprocessing.Pool(jobs, _init_estimate_worker, initargs)
+        try:
+            estimates = pool.map(_estimate_document, textfiles, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    if stats:
+        for estimate in estimates:
+            stats.merge(estimate.stats)
+    return estimates
+
+
+def _problem_message(problem, suffix_eat_cnt):
+    if problem.kind=="duplicate":
+        return "Non-unique or duplicate bibliography entry"
+    elif problem.kind=="near-duplicate":
+        return "Possibly duplicate bibliography entries"
+    elif problem.kind=="missing-year":
+        shortref = problem.references[0][:60]
+        return "WARNING: Reference '%s...' has no publication year" % shortref
+    elif problem.kind=="ambiguous":
+        return "Citation (%s) might not be unique, alternatives..." % \
+            _cite_to_str(problem.cite, suffix_eat_cnt)
+    elif problem.kind=="missing-reference":
+        return "No reference for citation %s" % \
+            _cite_to_str(problem.cite, suffix_eat_cnt)
+    elif problem.kind=="uncited":
+        return "Reference '%s...' is not cited" % problem.references[0][:50]
+
+def _estimate_line(title, estimate):
+    if estimate.exact:
+        return "%s: %.2f%% (exact, %d checked)" % (title, 100*estimate.rate,
+                                                   estimate.sample_size)
+    return "%s: %.2f%% (%.2f%%-%.2f%%, %d sampled)" % (title, 
+        100*estimate.rate, 100*estimate.low, 100*estimate.high,
+        estimate.sample_size)
+
+def _summary_lines(missing_ref_cnt, num_cites, missing_cite_cnt, num_refs):
+    return ["Summary:",
+            "No reference for citation: %d/%d (%.2f%%)" % 
+                (missing_ref_cnt, num_cites, 100.0*missing_ref_cnt/num_cites),
+            "Reference was not cited: %d/%d (%.2f%%)" % 
+                (missing_cite_cnt, num_refs, 100.0*missing_cite_cnt/num_refs)]
+
+class TextWriter(object):
+    """ Writes the check results in the human readable format. The output
+    of each call is written at once.
+    
+    out
+        the file to write to, sys.stdout by default
+    verbosity
+        with 0 the summaries are left out, with 2 or more the places of
+         the problematic citations are listed
+    batch
+        the results are for many documents (see check_many)
+    bibfile
+        the name of the bibliography file
+    """
+    
+    def __init__(self, out=None, verbosity=1, batch=False, bibfile=None):
+        self.out = out if out is not None else sys.stdout
+        self.verbosity = verbosity
+        self.batch = batch
+        self.bibfile = bibfile
+    
+    def _write(self, lines):
+        self.out.write("".join(line+"\n" for line in lines))
+    
+    def _problem_lines(self, problem, suffix_eat_cnt=0, occurrences=None):
+        lines = [_problem_message(problem, suffix_eat_cnt)]
+        if occurrences and self.verbosity > 1 and \
+                problem.cite in occurrences:
+            count = occurrences.count(problem.cite)
+            places = ["%d:%d" % (paragraph+1, offset+1) for paragraph, offset,
+                      length in occurrences.locations(problem.cite,
+                                                      OCCURRENCES_SHOWN)]
+            if count>OCCURRENCES_SHOWN:
+                places.append("...")
+            lines.append("\tFound %d time%s at line:column %s" % (count,
+                "s" if count>1 else "", ", ".join(places)))
+        if problem.kind in ("duplicate", "near-duplicate"):
+            lines[0] += ":"
+            lines += ["\t"+ref for ref in problem.references]
+        elif problem.kind=="ambiguous":
+            lines += ["\t%s...'" % ref[:60] for ref in problem.references]
+        elif problem.kind=="missing-reference":
+            lines += ["\tDid you mean '%s...'?" % ref[:60]
+                      for ref in problem.references]
+        return lines
+    
+    def write_bibliography(self, problems):
+        """ Writes the problems of the bibliography (BibIndex.problems) """
+        if self.batch:
+            lines = ["Detected problems in bibliography:"]
+        else:
+            lines = ["Detected problems:"]
+        for problem in problems:
+            lines += self._problem_lines(problem)
+        if self.batch:
+            lines.append("")
+        self._write(lines)
+    
+    def write_result(self, result):
+        """ Writes a CheckResult """
+        lines = []
+        if self.batch:
+            lines.append("Document %s:" % result.textfile)
+            if self.verbosity > 0:
+                lines.append("#cites: %d" % result.num_cites)
+                lines.append("#unique cites: %d" % result.num_unique_cites)
+            lines.append("Detected problems:")
+            self._write(lines)
+            self.out.write(result.log)
+            lines = []
+        
+        lines.append("")
+        uncited = result.of_kind("uncited")
+        for problem in result.problems:
+            if problem.kind!="uncited":
+                lines += self._problem_lines(problem, result.suffix_eat_cnt,
+                                             result.occurrences)
+        if result.suggestions_stopped:
+            lines.append("Too many similar names, the reference suggestions "
+                         "of some citations may be incomplete")
+        lines.append("")
+        for problem in uncited:
+            lines += self._problem_lines(problem)
+        lines.append("")
+        
+        if self.verbosity > 0 and result.num_unique_cites>0:
+            lines += _summary_lines(result.missing_ref_cnt,
+                result.num_unique_cites, result.missing_cite_cnt,
+                result.num_refs)
+        if self.batch:
+            lines.append("")
+        self._write(lines)
+    
+    def write_estimate(self, estimate):
+        """ Writes a CheckEstimate """
+        lines = []
+        if self.batch:
+            lines.append("Document %s:" % estimate.textfile)
+        lines += ["Estimate (%g%% confidence) from %d/%d paragraphs:" % (
+                      100*estimate.confidence, estimate.paragraphs_read,
+                      estimate.num_paragraphs),
+                  _estimate_line("No reference for citation",
+                                 estimate.missing_ref),
+                  _estimate_line("Reference was not cited",
+                                 estimate.missing_cite)]
+        if self.batch:
+            lines.append("")
+        self._write(lines)
+    
+    def close(self, summary=None):
+        """ Ends the report, with the summary of check_many if given """
+        if summary and self.verbosity > 0 and summary['num_unique_cites']>0:
+            self._write(["Batch summary:",
+                "#documents: %d" % summary['num_documents'],
+                "#cites: %d" % summary['num_cites'],
+                "#unique cites (per document): %d" % summary['num_unique_cites'],
+                "#references: %d" % summary['num_refs']] +
+                _summary_lines(summary['missing_ref_cnt'],
+                    summary['num_unique_cites'], summary['missing_cite_cnt'],
+                    summary['num_refs']*summary['num_documents']))
+        self.out.flush()
+
+class JSONLinesWriter(TextWriter):
+    """ Writes each problem as a JSON object on its own line, with the
+    keys kind, message, file (the manuscript, or the bibliography for its
+    own problems), citation ({"authors":..., "year":..., "complete":...}
+    or null), references and occurrences (the [paragraph, offset, length]
+    of each occurrence of the citation, see OccurrenceIndex, or null). 
+    Each result ends with an object of kind "summary" that has the counts,
+    and check_many with "batch-summary". A CheckEstimate is an object of 
+    kind "estimate". See TextWriter for the arguments.
+    """
+    
+    def _problem_object(self, problem, filename, suffix_eat_cnt=0,
+                        occurrences=None):
+        cite = None
+        locations = None
+        if problem.cite:
+            authors, year, complete = problem.cite
+            cite = {"authors":list(authors), "year":year,
+                    "complete":complete}
+            if occurrences and problem.cite in occurrences:
+                locations = occurrences.locations(problem.cite)
+        return OrderedDict([("kind", problem.kind),
+            ("message", _problem_message(problem, suffix_eat_cnt)),
+            ("file", filename),
+            ("citation", cite),
+            ("references", list(problem.references)),
+            ("occurrences", locations)])
+    
+    def _write(self, objects):
+        self.out.write("".join(json.dumps(obj)+"\n" for obj in objects))
+    
+    def write_bibliography(self, problems):
+        self._write([self._problem_object(problem, self.bibfile)
+                     for problem in problems])
+    
+    def write_result(self, result):
+        if result.log:
+            sys.stderr.write(result.log)
+        objects = [self._problem_object(problem, result.textfile,
+                                        result.suffix_eat_cnt,
+                                        result.occurrences)
+                   for problem in result.problems]
+        objects.append(OrderedDict([("kind", "summary"),
+            ("file", result.textfile),
+            ("num_cites", result.num_cites),
+            ("num_unique_cites", result.num_unique_cites),
+            ("num_refs", result.num_refs),
+            ("missing_ref_cnt", result.missing_ref_cnt),
+            ("missing_cite_cnt", result.missing_cite_cnt)]))
+        self._write(objects)
+    
+    def write_estimate(self, estimate):
+        self._write([OrderedDict([("kind", "estimate"),
+            ("file", estimate.textfile),
+            ("confidence", estimate.confidence),
+            ("num_paragraphs", estimate.num_paragraphs),
+            ("paragraphs_read", estimate.paragraphs_read),
+            ("num_refs", estimate.num_refs),
+            ("missing_ref_rate", estimate.missing_ref._asdict()),
+            ("missing_cite_rate", estimate.missing_cite._asdict())])])
+    
+    def close(self, summary=None):
+        if summary:
+            batch_summary = OrderedDict([("kind", "batch-summary")])
+            batch_summary.update(sorted(summary.items()))
+            self._write([batch_summary])
+        self.out.flush()
+
+# The SARIF rules (and levels) of the problem kinds
+SARIF_RULES = [
+    ("missing-reference", "warning", "Citation has no reference"),
+    ("ambiguous", "note", "Citation might match many references"),
+    ("uncited", "warning", "Reference is not cited"),
+    ("duplicate", "warning", "Non-unique or duplicate reference"),
+    ("missing-year", "warning", "Reference has no publication year"),
+    ("near-duplicate", "note", "References might be duplicates")]
+
+class SARIFWriter(JSONLinesWriter):
+    """ Writes a SARIF 2.1.0 log (for code scanning dashboards) with a
+    result for each problem. The results are streamed as they come and the
+    log is completed by close. The citation and the references are in the
+    properties of each result. The occurrences of a citation are its
+    locations, with the paragraph as the line. See TextWriter for the
+    arguments.
+    """
+    
+    def __init__(self, out=None, verbosity=1, batch=False, bibfile=None):
+        JSONLinesWriter.__init__(self, out, verbosity, batch, bibfile)
+        self._num_results = None
     
-    return missing_ref_cnt, missing_cite_cnt
+    def _write(self, objects):
+        if self._num_results is None:
+            rules = [{"id":rule_id,
+                      "shortDescription":{"text":description},
+                      "defaultConfiguration":{"level":level}}
+                     for rule_id, level, description in SARIF_RULES]
+            header = json.dumps(OrderedDict([("version", "2.1.0"),
+                ("$schema", "https://json.schemastore.org/sarif-2.1.0.json"),
+                ("runs", [{"tool":{"driver":{"name":"nyccc",
+                    "informationUri":"https://github.com/yorak/nyccc",
+                    "rules":rules}}, "results":[]}])]))
+            # Leave the results list open for streaming
+            self.out.write(header[:-len("]}]}")]+"\n")
+            self._num_results = 0
+        
+        levels = dict((rule_id, level) for rule_id, level, d in SARIF_RULES)
+        chunks = []
+        for obj in objects:
+            if obj["kind"] not in levels:
+                continue
+            locations = []
+            if obj["file"] and obj["occurrences"]:
+                locations = [{"physicalLocation":{
+                    "artifactLocation":{"uri":obj["file"]},
+                    "region":{"startLine":paragraph+1,
+                              "startColumn":offset+1,
+                              "endColumn":offset+length+1}}}
+                    for paragraph, offset, length in obj["occurrences"]]
+            elif obj["file"]:
+                locations = [{"physicalLocation":{
+                    "artifactLocation":{"uri":obj["file"]}}}]
+            sarif_result = OrderedDict([("ruleId", obj["kind"]),
+                ("level", levels[obj["kind"]]),
+                ("message", {"text":obj["message"]}),
+                ("locations", locations),
+                ("properties", {"citation":obj["citation"],
+                                "references":obj["references"]})])
+            chunks.append((",\n" if self._num_results else "")+
+                          json.dumps(sarif_result))
+            self._num_results += 1
+        self.out.write("".join(chunks))
+    
+    def close(self, summary=None):
+        self._write([])
+        self.out.write("\n]}]}\n")
+        self.out.flush()
+
+# The report formats of the command line (--format)
+REPORT_WRITERS = OrderedDict([("text", TextWriter),
+                              ("jsonl", JSONLinesWriter),
+                              ("sarif", SARIFWriter)])
 
 
 #############################    
@@ -561,8 +3646,8 @@ def cross_check(cites, bib, suffix_eat_cnt=0):
 
 def parse_cmd_arguments():
     parser = argparse.ArgumentParser(description='A tool that crosschecks citations from your manuscript text and references in your bibliography.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('textfile', help='The manuscript as plain text file (1 line = 1 paragraph)', type=_file_exists)
-    parser.add_argument('bibfile', help='The bibiliography as plain text file (1 line =  1 reference)', type=_file_exists)
+    parser.add_argument('textfile', help='The manuscript as plain text file (1 line = 1 paragraph), or with --batch a directory of them. The files can be gzip, bzip2 or xz compressed, and - reads the standard input', type=_file_exists)
+    parser.add_argument('bibfile', help='The bibiliography as plain text file (1 line =  1 reference), or a BibTeX, RIS or CSL-JSON file. The file can be compressed, or - for the standard input', type=_file_exists)
     
     parser.add_argument('-m', help='Multiple citations separator (eg. Author 1990; Author 1992)', default=MULTICITE_DELIMETER, action='append', dest='multi_cite_sep')
     parser.add_argument('-a', help='Additional word to treat as "and" word (can be given multiple times eg. -a "and" -a "och")', action='append', dest='and_word_list')
@@ -570,64 +3655,250 @@ def parse_cmd_arguments():
     parser.add_argument('-t', help='Additional "more auhtors" designation to "et al." (can be given multiple times eg. -t "ym." -p "etc.")', action='append', dest="etal_word_list")
     parser.add_argument('-e', help='Eat this many letters from the end of author names of in-text citations (to remove suffixes)', dest='suffix_eat_cnt', default=EAT_SUFFIX_CHARS, type=int)
     parser.add_argument('-v', help='Verbosity level (0-3)', dest='verbosity', default=1, type=int)
+    parser.add_argument('--batch', help='Check all the manuscripts in the textfile directory against the bibliography', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of worker processes (default: in the batch mode one per CPU, otherwise 1)', dest='jobs', type=int)
+    parser.add_argument('--cache', help='Directory where to cache the extracted citations and bibliography keys between runs', dest='cache_dir')
+    parser.add_argument('--suggest', help='Suggest this many similar references for citations without a reference', dest='suggestions', default=SUGGESTIONS, type=int)
+    parser.add_argument('--near-duplicates', help='Report the groups of references that share at least this share of their words, i.e. are likely duplicates (default: %s)' % NEAR_DUPLICATE_THRESHOLD, dest='near_duplicates', nargs='?', const=NEAR_DUPLICATE_THRESHOLD, type=float, metavar='SIMILARITY')
+    parser.add_argument('--store', help='Record the citations and the results of the check to this SQLite database, to be queried with "nyccc.py query DATABASE" (see nyccc_store.py)', dest='store')
+    parser.add_argument('--usage-matrix', help='Save how many times each document cites each reference to this .npz file, to be analyzed with "nyccc.py analyze FILE" (see nyccc_analysis.py, needs NumPy)', dest='usage_matrix', metavar='FILE')
+    parser.add_argument('--estimate', help='Only estimate the shares of the citations without a reference and of the uncited references from a sample of each manuscript, upto this margin of error (default: %s)' % ESTIMATE_MARGIN, dest='estimate', nargs='?', const=ESTIMATE_MARGIN, type=float, metavar='MARGIN')
+    parser.add_argument('--confidence', help='The confidence level of the --estimate intervals', default=ESTIMATE_CONFIDENCE, type=float)
+    parser.add_argument('--profile', help='Print the time spent in each phase of the check and counts of what was done', action='store_true')
+    parser.add_argument('--stats-json', help='Save the phase times and counts as JSON to this file', dest='stats_json')
+    parser.add_argument('--engine', help='How the citations are searched from the paragraphs (default: %s)' % EXTRACTION_ENGINE, choices=EXTRACTION_ENGINES, default=EXTRACTION_ENGINE)
+    parser.add_argument('--bib-format', help='The format of the bibliography (default: by the file extension, see BIB_FORMAT_EXTENSIONS)', dest='bib_format', choices=BIB_FORMATS)
+    parser.add_argument('--format', help='Format of the report (default: text)', choices=list(REPORT_WRITERS), default="text")
+    parser.add_argument('-o', '--output', help='Write the report to this file instead of the standard output')
 
-    return vars(parser.parse_args())
+    parsed_args = vars(parser.parse_args())
+    if parsed_args['textfile']==parsed_args['bibfile']==STDIN_FILENAME:
+        parser.error("only one of textfile and bibfile can be read from the standard input")
+    if parsed_args['estimate'] is not None and parsed_args['usage_matrix']:
+        parser.error("--usage-matrix needs the full check, not --estimate")
+    return parsed_args
     
-def read_files(parsed_args):
+def read_files(parsed_args, parser=None, cache=None, stats=None):
     # use temp vars. for clarity
     itf = parsed_args['textfile']
     ibf = parsed_args['bibfile']
     mcs = parsed_args['multi_cite_sep'] 
     verbosity = parsed_args['verbosity']
     
-    cites = get_cites_from_file(itf, mcs, verbosity=verbosity)    
-    bib = get_bib_from_file(ibf, verbosity=verbosity)    
-    ucites = _unique(cites)
-    cites.sort()
+    # The memory grows with the manuscript: the unique citations are
+    #  collected and sorted (the reports are in citation order) and every
+    #  occurrence is recorded (see OccurrenceIndex). Only the text itself
+    #  is streamed.
+    occurrences = OccurrenceIndex()
+    ucites = list(iter_unique_cites(
+        iter_cites(_read_manuscript(itf), mcs, verbosity=verbosity,
+                   parser=parser, cache=cache, stats=stats,
+                   occurrences=occurrences)))
+    bib, bib_keys = _read_bib(ibf, verbosity, cache, stats,
+                              parsed_args['bib_format'])
     ucites.sort()
 
-    return ucites, cites, bib    
+    return ucites, occurrences, bib, bib_keys
+
+def _read_bib(bibfile, verbosity, cache, stats=None, bib_format=None):
+    if _bib_format(bibfile, bib_format)!="text":
+        # These have their keys saved next to them already
+        return load_bibliography(bibfile, bib_format, verbosity, stats)
+    # The standard input can not be hashed before it is read
+    if bibfile==STDIN_FILENAME:
+        cache = None
+    cached = cache.get_bib(bibfile) if cache else None
+    if cached:
+        return cached
+    return get_bib_from_file(bibfile, verbosity, stats), None
+    
+def _index_bib(bibfile, bib, bib_keys, parser, cache, stats=None):
+    bib_index = BibIndex(bib, parser, bib_keys, stats)
+    if cache and bib_keys is None and bibfile!=STDIN_FILENAME:
+        cache.put_bib(bibfile, bib_index)
+    return bib_index
+
+def _bib_problems(parsed_args, bib_index, stats=None):
+    if parsed_args['near_duplicates'] is None:
+        return bib_index.problems
+    return bib_index.problems+bib_index.near_duplicates(
+        parsed_args['near_duplicates'], stats=stats)
+
+def _store_results(parsed_args, bib_index, results):
+    # The store is optional and imported only when asked for
+    import nyccc_store
+    store = nyccc_store.CitationStore(parsed_args['store'])
+    try:
+        for result in results:
+            store.add_document(result, bib_index, parsed_args['bibfile'])
+    finally:
+        store.close()
+
+def _save_usage_matrix(parsed_args, bib_index, results):
+    # NumPy is needed only for the analysis, so it is imported only here
+    import nyccc_analysis
+    nyccc_analysis.usage_matrix(results, bib_index).save_npz(
+        parsed_args['usage_matrix'])
+
+def _batch_textfiles(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, fn) for fn in os.listdir(path)
+                  if not fn.startswith(".") and 
+                     not fn.endswith(BIB_SIDECAR_SUFFIX) and
+                     os.path.isfile(os.path.join(path, fn)))
+
+def _save_stats(parsed_args, stats, out=None):
+    out = out if out is not None else sys.stdout
+    if parsed_args['profile']:
+        out.write("Profile:\n")
+        stats.report(out)
+    if parsed_args['stats_json']:
+        with open(parsed_args['stats_json'], 'w') as jsonfile:
+            json.dump(stats.as_dict(), jsonfile, indent=2)
+
+def main_batch(parsed_args, writer, parser=None, cache=None, stats=None):
+    verbosity = parsed_args['verbosity']
+    textfiles = _batch_textfiles(parsed_args['textfile'])
+    ibf = parsed_args['bibfile']
+    bib, bib_keys = _read_bib(ibf, verbosity, cache, stats,
+                              parsed_args['bib_format'])
+    
+    bib_index = _index_bib(ibf, bib, bib_keys, parser, cache, stats)
+    writer.write_bibliography(_bib_problems(parsed_args, bib_index, stats))
+    
+    results, summary = check_many(textfiles, bib_index,
+        parsed_args['multi_cite_sep'], parsed_args['suffix_eat_cnt'],
+        parsed_args['jobs'], verbosity, parser, cache,
+        parsed_args['suggestions'], stats)
+    for result in results:
+        writer.write_result(result)
+    writer.close(summary)
+    if parsed_args['store']:
+        _store_results(parsed_args, bib_index, results)
+    if parsed_args['usage_matrix']:
+        _save_usage_matrix(parsed_args, bib_index, results)
+
+def main_estimate(parsed_args, writer, parser=None, cache=None, stats=None):
+    textfiles = [parsed_args['textfile']]
+    if parsed_args['batch']:
+        textfiles = _batch_textfiles(parsed_args['textfile'])
+    ibf = parsed_args['bibfile']
+    bib, bib_keys = _read_bib(ibf, parsed_args['verbosity'], cache, stats,
+                              parsed_args['bib_format'])
+    bib_index = _index_bib(ibf, bib, bib_keys, parser, cache, stats)
+    
+    jobs = parsed_args['jobs']
+    if not parsed_args['batch']:
+        jobs = 1
+    for estimate in estimate_many(textfiles, bib_index,
+            parsed_args['multi_cite_sep'], parsed_args['suffix_eat_cnt'],
+            jobs, parser, parsed_args['confidence'], parsed_args['estimate'],
+            stats):
+        writer.write_estimate(estimate)
+    writer.close()
 
 def main():
+    if sys.argv[1:2]==["query"]:
+        import nyccc_store
+        return nyccc_store.main(sys.argv[2:])
+    if sys.argv[1:2]==["analyze"]:
+        import nyccc_analysis
+        return nyccc_analysis.main(sys.argv[2:])
+    
     parsed_args = parse_cmd_arguments()
     verbosity = parsed_args['verbosity']
-    suffix_eat_cnt = parsed_args['suffix_eat_cnt']
     
     ## Prepare the parsers
     additional_and_words = parsed_args['and_word_list'] if parsed_args['and_word_list'] else []
     additional_page_words = parsed_args['page_num_abbr_list'] if parsed_args['page_num_abbr_list'] else []
     etal_word_list = parsed_args['etal_word_list'] if parsed_args['etal_word_list'] else []
-    init_regexps(
+    parser = get_parser(
         additional_and_words+AND_WORDS,
         additional_page_words+PAGE_NUM_ABBR_WORDS,
-        etal_word_list+ETAL_NOTATIONS)
-        
+        etal_word_list+ETAL_NOTATIONS,
+        parsed_args['engine'])
+    
+    cache = None
+    if parsed_args['cache_dir']:
+        cache = ExtractionCache(parsed_args['cache_dir'], parser,
+                                parsed_args['multi_cite_sep'])
+    stats = None
+    if parsed_args['profile'] or parsed_args['stats_json']:
+        stats = CheckStats()
+    
+    ## Where the report goes. The human readable extras go to stderr if
+    ##  they would mix with a machine readable report.
+    out = open(parsed_args['output'], 'w') if parsed_args['output'] \
+          else sys.stdout
+    info = sys.stdout
+    if parsed_args['format']!="text" and out is sys.stdout:
+        info = sys.stderr
+    writer = REPORT_WRITERS[parsed_args['format']](out, verbosity,
+        parsed_args['batch'], parsed_args['bibfile'])
+    
+    try:
+        if parsed_args['estimate'] is not None:
+            main_estimate(parsed_args, writer, parser, cache, stats)
+        elif parsed_args['batch']:
+            main_batch(parsed_args, writer, parser, cache, stats)
+        else:
+            _main_single(parsed_args, writer, info, parser, cache, stats)
+        if stats:
+            info.write("\n")
+            _save_stats(parsed_args, stats, info)
+    except IOError as error:
+        # A file that can not be read (or decompressed) is told in one line
+        #  like a missing one
+        sys.stderr.write("%s: error: %s\n" % (os.path.basename(sys.argv[0]),
+                                               error))
+        sys.exit(2)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+def _main_single(parsed_args, writer, info, parser=None, cache=None, 
+                 stats=None):
+    verbosity = parsed_args['verbosity']
+    
     ## Read cites and bibliography from files ##
-    ucites, cites, bib = read_files(parsed_args)
+    # The verbose output of the extraction is not a part of the report
+    stdout, sys.stdout = sys.stdout, info
+    try:
+        ucites, occurrences, bib, bib_keys = read_files(parsed_args, parser,
+                                                        cache, stats)
+    finally:
+        sys.stdout = stdout
+    if cache:
+        cache.save()
     
     if verbosity > 0:
-        print "Read from files:"
-        print "#cites:", len(cites)
-        print "#unique cites:", len(ucites)
-        print "#references:", len(bib)
-        print         
+        info.write("Read from files:\n")
+        info.write("#cites: %d\n" % occurrences.total())
+        info.write("#unique cites: %d\n" % len(ucites))
+        info.write("#references: %d\n" % len(bib))
+        info.write("\n")
     if parsed_args['verbosity'] > 2:
         from pprint import pprint
-        pprint(ucites)
+        pprint(ucites, info)
     
     ## Check for missing refs and cites
-    print "Detected problems:"
-    missing_ref_cnt, missing_cite_cnt = cross_check(ucites, bib, suffix_eat_cnt)
-    
-    num_cites = len(ucites)    
-    num_refs = len(bib)  
-    if verbosity > 0 and num_cites>0:              
-        print "Summary:"
-        print "No reference for citation: %d/%d (%.2f%%)" % \
-            (missing_ref_cnt, num_cites, 100.0*missing_ref_cnt/num_cites)
-        print "Reference was not cited: %d/%d (%.2f%%)" % \
-            (missing_cite_cnt, num_refs, 100.0*missing_cite_cnt/num_refs)
-        
+    bib_index = _index_bib(parsed_args['bibfile'], bib, bib_keys, parser, cache,
+                           stats)
+    writer.write_bibliography(_bib_problems(parsed_args, bib_index, stats))
+    result = cross_check(ucites, bib_index, parsed_args['suffix_eat_cnt'],
+                         parser, parsed_args['suggestions'], stats,
+                         parsed_args['jobs'] or 1)
+    result.textfile = parsed_args['textfile']
+    result.num_cites = occurrences.total()
+    result.occurrences = occurrences
+    writer.write_result(result)
+    writer.close()
+    if parsed_args['store']:
+        _store_results(parsed_args, bib_index, [result])
+    if parsed_args['usage_matrix']:
+        _save_usage_matrix(parsed_args, bib_index, [result])
+
 if __name__ == "__main__":
     main()
                 
@@ -0,0 +1,440 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+license :
+
+    Copyright (C) 2013
+    @author: Jussi Rasku
+
+    This program is free software with GNU General Public License v3.
+    See <http://www.gnu.org/licenses/>.
+
+
+nyccc_analysis.py :
+
+    analyzes how the references are used over an archive of manuscripts.
+    The checks of the manuscripts are collected to a sparse document x
+    reference matrix of the number of citations of each reference in each
+    document (CSR, with NumPy arrays). From it are computed the popularity
+    of the references, how often the references are cited together
+    (co-citation) and how similar the reference lists of the documents are
+    (cosine similarity), with vectorized operations. The matrices are
+    saved as .npz files that scipy.sparse.load_npz can also read. NumPy is
+    needed (pip install numpy), nyccc itself does not need it.
+
+    The matrix is saved with the --usage-matrix option of nyccc.py, and
+    analyzed with
+
+        popular [-n N]              the references cited in the most
+                                     documents
+        cocited [-n N] [PATTERN]    the pairs of references cited together
+                                     in the most documents, or the
+                                     references cited with those that
+                                     contain PATTERN
+        similar [-n N] [DOCUMENT]   the pairs of documents with the most
+                                     similar reference lists, or the
+                                     documents most similar to DOCUMENT
+
+
+example:
+
+    $ nyccc.py docs bib.txt -a "ja" -e 3 --batch --usage-matrix usage.npz
+    $ nyccc.py analyze usage.npz popular -n 10
+    $ nyccc.py analyze usage.npz cocited "Rasku, J."
+    $ nyccc_analysis.py usage.npz similar docs/thesis.txt
+"""
+
+import sys
+import argparse
+
+import numpy as np
+
+import nyccc
+
+# How many pairs are counted at once in cocitations and
+#  document_similarity, this bounds the memory used besides the result
+PAIR_CHUNK_SIZE = 1<<22
+
+SHOWN = 20
+
+class SparseMatrix(object):
+    """ A sparse matrix in the compressed sparse row (CSR) form, the same
+    layout as scipy.sparse.csr_matrix, with a label for each row and
+    column. The columns of the ith row are indices[indptr[i]:indptr[i+1]]
+    (in increasing order) and their values are in the same slice of data.
+
+    rows, columns
+        the labels of the rows and columns, e.g. the document files and
+         the reference keys
+    indptr, indices, data
+        the NumPy arrays of the matrix
+    """
+
+    def __init__(self, rows, columns, indptr, indices, data):
+        self.rows = list(rows)
+        self.columns = list(columns)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data)
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.columns)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def row(self, i):
+        """ Returns a tuple (indices, data) of the nonzero columns of the
+        ith row """
+        start, end = self.indptr[i], self.indptr[i+1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_ids(self):
+        """ The row of each nonzero value, i.e. the rows that go with
+        indices """
+        return np.repeat(np.arange(len(self.rows), dtype=np.int32),
+                         np.diff(self.indptr))
+
+    def transpose(self):
+        """ Returns the transpose, also in the CSR form (e.g. reference x
+        document). """
+        return self._transpose(self._transpose_order())
+
+    def _transpose_order(self):
+        # Where the values are in the transpose. A stable sort keeps the
+        #  rows in order within each column.
+        return np.argsort(self.indices, kind="mergesort")
+
+    def _transpose(self, order):
+        indptr = np.zeros(len(self.columns)+1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.columns)),
+                  out=indptr[1:])
+        return SparseMatrix(self.columns, self.rows, indptr,
+                            self.row_ids()[order], self.data[order])
+
+    def top(self, n=SHOWN):
+        """ Returns a list of tuples (row, column, value) of the n largest
+        values, largest first. """
+        best = np.arange(self.nnz)
+        if n<self.nnz:
+            best = np.argpartition(-self.data, n)[:n]
+        row_ids = self.row_ids()
+        # Of the equal values the first in the matrix comes first
+        best = best[np.lexsort((best, -self.data[best]))]
+        return [(self.rows[row_ids[k]], self.columns[self.indices[k]],
+                 self.data[k].item()) for k in best]
+
+    def save_npz(self, filename):
+        """ Saves the matrix as a compressed .npz file (see load_npz) """
+        np.savez_compressed(filename, format=np.array("csr"),
+            shape=np.array(self.shape), indptr=self.indptr,
+            indices=self.indices, data=self.data,
+            rows=_label_array(self.rows), columns=_label_array(self.columns))
+
+def _label_array(labels):
+    # The keys can be unicode, they are saved as UTF-8
+    return np.array([label.encode("utf-8") if isinstance(label, unicode)
+                     else label for label in labels], dtype=str)
+
+def load_npz(filename):
+    """ Loads a SparseMatrix saved by SparseMatrix.save_npz """
+    with np.load(filename) as saved:
+        return SparseMatrix(saved["rows"].tolist(),
+                            saved["columns"].tolist(), saved["indptr"],
+                            saved["indices"], saved["data"])
+
+def usage_matrix(results, bib_index=None):
+    """ Collects the checks of many documents to a document x reference
+    matrix, where the value is the number of (unique) citations of the
+    reference in the document (see CheckResult.ref_counts).
+
+    results
+        the CheckResults, e.g. from check_many. The rows are labeled by
+         their textfiles.
+    bib_index
+        the BibIndex they were checked against. Its references (keys) are
+         the columns in the bibliography order, also those not cited. By
+         default the columns are the cited references in the order they
+         are first cited, so the results can be from many bibliographies.
+    """
+    columns = []
+    column_ids = {}
+    if bib_index is not None:
+        for key in bib_index.keys:
+            column_ids.setdefault(key, len(column_ids))
+        columns = sorted(column_ids, key=column_ids.get)
+
+    indptr = [0]
+    indices = []
+    data = []
+    for result in results:
+        row = []
+        for key, count in result.ref_counts.iteritems():
+            column = column_ids.get(key)
+            if column is None:
+                column = column_ids[key] = len(columns)
+                columns.append(key)
+            row.append((column, count))
+        row.sort()
+        indices.extend(column for column, count in row)
+        data.extend(count for column, count in row)
+        indptr.append(len(indices))
+    return SparseMatrix([result.textfile for result in results], columns,
+                        indptr, indices, np.array(data, dtype=np.int32))
+
+def reference_popularity(usage):
+    """ Returns a tuple of arrays (documents, citations): in how many
+    documents each reference (column) is cited, and how many citations it
+    has in all of them. """
+    num_columns = len(usage.columns)
+    return (np.bincount(usage.indices, minlength=num_columns),
+            np.bincount(usage.indices, usage.data,
+                        minlength=num_columns).astype(np.int64))
+
+def _ragged_arange(lengths):
+    # Concatenated aranges of the lengths, [2, 3] -> [0, 1, 0, 1, 2]
+    starts = np.cumsum(lengths)-lengths
+    return np.arange(lengths.sum())-np.repeat(starts, lengths)
+
+def _pair_counts(matrix):
+    # Counts the rows where each pair of columns (i, j), i<j, both have a
+    #  value. Returns the arrays (i, j, counts) ordered by i and j. The
+    #  pairs are made for a range of the first columns i at a time, so
+    #  that the ranges are counted separately and their counts are already
+    #  in order.
+    size = len(matrix.columns)
+    lengths = np.diff(matrix.indptr)
+    # Each value is paired with the ones after it on its row
+    num_after = np.repeat(matrix.indptr[1:], lengths)-\
+                np.arange(matrix.nnz)-1
+    by_column = matrix._transpose_order()
+    column_starts = np.zeros(size+1, dtype=np.int64)
+    np.cumsum(np.bincount(matrix.indices, minlength=size),
+              out=column_starts[1:])
+    pair_ends = np.cumsum(np.bincount(matrix.indices, num_after,
+                                      minlength=size).astype(np.int64))
+    chunks = []
+    start = 0
+    while start<size:
+        done = pair_ends[start-1] if start else 0
+        end = max(start+1, np.searchsorted(pair_ends, done+PAIR_CHUNK_SIZE,
+                                           side="right"))
+        first = by_column[column_starts[start]:column_starts[end]]
+        left = np.repeat(first, num_after[first])
+        if len(left):
+            right = left+1+_ragged_arange(num_after[first])
+            codes = np.sort(matrix.indices[left].astype(np.int64)*size+
+                            matrix.indices[right], kind="mergesort")
+            runs = np.flatnonzero(np.r_[True, codes[1:]!=codes[:-1]])
+            chunks.append((codes[runs], np.diff(np.r_[runs, len(codes)])))
+        start = end
+    if not chunks:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    codes, counts = [np.concatenate(arrays) for arrays in zip(*chunks)]
+    return codes//size, codes%size, counts
+
+def _upper_matrix(labels, i, j, values):
+    # The pairs (i<j, ordered) as a square SparseMatrix
+    indptr = np.zeros(len(labels)+1, dtype=np.int64)
+    np.cumsum(np.bincount(i, minlength=len(labels)), out=indptr[1:])
+    return SparseMatrix(labels, labels, indptr, j, values)
+
+def cocitations(usage, min_count=1):
+    """ Returns a reference x reference SparseMatrix of the number of
+    documents that cite both of the references. Only the upper triangle
+    (row<column) of the symmetric matrix is there, and only the counts of
+    at least min_count. """
+    i, j, counts = _pair_counts(usage)
+    keep = counts>=min_count
+    return _upper_matrix(usage.columns, i[keep], j[keep], counts[keep])
+
+def _common(matrix, transposed, start, end):
+    # How many columns the rows start..end-1 of the matrix have in common
+    #  with each of its rows, as a dense (end-start) x rows array. The
+    #  rows are gathered through the columns of the transposed matrix.
+    lengths = np.diff(matrix.indptr[start:end+1])
+    columns = matrix.indices[matrix.indptr[start]:matrix.indptr[end]]
+    starts = transposed.indptr[columns]
+    num_rows = transposed.indptr[columns+1]-starts
+    positions = np.repeat(starts, num_rows)+_ragged_arange(num_rows)
+    owners = np.repeat(np.repeat(np.arange(end-start, dtype=np.int64),
+                                 lengths), num_rows)
+    size = len(matrix.rows)
+    return np.bincount(owners*size+transposed.indices[positions],
+                       minlength=(end-start)*size).reshape(end-start, size)
+
+def cocited_with(usage, column, transposed=None):
+    """ Returns an array of the number of documents that cite each
+    reference together with the reference (column index). Give the
+    transpose of usage as transposed to reuse it. """
+    if transposed is None:
+        transposed = usage.transpose()
+    counts = _common(transposed, usage, column, column+1)[0]
+    counts[column] = 0
+    return counts
+
+def _reference_norms(usage):
+    # The length of the (0/1) reference list vector of each document
+    return np.sqrt(np.diff(usage.indptr).astype(np.float64))
+
+def _similarity_blocks(usage, min_similarity=0.0):
+    # Yields the arrays (i, j, similarity) of document_similarity a block
+    #  of documents (rows i) at a time. Each document is paired only with
+    #  the later documents (j>i) that cite its references, which are after
+    #  it in the rows of the transpose. The blocks are made so that these
+    #  and their dense rows of common counts are about PAIR_CHUNK_SIZE.
+    order = usage._transpose_order()
+    transposed = usage._transpose(order)
+    positions = np.empty(usage.nnz, dtype=np.int64)
+    positions[order] = np.arange(usage.nnz)
+    num_later = transposed.indptr[usage.indices+1]-positions-1
+    norms = _reference_norms(usage)
+    num_docs = len(usage.rows)
+    lengths = np.diff(usage.indptr)
+    cost_ends = np.cumsum(np.bincount(usage.row_ids(), num_later,
+                                      minlength=num_docs)+num_docs)
+    start = 0
+    while start<num_docs:
+        done = cost_ends[start-1] if start else 0
+        end = max(start+1, np.searchsorted(cost_ends, done+PAIR_CHUNK_SIZE,
+                                           side="right"))
+        first, last = usage.indptr[start], usage.indptr[end]
+        later = num_later[first:last]
+        owners = np.repeat(np.repeat(np.arange(end-start, dtype=np.int64),
+                                     lengths[start:end]), later)
+        gathered = np.repeat(positions[first:last]+1, later)+\
+                   _ragged_arange(later)
+        common = np.bincount(owners*num_docs+transposed.indices[gathered],
+                             minlength=(end-start)*num_docs)
+        pairs = np.flatnonzero(common)
+        i, j = start+pairs//num_docs, pairs%num_docs
+        similarity = common[pairs]/(norms[i]*norms[j])
+        keep = similarity>=min_similarity
+        yield i[keep], j[keep], similarity[keep]
+        start = end
+
+def document_similarity(usage, min_similarity=0.0):
+    """ Returns a document x document SparseMatrix of the cosine similarity
+    of the reference lists of the documents (the number of common
+    references / the geometric mean of the numbers of references). Only
+    the upper triangle (row<column) is there, and only the pairs that
+    have common references and a similarity of at least min_similarity.
+    With a large archive most documents share some popular reference, so
+    use min_similarity or most_similar_documents to keep it small.
+    """
+    blocks = list(_similarity_blocks(usage, min_similarity))
+    if not blocks:
+        return _upper_matrix(usage.rows, [], [], [])
+    return _upper_matrix(usage.rows,
+        *[np.concatenate(arrays) for arrays in zip(*blocks)])
+
+def most_similar_documents(usage, n=SHOWN):
+    """ Returns a list of tuples (document, document, similarity) of the n
+    most similar pairs of documents (see document_similarity), most
+    similar first, without keeping the whole similarity matrix. """
+    best_i = best_j = np.array([], dtype=np.int64)
+    best = np.array([], dtype=np.float64)
+    for i, j, similarity in _similarity_blocks(usage):
+        if len(best)==n:
+            keep = similarity>best.min()
+            i, j, similarity = i[keep], j[keep], similarity[keep]
+        best_i = np.r_[best_i, i]
+        best_j = np.r_[best_j, j]
+        best = np.r_[best, similarity]
+        if len(best)>n:
+            kept = np.argpartition(-best, n)[:n]
+            best_i, best_j, best = best_i[kept], best_j[kept], best[kept]
+    order = np.lexsort((best_j, best_i, -best))
+    return [(usage.rows[best_i[k]], usage.rows[best_j[k]], best[k].item())
+            for k in order]
+
+def similar_to(usage, row, transposed=None):
+    """ Returns an array of the cosine similarity of the reference list of
+    each document to that of the document (row index). See cocited_with
+    for transposed. """
+    if transposed is None:
+        transposed = usage.transpose()
+    common = _common(usage, transposed, row, row+1)[0]
+    norms = _reference_norms(usage)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarity = np.where(common>0, common/(norms*norms[row]), 0.0)
+    similarity[row] = 0.0
+    return similarity
+
+def _largest(values, n):
+    # The indices of the n largest nonzero values, largest first
+    order = np.argsort(-values, kind="mergesort")[:n]
+    return [k for k in order if values[k]>0]
+
+def _label(key):
+    # The key of a reference ends with the period after the year
+    return key.rstrip(". ")
+
+def print_popular(usage, out, limit=SHOWN):
+    documents, citations = reference_popularity(usage)
+    for k in _largest(documents, limit):
+        out.write("%s cited in %d document%s (%d citation%s)\n" % (
+            _label(usage.columns[k]), documents[k],
+            "" if documents[k]==1 else "s", citations[k], "" if citations[k]==1 else "s"))
+
+def print_cocited(usage, out, pattern=None, limit=SHOWN):
+    if pattern is None:
+        for first, second, count in cocitations(usage).top(limit):
+            out.write("%s and %s cited together in %d document%s\n" % (
+                _label(first), _label(second), count, "" if count==1 else "s"))
+        return
+    transposed = usage.transpose()
+    for column, key in enumerate(usage.columns):
+        if pattern not in key:
+            continue
+        counts = cocited_with(usage, column, transposed)
+        out.write("%s is cited together with\n" % _label(key))
+        for k in _largest(counts, limit):
+            out.write("\t%s in %d document%s\n" % (_label(usage.columns[k]),
+                counts[k], "" if counts[k]==1 else "s"))
+
+def print_similar(usage, out, document=None, limit=SHOWN):
+    if document is None:
+        for first, second, similarity in \
+                most_similar_documents(usage, limit):
+            out.write("%.3f %s and %s\n" % (similarity, first, second))
+        return
+    if document not in usage.rows:
+        out.write("%s is not in the matrix\n" % document)
+        return
+    similarity = similar_to(usage, usage.rows.index(document))
+    for k in _largest(similarity, limit):
+        out.write("%.3f %s\n" % (similarity[k], usage.rows[k]))
+
+def parse_cmd_arguments(args=None):
+    parser = argparse.ArgumentParser(prog='nyccc.py analyze', description='Analyze the use of the references in the document x reference matrix saved with --usage-matrix.')
+    parser.add_argument('matrix', help='The .npz file', type=nyccc._file_exists)
+    analyses = parser.add_subparsers(dest='analysis')
+    popular = analyses.add_parser('popular', help='The references cited in the most documents')
+    cocited = analyses.add_parser('cocited', help='The references cited together in the most documents')
+    cocited.add_argument('pattern', help='Only the references cited with the references that contain this', nargs='?')
+    similar = analyses.add_parser('similar', help='The documents with the most similar reference lists')
+    similar.add_argument('document', help='Only the documents similar to this one', nargs='?')
+    for analysis in (popular, cocited, similar):
+        analysis.add_argument('-n', help='Show this many', dest='limit', default=SHOWN, type=int)
+    return vars(parser.parse_args(args))
+
+def main(args=None):
+    parsed_args = parse_cmd_arguments(args)
+    usage = load_npz(parsed_args['matrix'])
+    analysis = parsed_args['analysis']
+    if analysis=="popular":
+        print_popular(usage, sys.stdout, parsed_args['limit'])
+    elif analysis=="cocited":
+        print_cocited(usage, sys.stdout, parsed_args['pattern'],
+                      parsed_args['limit'])
+    elif analysis=="similar":
+        print_similar(usage, sys.stdout, parsed_args['document'],
+                      parsed_args['limit'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+license :
+
+    Copyright (C) 2013
+    @author: Jussi Rasku
+
+    This program is free software with GNU General Public License v3.
+    See <http://www.gnu.org/licenses/>.
+
+
+nyccc_server.py :
+
+    runs nyccc as a resident check server for editor integration. The
+    bibliography, its index and the compiled regexps are kept in memory,
+    and when a paragraph of a manuscript changes, only that paragraph is
+    parsed again and only the citations that were not seen before are
+    matched against the bibliography. The problems of the other paragraphs
+    are kept, and if those of the changed one stay the same, nothing is
+    pushed.
+
+    The server speaks JSON-RPC with LSP style framing ("Content-Length: N"
+    header, an empty line and N bytes of JSON) over stdio, or with --listen
+    over a local TCP socket. It understands the usual LSP messages
+    (initialize, initialized, textDocument/didOpen, didChange with full
+    text sync, didClose and workspace/didChangeWatchedFiles for the
+    bibliography) and also:
+
+        nyccc/paragraphChanged      {"uri":..., "line":N, "text":...}
+        nyccc/bibliographyChanged   {"path":...} or {"uri":..., "text":...}
+
+    The problems are pushed as textDocument/publishDiagnostics for the
+    manuscripts (missing and ambiguous citations, with line/column ranges)
+    and for the bibliography (duplicates, missing years, uncited). The
+    paragraphs are the lines of the document. A malformed message is
+    answered with a JSON-RPC error (or logged to stderr if it is a
+    notification) and the server goes on serving.
+
+
+example:
+
+    $ nyccc_server.py bib.txt -a "ja" -e 3
+"""
+
+import os
+import sys
+import json
+import urllib
+import urlparse
+import argparse
+import codecs
+import SocketServer
+from collections import Counter
+
+import nyccc
+
+# LSP diagnostic severities
+SEVERITY_WARNING = 2
+SEVERITY_INFORMATION = 3
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+def _uri_to_path(uri):
+    return urllib.url2pathname(urlparse.urlparse(uri).path)
+
+def _path_to_uri(path):
+    return urlparse.urljoin("file:", urllib.pathname2url(os.path.abspath(path)))
+
+def _range(line, start, end):
+    return {"start":{"line":line, "character":start},
+            "end":{"line":line, "character":end}}
+
+class _Paragraph(object):
+    def __init__(self, text, server):
+        self.text = text
+        # The (span, severity, message) of its problems, see
+        #  CheckServer._problems
+        self.problems = None
+        ascii_text, offsets = nyccc._fold_with_offsets(text)
+        spans = []
+        self.cites = nyccc._paragraph_cites(ascii_text,
+            server.mutlicite_sep, 0, server.parser, spans)
+        self.keys = [nyccc._cite_key(cite) for cite in self.cites]
+        self.spans = [(offsets[start], offsets[end-1]+1)
+                      for start, end in spans]
+
+class CheckServer(object):
+    """ The state of the check server: the bibliography index, the parsed
+    paragraphs of the open documents and the match results of the unique
+    citations.
+
+    send
+        called with each JSON-RPC message (dict) the server sends
+    parser, mutlicite_sep, suffix_eat_cnt
+        see nyccc.iter_cites and nyccc.cross_check
+    """
+
+    def __init__(self, send, parser=None,
+                 mutlicite_sep=nyccc.MULTICITE_DELIMETER,
+                 suffix_eat_cnt=nyccc.EAT_SUFFIX_CHARS):
+        self.send = send
+        self.parser = nyccc._use_parser(parser)
+        self.mutlicite_sep = mutlicite_sep
+        self.suffix_eat_cnt = suffix_eat_cnt
+
+        self.documents = {}
+        self.bib_uri = None
+        self.bib_lines = []
+        self.bib_index = nyccc.BibIndex([], self.parser)
+        self._matches = {}
+        self._cite_uses = Counter()
+        self._refcnt = Counter()
+        # Set when the uncited references (or whether there are documents)
+        #  may have changed, so that the bibliography is pushed again
+        self._bib_changed = True
+        self.running = True
+
+    ## The bibliography ##
+
+    def load_bibliography(self, path, publish=True):
+        with codecs.open(path, 'r', 'utf-8') as src:
+            self.set_bibliography(src.read(), _path_to_uri(path), publish)
+
+    def set_bibliography(self, text, uri=None, publish=True):
+        """ Sets the bibliography. With publish=False the diagnostics are
+        not pushed yet (see publish_all).
+        """
+        bib = []
+        self.bib_lines = []
+        for lineno, line in enumerate(text.splitlines()):
+            nonunicode_line = nyccc._to_ascii(line)
+            if nonunicode_line != "":
+                bib.append(nonunicode_line)
+                self.bib_lines.append(lineno)
+        self.bib_uri = uri
+
+        self.bib_index = nyccc.BibIndex(bib, self.parser)
+
+        # All the citations need to be matched again
+        self._matches = {}
+        self._refcnt = Counter()
+        for paragraphs in self.documents.itervalues():
+            for paragraph in paragraphs:
+                paragraph.problems = None
+        for key in self._cite_uses:
+            self._use_refs(key, 1)
+        self._bib_changed = True
+        if publish:
+            self.publish_all()
+
+    ## The citations ##
+
+    def _match(self, key):
+        if key not in self._matches:
+            self._matches[key] = self.bib_index.match(key, self.suffix_eat_cnt)
+        return self._matches[key]
+
+    def _use_refs(self, key, delta):
+        for ref in self._match(key)[1]:
+            was_cited = self._refcnt[ref]>0
+            self._refcnt[ref] += delta
+            if was_cited!=(self._refcnt[ref]>0):
+                self._bib_changed = True
+
+    def _use_paragraphs(self, paragraphs, delta):
+        for paragraph in paragraphs:
+            for key in paragraph.keys:
+                self._cite_uses[key] += delta
+                if delta>0 and self._cite_uses[key]==1:
+                    self._use_refs(key, 1)
+                elif delta<0 and self._cite_uses[key]==0:
+                    del self._cite_uses[key]
+                    self._use_refs(key, -1)
+
+    ## The documents ##
+
+    def set_document(self, uri, text):
+        """ Sets the full text of a document. Only the paragraphs whose text
+        is new to the document are parsed.
+        """
+        old_paragraphs = self.documents.get(uri, [])
+        known = dict((p.text, p) for p in old_paragraphs)
+        paragraphs = [known.get(line) or _Paragraph(line, self)
+                      for line in text.split("\n")]
+        self._replace(uri, old_paragraphs, paragraphs, paragraphs)
+        self.publish(uri)
+        self.publish_bibliography()
+
+    def set_paragraph(self, uri, lineno, text):
+        """ Sets the text of the paragraph on line lineno of a document
+        (one past its last paragraph adds a paragraph). Only that paragraph
+        is parsed and its problems found, and the diagnostics of the
+        document are pushed only if its problems changed. Raises ValueError
+        if lineno is not such a line.
+        """
+        paragraphs = self.documents.get(uri, [])
+        if not isinstance(lineno, (int, long)) or isinstance(lineno, bool) \
+           or not 0<=lineno<=len(paragraphs):
+            raise ValueError("line must be 0-%d, not %r" % (len(paragraphs),
+                                                            lineno))
+        paragraph = _Paragraph(text, self)
+        if lineno<len(paragraphs):
+            old_paragraph = paragraphs[lineno]
+            paragraphs[lineno] = paragraph
+            self._replace(uri, [old_paragraph], [paragraph], paragraphs)
+            changed = self._problems(paragraph)!=self._problems(old_paragraph)
+        else:
+            paragraphs.append(paragraph)
+            self._replace(uri, [], [paragraph], paragraphs)
+            changed = True
+        if changed:
+            self.publish(uri)
+        self.publish_bibliography()
+
+    def close_document(self, uri):
+        self._replace(uri, self.documents.get(uri, []), [], None)
+        self.publish(uri)
+        self.publish_bibliography()
+
+    def _replace(self, uri, old_paragraphs, new_paragraphs, paragraphs):
+        # Counts the citations of the new paragraphs in and those of the
+        #  old ones out, and sets the paragraphs of the document (None
+        #  closes it)
+        self._use_paragraphs(new_paragraphs, 1)
+        self._use_paragraphs(old_paragraphs, -1)
+        had_documents = bool(self.documents)
+        if paragraphs is None:
+            self.documents.pop(uri, None)
+        else:
+            self.documents[uri] = paragraphs
+        # The uncited references are reported only with some documents
+        if had_documents!=bool(self.documents):
+            self._bib_changed = True
+
+    ## The diagnostics ##
+
+    def _problems(self, paragraph):
+        # The (span, severity, message) of the problems of the citations of
+        #  the paragraph, found when they are first needed after the
+        #  paragraph or the bibliography changed
+        if paragraph.problems is not None:
+            return paragraph.problems
+        problems = []
+        for cite, key, span in zip(paragraph.cites, paragraph.keys,
+                                   paragraph.spans):
+            cite_has_target, refs = self._match(key)
+            cite_str = nyccc._cite_to_str(cite, self.suffix_eat_cnt)
+            if not cite_has_target:
+                message = "No reference for citation %s" % cite_str
+                severity = SEVERITY_WARNING
+            elif len(refs)>1:
+                message = "Citation (%s) might not be unique, alternatives: %s" % \
+                    (cite_str, " | ".join(self.bib_index.full_refs(refs)))
+                severity = SEVERITY_INFORMATION
+            else:
+                continue
+            problems.append( (span, severity, message) )
+        paragraph.problems = problems
+        return problems
+
+    def diagnostics(self, uri):
+        diagnostics = []
+        for lineno, paragraph in enumerate(self.documents.get(uri, [])):
+            for span, severity, message in self._problems(paragraph):
+                diagnostics.append({"range":_range(lineno, *span),
+                                    "severity":severity,
+                                    "source":"nyccc",
+                                    "message":message})
+        return diagnostics
+
+    def bibliography_diagnostics(self):
+        diagnostics = []
+        seen_keys = set()
+        for i, key in enumerate(self.bib_index.keys):
+            fullref = self.bib_index.bib[i]
+            messages = []
+            if not self.parser.yearre.search(fullref):
+                messages.append("Reference has no publication year")
+            if key in seen_keys:
+                messages.append("Non-unique or duplicate bibliography entry")
+            elif self.documents and self._refcnt[key]==0:
+                messages.append("Reference is not cited")
+            seen_keys.add(key)
+            for message in messages:
+                diagnostics.append({
+                    "range":_range(self.bib_lines[i], 0, len(fullref)),
+                    "severity":SEVERITY_WARNING,
+                    "source":"nyccc",
+                    "message":message})
+        return diagnostics
+
+    def publish(self, uri):
+        self.send({"jsonrpc":"2.0",
+                   "method":"textDocument/publishDiagnostics",
+                   "params":{"uri":uri, "diagnostics":self.diagnostics(uri)}})
+
+    def publish_bibliography(self):
+        # Only push the bibliography when the uncited references have
+        #  changed (or it was loaded again)
+        if self.bib_uri is None or not self._bib_changed:
+            return
+        self._bib_changed = False
+        self.send({"jsonrpc":"2.0",
+                   "method":"textDocument/publishDiagnostics",
+                   "params":{"uri":self.bib_uri,
+                             "diagnostics":self.bibliography_diagnostics()}})
+
+    def publish_all(self):
+        for uri in self.documents:
+            self.publish(uri)
+        self.publish_bibliography()
+
+    ## JSON-RPC ##
+
+    def handle(self, message):
+        """ Handles a JSON-RPC message (dict) and returns the response, or
+        None for the notifications. An error in handling the message is
+        returned as a JSON-RPC error (a notification only logs it), so that
+        a malformed message does not stop the server.
+        """
+        if not isinstance(message, dict):
+            return _error(None, INVALID_REQUEST, "Invalid request")
+        method = message.get("method")
+        try:
+            return self._handle(method, message.get("params") or {},
+                                message)
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError,
+                IOError) as e:
+            code = INVALID_PARAMS
+        except Exception as e:
+            code = INTERNAL_ERROR
+        if "id" not in message:
+            print >>sys.stderr, "nyccc: invalid %s notification (%s: %s)" % \
+                (method, e.__class__.__name__, e)
+            return None
+        return _error(message["id"], code, "%s: %s" % (e.__class__.__name__, e))
+
+    def _handle(self, method, params, message):
+        result = None
+        if method=="initialize":
+            options = params.get("initializationOptions") or {}
+            if options.get("bibfile"):
+                # Nothing is pushed before the response, see initialized
+                self.load_bibliography(options["bibfile"], publish=False)
+            result = {"capabilities":{"textDocumentSync":1},
+                      "serverInfo":{"name":"nyccc"}}
+        elif method=="initialized":
+            self.publish_all()
+        elif method=="shutdown":
+            pass
+        elif method=="exit":
+            self.running = False
+        elif method=="textDocument/didOpen":
+            document = params["textDocument"]
+            self.set_document(document["uri"], document["text"])
+        elif method=="textDocument/didChange":
+            self.set_document(params["textDocument"]["uri"],
+                              params["contentChanges"][-1]["text"])
+        elif method=="textDocument/didClose":
+            self.close_document(params["textDocument"]["uri"])
+        elif method=="nyccc/paragraphChanged":
+            self.set_paragraph(params["uri"], params["line"],
+                               params["text"])
+        elif method=="nyccc/bibliographyChanged":
+            if "text" in params:
+                self.set_bibliography(params["text"], params.get("uri"))
+            else:
+                self.load_bibliography(params.get("path") or
+                                       _uri_to_path(params["uri"]))
+        elif method=="workspace/didChangeWatchedFiles":
+            for change in params.get("changes", []):
+                if change["uri"]==self.bib_uri:
+                    self.load_bibliography(_uri_to_path(self.bib_uri))
+        elif "id" in message:
+            return _error(message["id"], METHOD_NOT_FOUND,
+                          "Method not found: %s" % method)
+
+        if "id" in message:
+            return {"jsonrpc":"2.0", "id":message["id"], "result":result}
+        return None
+
+def _error(id, code, message):
+    return {"jsonrpc":"2.0", "id":id,
+            "error":{"code":code, "message":message}}
+
+def read_message(rfile):
+    """ Reads one LSP framed JSON-RPC message, returns None at EOF. Raises
+    ValueError if the message is not valid JSON (the next message can
+    still be read).
+    """
+    length = None
+    while True:
+        header = rfile.readline()
+        if not header:
+            return None
+        header = header.strip()
+        if not header:
+            if length is not None:
+                break
+            continue
+        name, _, value = header.partition(":")
+        if name.strip().lower()=="content-length":
+            length = int(value)
+    return json.loads(rfile.read(length).decode('utf-8'))
+
+def write_message(wfile, message):
+    body = json.dumps(message)
+    wfile.write("Content-Length: %d\r\n\r\n%s" % (len(body), body))
+    wfile.flush()
+
+def serve(server, rfile, wfile):
+    """ Serves the JSON-RPC messages from rfile until exit or EOF. """
+    server.send = lambda message: write_message(wfile, message)
+    while server.running:
+        try:
+            message = read_message(rfile)
+        except ValueError as e:
+            write_message(wfile, _error(None, PARSE_ERROR,
+                                        "Parse error: %s" % e))
+            continue
+        if message is None:
+            break
+        response = server.handle(message)
+        if response is not None:
+            write_message(wfile, response)
+
+def parse_cmd_arguments():
+    parser = argparse.ArgumentParser(description='A resident nyccc check server that speaks LSP style JSON-RPC over stdio or a local socket.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('bibfile', help='The bibiliography as plain text file (1 line =  1 reference)', type=nyccc._file_exists, nargs='?')
+
+    parser.add_argument('-m', help='Multiple citations separator (eg. Author 1990; Author 1992)', default=nyccc.MULTICITE_DELIMETER, action='append', dest='multi_cite_sep')
+    parser.add_argument('-a', help='Additional word to treat as "and" word (can be given multiple times eg. -a "and" -a "och")', action='append', dest='and_word_list')
+    parser.add_argument('-p', help='Additional page number designation (can be given multiple times eg. -p "p." -p "page")', action='append', dest="page_num_abbr_list")
+    parser.add_argument('-t', help='Additional "more auhtors" designation to "et al." (can be given multiple times eg. -t "ym." -p "etc.")', action='append', dest="etal_word_list")
+    parser.add_argument('-e', help='Eat this many letters from the end of author names of in-text citations (to remove suffixes)', dest='suffix_eat_cnt', default=nyccc.EAT_SUFFIX_CHARS, type=int)
+    parser.add_argument('--listen', help='Serve on this localhost TCP port instead of stdio', dest='port', type=int)
+
+    return vars(parser.parse_args())
+
+def main():
+    parsed_args = parse_cmd_arguments()
+    parser = nyccc.get_parser(
+        (parsed_args['and_word_list'] or [])+nyccc.AND_WORDS,
+        (parsed_args['page_num_abbr_list'] or [])+nyccc.PAGE_NUM_ABBR_WORDS,
+        (parsed_args['etal_word_list'] or [])+nyccc.ETAL_NOTATIONS)
+    server = CheckServer(None, parser, parsed_args['multi_cite_sep'],
+                         parsed_args['suffix_eat_cnt'])
+
+    if parsed_args['port']:
+        server.send = lambda message: None
+        if parsed_args['bibfile']:
+            server.load_bibliography(parsed_args['bibfile'])
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                server.running = True
+                serve(server, self.rfile, self.wfile)
+
+        tcp_server = SocketServer.TCPServer(("127.0.0.1", parsed_args['port']),
+                                            Handler)
+        tcp_server.serve_forever()
+    else:
+        # stdout is the protocol channel, keep any other output away from it
+        rfile, wfile = sys.stdin, sys.stdout
+        sys.stdout = sys.stderr
+        server.send = lambda message: write_message(wfile, message)
+        if parsed_args['bibfile']:
+            server.load_bibliography(parsed_args['bibfile'])
+        serve(server, rfile, wfile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+license :
+
+    Copyright (C) 2013
+    @author: Jussi Rasku
+
+    This program is free software with GNU General Public License v3.
+    See <http://www.gnu.org/licenses/>.
+
+
+nyccc_store.py :
+
+    keeps the results of nyccc checks in a local SQLite database, so that
+    questions about a whole archive of manuscripts can be answered without
+    checking them again. For each checked document the store has the
+    citations found in it (with the number of times each occurs and
+    whether it had a reference), the references it cites and the summary
+    counts of the check. Each bibliography is stored once, however many
+    documents are checked against it, with all of its references (also
+    those that have the same key as another one). Checking a document again replaces
+    what was stored of it.
+
+    Documents are added with the --store option of nyccc.py, and the store
+    is queried with
+
+        uncited             the references that no document cites
+        failing [-n N]      the citations that most often have no reference
+                             or are ambiguous, by the number of documents
+        citing PATTERN      the documents that cite the references that
+                             contain PATTERN (SQL LIKE, e.g. "Rasku%2013")
+        documents           the stored documents and their summary counts
+
+
+example:
+
+    $ nyccc.py thesis.txt bib.txt -a "ja" -e 3 --store archive.db
+    $ nyccc.py docs bib.txt -a "ja" -e 3 --batch --store archive.db
+    $ nyccc.py query archive.db failing -n 10
+    $ nyccc_store.py archive.db citing "Rasku, J.%"
+"""
+
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import argparse
+
+import nyccc
+
+# The outcomes of the citations in a document
+OUTCOME_OK = "ok"
+OUTCOME_MISSING = "missing-reference"
+OUTCOME_AMBIGUOUS = "ambiguous"
+
+FAILING_SHOWN = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bibliographies (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    bibfile TEXT);
+
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    bibliography_id INTEGER NOT NULL REFERENCES bibliographies(id),
+    checked REAL NOT NULL,
+    num_cites INTEGER NOT NULL,
+    num_unique_cites INTEGER NOT NULL,
+    num_refs INTEGER NOT NULL,
+    missing_ref_cnt INTEGER NOT NULL,
+    missing_cite_cnt INTEGER NOT NULL);
+
+CREATE TABLE IF NOT EXISTS citations (
+    document_id INTEGER NOT NULL REFERENCES documents(id),
+    cite TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    year TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    outcome TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS citations_document ON citations(document_id);
+-- Covers the failing citations query
+CREATE INDEX IF NOT EXISTS citations_outcome ON citations(outcome, cite,
+    document_id, count);
+
+CREATE TABLE IF NOT EXISTS refs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    reference TEXT NOT NULL UNIQUE);
+CREATE INDEX IF NOT EXISTS refs_key ON refs(key);
+
+CREATE TABLE IF NOT EXISTS bibliography_refs (
+    bibliography_id INTEGER NOT NULL REFERENCES bibliographies(id),
+    ref_id INTEGER NOT NULL REFERENCES refs(id),
+    PRIMARY KEY (bibliography_id, ref_id));
+
+-- The references each document cites
+CREATE TABLE IF NOT EXISTS document_refs (
+    document_id INTEGER NOT NULL REFERENCES documents(id),
+    ref_id INTEGER NOT NULL REFERENCES refs(id),
+    PRIMARY KEY (document_id, ref_id));
+CREATE INDEX IF NOT EXISTS document_refs_ref ON document_refs(ref_id);
+"""
+
+def _path(filename):
+    # The standard input ("-") is recorded as such
+    if filename==nyccc.STDIN_FILENAME:
+        return filename
+    return os.path.abspath(filename)
+
+class CitationStore(object):
+    """ A SQLite database of checked documents. The strings are stored as
+    they are in nyccc (byte strings) and returned as such.
+
+    path
+        the database file, created if missing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.text_factory = str
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_document(self, result, bib_index, bibfile=None):
+        """ Stores the outcome of checking a document, replacing what was
+        stored of the same file before. Returns the id of the document.
+
+        result
+            the CheckResult of the document. Its textfile and occurrences
+             (an OccurrenceIndex of all the citations) must be set, as
+             they are by the command line and by check_many.
+        bib_index
+            the BibIndex the document was checked against
+        bibfile
+            the bibliography file, for the record
+        """
+        path = _path(result.textfile)
+        outcomes = {}
+        for problem in result.problems:
+            if problem.kind in (OUTCOME_MISSING, OUTCOME_AMBIGUOUS):
+                outcomes[nyccc._cite_key(problem.cite)] = problem.kind
+        uncited = set(problem.references[0] for problem in result.problems
+                      if problem.kind=="uncited")
+
+        with self.connection as db:
+            self._delete_document(db, path)
+            bibliography_id = self._add_bibliography(db, bib_index, bibfile)
+            document_id = db.execute("INSERT INTO documents (path, "
+                "bibliography_id, checked, num_cites, num_unique_cites, "
+                "num_refs, missing_ref_cnt, missing_cite_cnt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, bibliography_id, time.time(),
+                 result.num_cites, result.num_unique_cites, result.num_refs,
+                 result.missing_ref_cnt, result.missing_cite_cnt)).lastrowid
+
+            db.executemany("INSERT INTO citations (document_id, cite, "
+                "authors, year, count, outcome) VALUES (?, ?, ?, ?, ?, ?)",
+                ((document_id, nyccc._cite_to_str(cite, 0),
+                  ", ".join(cite.authors), cite.year,
+                  result.occurrences.count(cite),
+                  outcomes.get(cite, OUTCOME_OK))
+                 for cite in result.occurrences))
+
+            # The references with the same key are cited (or not) together
+            cited = set(reference for key, reference in
+                        zip(bib_index.keys, bib_index.bib)
+                        if bib_index.key_to_bib[key] not in uncited)
+            db.executemany("INSERT OR IGNORE INTO document_refs "
+                "(document_id, ref_id) SELECT ?, id FROM refs "
+                "WHERE reference=?",
+                ((document_id, reference) for reference in cited))
+        return document_id
+
+    def _add_bibliography(self, db, bib_index, bibfile):
+        # The bibliographies are told apart by their references
+        digest = hashlib.sha1("\n".join(bib_index.bib)).hexdigest()
+        row = db.execute("SELECT id FROM bibliographies WHERE digest=?",
+                         (digest,)).fetchone()
+        if row is not None:
+            return row[0]
+        bibliography_id = db.execute("INSERT INTO bibliographies (digest, "
+            "bibfile) VALUES (?, ?)",
+            (digest, bibfile and _path(bibfile))).lastrowid
+        # All the references, also those with the key of an earlier one
+        references = zip(bib_index.keys, bib_index.bib)
+        db.executemany("INSERT OR IGNORE INTO refs (key, reference) "
+                       "VALUES (?, ?)", references)
+        db.executemany("INSERT OR IGNORE INTO bibliography_refs "
+            "(bibliography_id, ref_id) SELECT ?, id FROM refs "
+            "WHERE reference=?",
+            ((bibliography_id, reference) for key, reference in references))
+        return bibliography_id
+
+    def remove_document(self, path):
+        with self.connection as db:
+            self._delete_document(db, _path(path))
+
+    def _delete_document(self, db, path):
+        row = db.execute("SELECT id FROM documents WHERE path=?",
+                         (path,)).fetchone()
+        if row is None:
+            return
+        for table in ("citations", "document_refs"):
+            db.execute("DELETE FROM %s WHERE document_id=?" % table, row)
+        db.execute("DELETE FROM documents WHERE id=?", row)
+
+    def uncited(self):
+        """ Returns a list of tuples (reference, documents) of the stored
+        references that no document cites, where documents is the number
+        of the documents that have the reference in their bibliography.
+        """
+        return self.connection.execute("SELECT r.reference, SUM(n.documents) "
+            "FROM bibliography_refs b JOIN refs r ON r.id=b.ref_id "
+            "JOIN (SELECT bibliography_id, COUNT(*) AS documents "
+            "FROM documents GROUP BY bibliography_id) n "
+            "ON n.bibliography_id=b.bibliography_id "
+            "WHERE NOT EXISTS (SELECT 1 FROM document_refs d "
+            "WHERE d.ref_id=b.ref_id) "
+            "GROUP BY b.ref_id ORDER BY r.reference").fetchall()
+
+    def failing(self, limit=FAILING_SHOWN):
+        """ Returns a list of tuples (cite, documents, count, outcome) of
+        the citations that had no reference or were ambiguous in the most
+        documents, and how many times they occur in them in total.
+        """
+        return self.connection.execute("SELECT cite, "
+            "COUNT(DISTINCT document_id) AS documents, SUM(count) AS total, "
+            "MIN(outcome) FROM citations WHERE outcome IN (?, ?) "
+            "GROUP BY cite ORDER BY documents DESC, total DESC, cite "
+            "LIMIT ?", (OUTCOME_AMBIGUOUS, OUTCOME_MISSING, limit)).fetchall()
+
+    def citing(self, pattern):
+        """ Returns a list of tuples (reference, path) of the documents
+        that cite the references that are LIKE the pattern (see SQLite, %
+        matches any string and the case of ASCII letters is ignored).
+        """
+        # The CROSS JOIN keeps SQLite from going through all the cited
+        #  references of all the documents first
+        return self.connection.execute("SELECT r.reference, doc.path "
+            "FROM refs r CROSS JOIN document_refs d ON d.ref_id=r.id "
+            "JOIN documents doc ON doc.id=d.document_id "
+            "WHERE r.reference LIKE ? "
+            "ORDER BY r.reference, doc.path", ("%"+pattern+"%",)).fetchall()
+
+    def documents(self):
+        """ Returns a list of tuples (path, num_cites, num_unique_cites,
+        missing_ref_cnt, num_refs, missing_cite_cnt) of the documents """
+        return self.connection.execute("SELECT path, num_cites, "
+            "num_unique_cites, missing_ref_cnt, num_refs, missing_cite_cnt "
+            "FROM documents ORDER BY path").fetchall()
+
+def print_uncited(store, out):
+    for reference, documents in store.uncited():
+        out.write("Reference '%s...' is not cited (in the bibliography of %d "
+                  "document%s)\n" % (reference[:50], documents,
+                                     "" if documents==1 else "s"))
+
+def print_failing(store, out, limit=FAILING_SHOWN):
+    for cite, documents, count, outcome in store.failing(limit):
+        problem = "No reference for citation" if outcome==OUTCOME_MISSING \
+                  else "Ambiguous citation"
+        out.write("%s %s in %d document%s (%d time%s)\n" % (problem, cite,
+            documents, "" if documents==1 else "s",
+            count, "" if count==1 else "s"))
+
+def print_citing(store, out, pattern):
+    previous = None
+    for reference, path in store.citing(pattern):
+        if reference!=previous:
+            out.write("Reference '%s...' is cited in\n" % reference[:50])
+            previous = reference
+        out.write("\t%s\n" % path)
+
+def print_documents(store, out):
+    for path, num_cites, num_unique_cites, missing_ref_cnt, num_refs, \
+            missing_cite_cnt in store.documents():
+        out.write("%s\n" % path)
+        out.write("\t".join(["", "#cites: %d" % num_cites,
+            "No reference for citation: %d/%d" % (missing_ref_cnt,
+                                                  num_unique_cites),
+            "Reference was not cited: %d/%d\n" % (missing_cite_cnt,
+                                                  num_refs)]))
+
+def parse_cmd_arguments(args=None):
+    parser = argparse.ArgumentParser(prog='nyccc.py query', description='Query the results of the nyccc checks stored with --store.')
+    parser.add_argument('database', help='The SQLite database', type=nyccc._file_exists)
+    queries = parser.add_subparsers(dest='query')
+    queries.add_parser('uncited', help='The references that no document cites')
+    failing = queries.add_parser('failing', help='The citations that most often have no reference or are ambiguous')
+    failing.add_argument('-n', help='Show this many citations', dest='limit', default=FAILING_SHOWN, type=int)
+    citing = queries.add_parser('citing', help='The documents that cite the references that contain the pattern')
+    citing.add_argument('pattern', help='The pattern (SQL LIKE, %% matches anything)')
+    queries.add_parser('documents', help='The stored documents')
+    return vars(parser.parse_args(args))
+
+def main(args=None):
+    parsed_args = parse_cmd_arguments(args)
+    store = CitationStore(parsed_args['database'])
+    try:
+        query = parsed_args['query']
+        if query=="uncited":
+            print_uncited(store, sys.stdout)
+        elif query=="failing":
+            print_failing(store, sys.stdout, parsed_args['limit'])
+        elif query=="citing":
+            print_citing(store, sys.stdout, parsed_args['pattern'])
+        elif query=="documents":
+            print_documents(store, sys.stdout)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
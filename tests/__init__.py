@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests :
+
+    The tests of nyccc. Run them from the repository root:
+
+    $ python -m unittest discover
+
+    Most of them are differential: the same synthetic manuscripts and
+    bibliographies (see benchmarks/corpus.py) are checked in two ways that
+    should give the same result, e.g. with two extraction engines or with
+    and without a cache, and the results are compared.
+"""
+
+import os
+import re
+import codecs
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from unicodedata import normalize
+
+import nyccc
+from benchmarks.corpus import write_corpus
+
+def read_paragraphs(filename):
+    """ Returns the lines of a UTF-8 file as unicode without the newlines """
+    with codecs.open(filename, 'r', 'utf-8') as src:
+        return [line.rstrip(u"\n") for line in src]
+
+def extract(paragraphs, parser, mutlicite_sep=nyccc.MULTICITE_DELIMETER):
+    """ Returns a list with a (citations, spans) tuple for each paragraph
+    as the parser (and its engine) finds them.
+    """
+    found = []
+    for line in paragraphs:
+        spans = []
+        cites = nyccc._paragraph_cites(nyccc._to_ascii(line), mutlicite_sep,
+                                       0, parser, spans)
+        found.append( (cites, spans) )
+    return found
+
+def baseline_extract(paragraphs, parser,
+                     mutlicite_sep=nyccc.MULTICITE_DELIMETER):
+    """ Returns a list of the citations of each paragraph as the original
+    get_cites_from_file found them: both regexps over the whole paragraph,
+    nothing skipped, windowed or memoized. The parser is only used for its
+    regexps.
+    """
+    found = []
+    for line in paragraphs:
+        nonunicode_line = normalize('NFKD', line.strip()).encode('ascii',
+                                                                 'ignore')
+        cites = []
+        for tc_candidate in parser.textcitere.finditer(nonunicode_line):
+            cites.append(nyccc.parse_citet(tc_candidate.group(0), parser))
+        for ny_candidate in parser.likere.findall(nonunicode_line):
+            if ny_candidate[0] == ny_candidate[1]:
+                continue
+            for scc in re.split("|".join(mutlicite_sep), ny_candidate[0]):
+                pcite = nyccc.parse_citep(scc, parser)
+                if pcite:
+                    cites.append(pcite)
+        found.append(cites)
+    return found
+
+def check(textfile, bibfile, parser=None, **kwargs):
+    """ Returns the CheckResult of a manuscript and a bibliography file,
+    checked like nyccc.py checks them. The keyword arguments are passed
+    to cross_check.
+    """
+    parser = parser or nyccc.get_parser()
+    occurrences = nyccc.OccurrenceIndex()
+    ucites = sorted(nyccc.iter_unique_cites(nyccc.iter_cites(
+        nyccc._read_manuscript(textfile), parser=parser,
+        occurrences=occurrences)))
+    bib_index = nyccc.BibIndex(nyccc.get_bib_from_file(bibfile), parser)
+    result = nyccc.cross_check(ucites, bib_index, parser=parser, **kwargs)
+    result.textfile = textfile
+    result.num_cites = occurrences.total()
+    result.occurrences = occurrences
+    return result
+
+def report(result, verbosity=2):
+    """ Returns the text report of a CheckResult as a string """
+    out = StringIO()
+    writer = nyccc.TextWriter(out, verbosity)
+    writer.write_result(result)
+    writer.close()
+    return out.getvalue()
+
+class CorpusTestCase(unittest.TestCase):
+    """ Writes a generated corpus for each of SEEDS to a temporary directory
+    before the tests of the class. corpora is a list of their (textfile,
+    bibfile) paths. With REFS the bibliographies have that many references
+    (see benchmarks.corpus.generate_corpus).
+    """
+
+    SEEDS = [0, 1, 2]
+    PARAGRAPHS = 300
+    REFS = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        cls.corpora = []
+        for seed in cls.SEEDS:
+            directory = os.path.join(cls.directory, str(seed))
+            os.mkdir(directory)
+            cls.corpora.append(write_corpus(directory, cls.PARAGRAPHS,
+                                            cls.REFS, seed=seed))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_analysis.py :
+
+    The usage matrix and its analyses (see nyccc_analysis.py) against
+    counting the same from dicts of the citations of each document. These
+    are skipped without NumPy.
+"""
+
+import os
+import sys
+import math
+import random
+import shutil
+import tempfile
+import unittest
+import subprocess
+from collections import Counter
+
+try:
+    import numpy
+    import nyccc_analysis
+except ImportError:
+    numpy = None
+
+import nyccc
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+def _results(seed, num_documents=40, num_refs=60):
+    # CheckResults with random reference counts, some references are
+    #  popular and some documents cite nothing
+    rnd = random.Random(seed)
+    keys = ["Author%d, A. %d. " % (k, 1950+k) for k in range(num_refs)]
+    results = []
+    for d in range(num_documents):
+        result = nyccc.CheckResult(textfile="doc%02d.txt" % d)
+        for k in range(rnd.choice([0, 1, 3, 8, 15])):
+            key = keys[min(int(rnd.expovariate(0.1)), num_refs-1)]
+            result.ref_counts[key] += rnd.randint(1, 3)
+        results.append(result)
+    return results, keys
+
+def _pairs(results):
+    # The number of documents that cite both of each pair of references
+    pairs = Counter()
+    for result in results:
+        cited = sorted(result.ref_counts)
+        for i, first in enumerate(cited):
+            for second in cited[i+1:]:
+                pairs[frozenset([first, second])] += 1
+    return pairs
+
+def _cosine(first, second):
+    common = len(set(first.ref_counts) & set(second.ref_counts))
+    if not common:
+        return 0.0
+    return common/math.sqrt(len(first.ref_counts)*len(second.ref_counts))
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestUsageAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.chunk_size = nyccc_analysis.PAIR_CHUNK_SIZE
+
+    def tearDown(self):
+        nyccc_analysis.PAIR_CHUNK_SIZE = self.chunk_size
+
+    def _cases(self):
+        # The small chunk sizes count the pairs in many parts
+        for seed in range(3):
+            for chunk_size in (self.chunk_size, 50, 1):
+                nyccc_analysis.PAIR_CHUNK_SIZE = chunk_size
+                results, keys = _results(seed)
+                yield results, keys, nyccc_analysis.usage_matrix(results)
+
+    def _entries(self, matrix):
+        # The nonzero values as a dict {(row, column):value}
+        entries = {}
+        for i, row in enumerate(matrix.rows):
+            indices, data = matrix.row(i)
+            self.assertEqual(list(indices), sorted(set(indices)))
+            for k, value in zip(indices, data):
+                entries[(row, matrix.columns[k])] = value.item()
+        return entries
+
+    def test_usage_matrix_has_the_counts_of_the_results(self):
+        for results, keys, usage in self._cases():
+            expected = dict(((result.textfile, key), count)
+                            for result in results
+                            for key, count in result.ref_counts.items())
+            self.assertEqual(self._entries(usage), expected)
+            self.assertEqual(self._entries(usage.transpose()),
+                             dict(((key, row), count) for (row, key), count
+                                  in expected.items()))
+            documents, citations = nyccc_analysis.reference_popularity(usage)
+            for k, key in enumerate(usage.columns):
+                self.assertEqual(documents[k], sum(
+                    1 for result in results if key in result.ref_counts))
+                self.assertEqual(citations[k], sum(
+                    result.ref_counts[key] for result in results))
+
+    def test_bibliography_gives_the_columns(self):
+        results, keys = _results(0)
+        bib_index = nyccc.BibIndex([key+"Title." for key in keys+keys[:2]])
+        usage = nyccc_analysis.usage_matrix(results, bib_index)
+        self.assertEqual(usage.columns, keys)
+        self.assertEqual(self._entries(usage), self._entries(
+            nyccc_analysis.usage_matrix(results)))
+
+    def test_cocitations_are_the_pairs_of_the_documents(self):
+        for results, keys, usage in self._cases():
+            pairs = _pairs(results)
+            cocitations = nyccc_analysis.cocitations(usage)
+            found = self._entries(cocitations)
+            for first, second in found:
+                self.assertLess(usage.columns.index(first),
+                                usage.columns.index(second))
+            self.assertEqual(dict((frozenset(pair), count)
+                                  for pair, count in found.items()),
+                             dict(pairs))
+            self.assertEqual(self._entries(
+                nyccc_analysis.cocitations(usage, min_count=3)),
+                dict((pair, count) for pair, count in found.items()
+                     if count>=3))
+            for k, key in enumerate(usage.columns):
+                counts = nyccc_analysis.cocited_with(usage, k)
+                for other_k, other in enumerate(usage.columns):
+                    self.assertEqual(counts[other_k],
+                                     pairs.get(frozenset([key, other]), 0))
+
+    def test_similarity_is_the_cosine_of_the_reference_lists(self):
+        for results, keys, usage in self._cases():
+            expected = {}
+            for i, first in enumerate(results):
+                for second in results[i+1:]:
+                    cosine = _cosine(first, second)
+                    if cosine:
+                        expected[(first.textfile, second.textfile)] = cosine
+            found = self._entries(
+                nyccc_analysis.document_similarity(usage))
+            self.assertEqual(sorted(found), sorted(expected))
+            for pair, cosine in expected.items():
+                self.assertAlmostEqual(found[pair], cosine)
+            best = nyccc_analysis.most_similar_documents(usage, 5)
+            self.assertEqual([round(similarity, 9) for first, second,
+                              similarity in best],
+                             [round(cosine, 9) for cosine in
+                              sorted(expected.values(), reverse=True)[:5]])
+            for i, result in enumerate(results):
+                similarity = nyccc_analysis.similar_to(usage, i)
+                for j, other in enumerate(results):
+                    self.assertAlmostEqual(similarity[j], _cosine(result, other)
+                                           if i!=j else 0.0)
+
+    def test_saved_matrix_is_loaded_the_same(self):
+        directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        try:
+            filename = os.path.join(directory, "usage.npz")
+            results, keys = _results(0)
+            results[0].ref_counts[u"K\xe4rkk\xe4inen, T. 2007"] = 1
+            usage = nyccc_analysis.usage_matrix(results)
+            usage.save_npz(filename)
+            loaded = nyccc_analysis.load_npz(filename)
+            self.assertEqual(loaded.rows, usage.rows)
+            self.assertEqual([key.decode("utf-8") for key in loaded.columns],
+                             usage.columns)
+            for name in ("indptr", "indices", "data"):
+                self.assertEqual(getattr(loaded, name).tolist(),
+                                 getattr(usage, name).tolist())
+        finally:
+            shutil.rmtree(directory)
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestAnalyzeCommand(unittest.TestCase):
+
+    MANUSCRIPTS = {"a.txt":u"(Smith 2001; Lax 1998) and (Young 1991).\n",
+                   "b.txt":u"(Smith 2001) and (Lax 1998), (Lax 1998).\n",
+                   "c.txt":u"(Young 1991) and nothing else.\n"}
+
+    BIBLIOGRAPHY = u"Smith, A. 2001. A book.\nLax, L. 1998. Old paper.\n"\
+                   u"Young, Y. 1991. Older paper.\nJones, J. 2005. Uncited.\n"
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        self.docs = os.path.join(self.directory, "docs")
+        os.mkdir(self.docs)
+        for name, text in self.MANUSCRIPTS.items():
+            with open(os.path.join(self.docs, name), 'wb') as f:
+                f.write(text.encode('utf-8'))
+        bibfile = os.path.join(self.directory, "bib.txt")
+        with open(bibfile, 'wb') as f:
+            f.write(self.BIBLIOGRAPHY.encode('utf-8'))
+        self.matrix = os.path.join(self.directory, "usage.npz")
+        subprocess.check_output([sys.executable, NYCCC, self.docs, bibfile,
+                                 "--batch", "--usage-matrix", self.matrix])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _analyze(self, *args):
+        return subprocess.check_output([sys.executable, NYCCC, "analyze",
+                                        self.matrix]+list(args))
+
+    def test_analyses_of_the_saved_checks(self):
+        self.assertEqual(self._analyze("popular"),
+            "Smith, A. 2001 cited in 2 documents (2 citations)\n"
+            "Lax, L. 1998 cited in 2 documents (2 citations)\n"
+            "Young, Y. 1991 cited in 2 documents (2 citations)\n")
+        self.assertEqual(self._analyze("popular", "-n", "1").count("\n"), 1)
+        self.assertEqual(self._analyze("cocited"),
+            "Smith, A. 2001 and Lax, L. 1998 cited together in 2 documents\n"
+            "Smith, A. 2001 and Young, Y. 1991 cited together in 1 document\n"
+            "Lax, L. 1998 and Young, Y. 1991 cited together in 1 document\n")
+        self.assertEqual(self._analyze("cocited", "Young"),
+            "Young, Y. 1991 is cited together with\n"
+            "\tSmith, A. 2001 in 1 document\n"
+            "\tLax, L. 1998 in 1 document\n")
+        a, b, c = [os.path.join(self.docs, name) for name in
+                   ("a.txt", "b.txt", "c.txt")]
+        self.assertEqual(self._analyze("similar"),
+            "0.816 %s and %s\n0.577 %s and %s\n" % (a, b, a, c))
+        self.assertEqual(self._analyze("similar", c), "0.577 %s\n" % a)
+
+if __name__ == '__main__':
+    unittest.main()
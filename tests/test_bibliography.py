@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_bibliography.py :
+
+    The BibTeX, RIS and CSL-JSON loaders against the references and keys
+    of hand-written entries, and the BibTeX bibliographies loaded from
+    their sidecar files against the same bibliographies parsed again.
+"""
+
+import os
+import json
+import time
+import codecs
+import random
+import shutil
+import tempfile
+import unittest
+
+import nyccc
+from benchmarks.corpus import generate_bibliography
+from tests import CorpusTestCase, check, report
+
+def write_bibtex(filename, refs):
+    """ Writes the references of generate_bibliography as BibTeX """
+    with codecs.open(filename, 'w', 'utf-8') as out:
+        for i, (authors, year, ref) in enumerate(refs):
+            out.write(u"@article{ref%d,\n  author = {%s},\n" %
+                      (i, u" and ".join(authors)))
+            if year:
+                out.write(u"  year = {%s},\n" % year)
+            out.write(u"  title = {Work number %d},\n  journal = {Journal}\n"
+                      u"}\n\n" % i)
+
+# The same references in each of the formats, with what the loaders
+#  should make of them
+BIBTEX = u"""@string{jcs = "Journal of Cool Stuff"}
+@comment{ignored {entirely}}
+@preamble{"\\newcommand{\\noop}[1]{}"}
+@article{rasku13,
+  author = {Rasku, Jussi and Musliu, Nysret},
+  title = {Automating the {P}arameter Selection},
+  journal = jcs,
+  year = 2013
+}
+@book{karkkainen07,
+  author = "T. K{\\"a}rkk{\\"a}inen and {\\AA}ngstr{\\"o}m, Anders and others",
+  title = {Physics},
+  publisher = {Pub},
+  year = {2007},
+}
+@inproceedings{vonx,
+  author = {Ludwig van Beethoven and Jean de La Fontaine},
+  booktitle = {Proc} # " of " # jcs,
+  date = {1801-05-01}
+}
+@book{edited, editor = {Smith, A.}, title = {Edited}, year = {2003}}
+@misc{org, organization = {World Health Organization}, title={Report}, year={2010}}
+@misc{noyear, author = {Nobody, N.}, title = {Undated}}
+@article{broken, author = {Unclosed, U., title = {x}
+"""
+
+RIS = u"""TY  - JOUR
+AU  - Rasku, Jussi
+AU  - Musliu, Nysret
+TI  - Automating the parameter selection
+T2  - Journal of Cool Stuff
+PY  - 2013///
+ER  - 
+TY  - BOOK
+A1  - Kärkkäinen, Tommi
+Y1  - 2007/05/01
+T1  - Physics
+PB  - Pub
+ER  - 
+TY  - RPRT
+AU  - World Health Organization
+DA  - 2010
+TI  - Report
+ER  - 
+TY  - BOOK
+ED  - Smith, A.
+TI  - Undated
+ER  - 
+"""
+
+CSL_JSON = [
+    {"type":"article-journal", "title":"Automating",
+     "author":[{"family":"Rasku", "given":"Jussi"},
+               {"family":"Musliu", "given":"Nysret"}],
+     "container-title":"Journal of Cool Stuff",
+     "issued":{"date-parts":[[2013, 5]]}},
+    {"type":"book", "title":"Physics", "publisher":"Pub",
+     "author":[{"family":u"Kärkkäinen", "given":"Tommi-Pekka"}],
+     "issued":{"raw":"May 2007"}},
+    {"type":"book", "title":"Music", "issued":{"literal":"c. 1801"},
+     "author":[{"family":"Beethoven", "non-dropping-particle":"van",
+                "given":"Ludwig"}]},
+    {"type":"report", "title":"Report", "container-title":["Series"],
+     "author":[{"literal":"World Health Organization"}],
+     "issued":{"date-parts":[["2010"]]}},
+    {"type":"book", "title":"Undated",
+     "editor":[{"family":"Smith", "given":"A."}]}]
+
+LOADED = {
+    "bib.bib":[
+        ("Rasku, J. & Musliu, N. 2013. Automating the Parameter Selection. "
+         "Journal of Cool Stuff.", "Rasku, J. & Musliu, N. 2013"),
+        ("Karkkainen, T. & Angstrom, A. 2007. Physics. Pub.",
+         "Karkkainen, T. & Angstrom, A. 2007"),
+        ("van Beethoven, L. & de La Fontaine, J. 1801. Proc of Journal of "
+         "Cool Stuff.", "van Beethoven, L. & de La Fontaine, J. 1801"),
+        ("Smith, A. 2003. Edited.", "Smith, A. 2003"),
+        ("World Health Organization 2010. Report.",
+         "World Health Organization 2010"),
+        ("Nobody, N. Undated.", None)],
+    "bib.ris":[
+        ("Rasku, J. & Musliu, N. 2013. Automating the parameter selection. "
+         "Journal of Cool Stuff.", "Rasku, J. & Musliu, N. 2013"),
+        ("Karkkainen, T. 2007. Physics. Pub.", "Karkkainen, T. 2007"),
+        ("World Health Organization 2010. Report.",
+         "World Health Organization 2010"),
+        ("Smith, A. Undated.", None)],
+    "bib.json":[
+        ("Rasku, J. & Musliu, N. 2013. Automating. Journal of Cool Stuff.",
+         "Rasku, J. & Musliu, N. 2013"),
+        ("Karkkainen, T.-P. 2007. Physics. Pub.", "Karkkainen, T.-P. 2007"),
+        ("van Beethoven, L. 1801. Music.", "van Beethoven, L. 1801"),
+        ("World Health Organization 2010. Report. Series.",
+         "World Health Organization 2010"),
+        ("Smith, A. Undated.", None)]}
+
+class TestBibliographyLoaders(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        for name, content in (("bib.bib", BIBTEX), ("bib.ris", RIS),
+                              ("bib.json", json.dumps(CSL_JSON))):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(content.encode('utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_references_and_keys_of_each_format(self):
+        for name, expected in sorted(LOADED.items()):
+            filename = os.path.join(self.directory, name)
+            self.assertEqual(nyccc.load_bibliography(filename, sidecar=False),
+                             tuple(list(column) for column in zip(*expected)),
+                             name)
+
+    def test_format_is_told_by_the_extension_or_given(self):
+        os.rename(os.path.join(self.directory, "bib.ris"),
+                  os.path.join(self.directory, "library.txt"))
+        filename = os.path.join(self.directory, "library.txt")
+        self.assertEqual(nyccc._bib_format(filename), "text")
+        self.assertEqual(nyccc.load_bibliography(filename, "ris",
+                                                 sidecar=False)[1],
+                         [key for ref, key in LOADED["bib.ris"]])
+
+    def test_citations_match_the_loaded_keys(self):
+        textfile = os.path.join(self.directory, "thesis.txt")
+        with open(textfile, 'wb') as f:
+            f.write(u"(Rasku & Musliu 2013; Kärkkäinen & Ångström 2007) and "
+                    u"van Beethoven and de La Fontaine (1801) and (World "
+                    u"Health Organization 2010; Smith 2003).\n".encode('utf-8'))
+        result = check(textfile, os.path.join(self.directory, "bib.bib"))
+        self.assertEqual(result.num_unique_cites, 5)
+        self.assertEqual(result.missing_ref_cnt, 0)
+        self.assertEqual([problem.references for problem in
+                          result.of_kind("uncited")],
+                         [["Nobody, N. Undated."]])
+
+class TestBibliographySidecar(CorpusTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestBibliographySidecar, cls).setUpClass()
+        # The same seed gives the references of the corpus, so the
+        #  manuscripts cite them
+        cls.bibtexfiles = []
+        for seed, (textfile, bibfile) in zip(cls.SEEDS, cls.corpora):
+            num_refs = len(codecs.open(bibfile, 'r', 'utf-8').readlines())
+            bibtexfile = os.path.join(os.path.dirname(bibfile), "bib.bib")
+            write_bibtex(bibtexfile, generate_bibliography(num_refs,
+                                                           random.Random(seed)))
+            cls.bibtexfiles.append(bibtexfile)
+
+    def setUp(self):
+        for bibtexfile in self.bibtexfiles:
+            if os.path.exists(bibtexfile+nyccc.BIB_SIDECAR_SUFFIX):
+                os.remove(bibtexfile+nyccc.BIB_SIDECAR_SUFFIX)
+
+    def _load(self, bibtexfile, **kwargs):
+        stats = nyccc.CheckStats()
+        loaded = nyccc.load_bibliography(bibtexfile, stats=stats, **kwargs)
+        return loaded, stats.counts["bibliography sidecar loads"]
+
+    def test_sidecar_gives_the_parsed_bibliography(self):
+        for bibtexfile in self.bibtexfiles:
+            expected, loads = self._load(bibtexfile, sidecar=False)
+            self.assertTrue(expected[0])
+            self.assertEqual(self._load(bibtexfile), (expected, 0))
+            self.assertTrue(os.path.exists(bibtexfile+
+                                           nyccc.BIB_SIDECAR_SUFFIX))
+            self.assertEqual(self._load(bibtexfile), (expected, 1))
+            # Copied or checked out again, the content is the same
+            os.utime(bibtexfile, (time.time(), time.time()+10))
+            self.assertEqual(self._load(bibtexfile), (expected, 1))
+
+    def test_sidecar_gives_the_same_report(self):
+        parser = nyccc.get_parser()
+        for (textfile, bibfile), bibtexfile in zip(self.corpora,
+                                                   self.bibtexfiles):
+            ucites = sorted(nyccc.iter_unique_cites(nyccc.iter_cites(
+                nyccc._read_manuscript(textfile), parser=parser)))
+            reports = []
+            for i in range(2):
+                bib, keys = nyccc.load_bibliography(bibtexfile)
+                reports.append(report(nyccc.cross_check(ucites,
+                    nyccc.BibIndex(bib, parser, keys), parser=parser)))
+            self.assertEqual(reports[1], reports[0])
+
+    def test_changed_bibliography_is_parsed_again(self):
+        for bibtexfile in self.bibtexfiles:
+            self._load(bibtexfile)
+            with open(bibtexfile) as f:
+                content = f.read()
+            try:
+                # The same size, so only the content tells the change
+                with open(bibtexfile, 'w') as f:
+                    f.write(content.replace("Work number 1}",
+                                            "Work numbeR 1}"))
+                os.utime(bibtexfile, (time.time(), time.time()+20))
+                expected, loads = self._load(bibtexfile, sidecar=False)
+                self.assertTrue([ref for ref in expected[0]
+                                 if "Work numbeR 1." in ref])
+                self.assertEqual(self._load(bibtexfile), (expected, 0))
+            finally:
+                with open(bibtexfile, 'w') as f:
+                    f.write(content)
+
+    def test_broken_or_pickled_sidecar_is_replaced(self):
+        bibtexfile = self.bibtexfiles[0]
+        sidecar_file = bibtexfile+nyccc.BIB_SIDECAR_SUFFIX
+        expected, loads = self._load(bibtexfile, sidecar=False)
+        for content in ("", "{not json", "cos\nsystem\n(S'true'\ntR.", "[]"):
+            with open(sidecar_file, 'w') as f:
+                f.write(content)
+            self.assertEqual(self._load(bibtexfile), (expected, 0))
+            with open(sidecar_file) as f:
+                self.assertEqual(json.load(f)["keys"], expected[1])
+
+if __name__ == '__main__':
+    unittest.main()
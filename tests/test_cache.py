@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_cache.py :
+
+    Checking with --cache against checking without it, when the options
+    change between the runs, the cache files are broken or several
+    processes share the cache.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import nyccc
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+# Each of the options finds other citations from some of these
+MANUSCRIPT = u"""Parenthesis (Smith ja Lax 2005) and (Smith 2001, s. 12).
+More authors (Virtasen ym. 2010) and a list (Lax 1998: Young 1991).
+Text citations Raskun (2013) mukaan ja Smithin (2001) mukaan.
+"""
+
+BIBLIOGRAPHY = u"""Rasku, J. & Musliu, N. 2013. Automating the parameter selection.
+Smith, A. 2001. A book.
+Smith, A. & Lax, L. 2005. A paper.
+Lax, L. 2005. Another paper.
+Virtanen, V., Rasku, J. & Lax, L. 2010. Another paper.
+Lax, L. 1998. Old paper.
+Young, Y. 1991. Older paper.
+"""
+
+OPTIONS = [[], ["-a", "ja"], ["-p", "s."], ["-t", "ym."], ["-m", ":"],
+           ["-e", "1"], ["-e", "0"]]
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        self.textfile = os.path.join(self.directory, "thesis.txt")
+        self.bibfile = os.path.join(self.directory, "bib.txt")
+        self.cache_dir = os.path.join(self.directory, "cache")
+        for filename, text in ((self.textfile, MANUSCRIPT),
+                               (self.bibfile, BIBLIOGRAPHY)):
+            with open(filename, 'wb') as f:
+                f.write(text.encode('utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, options, cache=True):
+        # The report and the stats of a check with the options
+        stats_file = os.path.join(self.directory, "stats.json")
+        args = [sys.executable, NYCCC, self.textfile, self.bibfile, "-v", "1",
+                "--stats-json", stats_file]+options
+        if cache:
+            args += ["--cache", self.cache_dir]
+        output = subprocess.check_output(args)
+        with open(stats_file) as f:
+            return output, json.load(f)["counts"]
+
+    def test_changed_options_do_not_serve_stale_citations(self):
+        expected = dict((tuple(options), self._run(options, cache=False)[0])
+                        for options in OPTIONS)
+        # Otherwise a stale cache would not be told apart (-p only changes
+        #  the spans of the citations)
+        self.assertEqual(len(set(expected.values())), len(OPTIONS)-1)
+        self._run([])
+        for options in OPTIONS[1:]:
+            output, counts = self._run(options)
+            self.assertEqual(output, expected[tuple(options)], options)
+            # -e is not about the extraction, so only its paragraphs are
+            #  from the cache of the first run
+            self.assertEqual(counts.get("cached paragraphs"),
+                             3 if options[0]=="-e" else None, options)
+        for options in OPTIONS:
+            output, counts = self._run(options)
+            self.assertEqual(output, expected[tuple(options)], options)
+            self.assertEqual(counts.get("cached paragraphs"), 3, options)
+
+    def test_broken_cache_files_are_ignored(self):
+        expected = self._run([], cache=False)[0]
+        self._run([])
+        broken = []
+        for directory, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".pickle"):
+                    broken.append(os.path.join(directory, name))
+        self.assertTrue(len(broken)>=2)
+        for i, filename in enumerate(broken):
+            with open(filename, 'wb') as f:
+                f.write("not a pickle"[:i])
+        output, counts = self._run([])
+        self.assertEqual(output, expected)
+        self.assertNotIn("cached paragraphs", counts)
+        # and they are written again
+        output, counts = self._run([])
+        self.assertEqual(output, expected)
+        self.assertEqual(counts["cached paragraphs"], 3)
+
+    def test_shared_cache_keeps_the_citations_of_each(self):
+        parser = nyccc.get_parser()
+        caches = [nyccc.ExtractionCache(self.cache_dir, parser)
+                  for i in range(2)]
+        paragraphs = ["Paragraph %d (Smith %d)" % (i, 2000+i)
+                      for i in range(200)]
+        for i, paragraph in enumerate(paragraphs):
+            caches[i%2].put_cites(paragraph,
+                                  nyccc._paragraph_cites(paragraph, [";"], 0,
+                                                         parser))
+        for cache in caches:
+            cache.save()
+        cache = nyccc.ExtractionCache(self.cache_dir, parser)
+        for paragraph in paragraphs:
+            self.assertEqual(cache.get_cites(paragraph),
+                             nyccc._paragraph_cites(paragraph, [";"], 0,
+                                                    parser))
+
+    def test_least_recently_used_paragraphs_are_dropped(self):
+        limits = nyccc.CACHE_SHARDS, nyccc.CACHE_MAX_PARAGRAPHS
+        nyccc.CACHE_SHARDS, nyccc.CACHE_MAX_PARAGRAPHS = 1, 3
+        try:
+            parser = nyccc.get_parser()
+            cache = nyccc.ExtractionCache(self.cache_dir, parser)
+            for paragraph in ["a", "b", "c"]:
+                cache.put_cites(paragraph, [])
+            cache.save()
+            cache = nyccc.ExtractionCache(self.cache_dir, parser)
+            self.assertEqual(cache.get_cites("a"), [])
+            cache.put_cites("d", [])
+            cache.save()
+            cache = nyccc.ExtractionCache(self.cache_dir, parser)
+            self.assertEqual([cache.get_cites(paragraph) for paragraph in
+                              ["a", "b", "c", "d"]], [[], None, [], []])
+        finally:
+            nyccc.CACHE_SHARDS, nyccc.CACHE_MAX_PARAGRAPHS = limits
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_compressed.py :
+
+    The compressed and piped manuscripts and bibliographies against the
+    plain files, and the truncated and corrupt ones against the errors
+    they must give.
+"""
+
+import os
+import sys
+import bz2
+import gzip
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import nyccc
+from tests import CorpusTestCase, check, report
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+def _gzip(data):
+    # gzip.compress is not in Python 2
+    from StringIO import StringIO
+    out = StringIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+def compressed_versions(filename):
+    """ Writes the file compressed in the ways nyccc reads them next to it
+    and returns their names. 
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    middle = data.find("\n", len(data)//2)+1
+    versions = {".gz":_gzip(data),
+                ".bz2":bz2.compress(data),
+                # Concatenated streams, e.g. cat a.gz b.gz or pbzip2
+                ".2.gz":_gzip(data[:middle])+_gzip(data[middle:]),
+                ".2.bz2":bz2.compress(data[:middle])+
+                         bz2.compress(data[middle:]),
+                # Zeros after the last stream, e.g. from a tape
+                ".padded.bz2":bz2.compress(data)+"\x00"*1000}
+    if nyccc.lzma is not None:
+        versions[".xz"] = nyccc.lzma.compress(data)
+    filenames = []
+    for suffix, compressed in sorted(versions.items()):
+        with open(filename+suffix, 'wb') as f:
+            f.write(compressed)
+        filenames.append(filename+suffix)
+    return filenames
+
+LINES = [u"Known (K\xe4rkk\xe4inen 2007) and (\u010capek 1920) \U0001f600.",
+         u"", u"(Smith 2001) \u2605\u2605\u2605"+u"\xe4"*100]
+MANUSCRIPT = u"\n".join(LINES).encode('utf-8')+"\n"
+BIBLIOGRAPHY = u"K\xe4rkk\xe4inen, T. 2007. Paper.\n"\
+               u"\u010capek, K. 1920. Play.\nSmith, A. 2001. Book.\n"
+
+def _compressed(data):
+    # The data compressed in each of the formats nyccc reads
+    versions = {"gzip":_gzip(data), "bzip2":bz2.compress(data)}
+    if nyccc.lzma is not None:
+        versions["xz"] = nyccc.lzma.compress(data)
+    return versions
+
+class TestCompressedFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, data):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def _run(self, *args, **kwargs):
+        process = subprocess.Popen([sys.executable, NYCCC]+list(args),
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        output, errors = process.communicate(kwargs.get("stdin", ""))
+        return process.returncode, output, errors
+
+    def test_compression_is_told_by_the_first_bytes(self):
+        # Not by the extension, a .txt can be compressed and a .gz plain
+        for compression, data in _compressed(MANUSCRIPT).items():
+            filename = self._write("thesis.txt", data)
+            self.assertEqual(list(nyccc._read_lines(filename)), LINES,
+                             compression)
+        filename = self._write("thesis.gz", MANUSCRIPT)
+        self.assertEqual(list(nyccc._read_lines(filename)), LINES)
+
+    def test_chunks_split_the_characters_and_the_lines(self):
+        for compression, data in _compressed(MANUSCRIPT).items():
+            filename = self._write("thesis.txt", data+data)
+            for chunk_size in (1, 2, 3, 5, 64):
+                self.assertEqual(list(nyccc._read_lines(filename,
+                                                        chunk_size)),
+                                 LINES+LINES, (compression, chunk_size))
+
+    def test_truncated_and_corrupt_files_are_errors(self):
+        for compression, data in _compressed(MANUSCRIPT).items():
+            middle = len(data)//2
+            for broken in [data[:end] for end in range(3, len(data))]+\
+                          [data[:middle]+chr(ord(data[middle])^0xff)+
+                           data[middle+1:]]:
+                filename = self._write("thesis.txt", broken)
+                self.assertRaises(IOError, list, nyccc._read_lines(
+                    filename, 16))
+
+    def test_broken_file_is_told_in_one_line(self):
+        bibfile = self._write("bib.txt", BIBLIOGRAPHY.encode('utf-8'))
+        data = _gzip(MANUSCRIPT)
+        # Cut in the middle and with a wrong checksum
+        for broken in (data[:len(data)//2],
+                       data[:-8]+chr(ord(data[-8])^0xff)+data[-7:]):
+            textfile = self._write("thesis.txt", broken)
+            returncode, output, errors = self._run(textfile, bibfile)
+            self.assertEqual(returncode, 2)
+            self.assertTrue(errors.startswith("nyccc.py: error: Can not "
+                                              "decompress %s: " % textfile),
+                            errors)
+            self.assertEqual(errors.count("\n"), 1, errors)
+
+    def test_compressed_bibliography_and_standard_input(self):
+        textfile = self._write("thesis.txt", MANUSCRIPT)
+        bibfile = self._write("bib.txt", BIBLIOGRAPHY.encode('utf-8'))
+        expected = self._run(textfile, bibfile)
+        self.assertEqual(expected[0], 0)
+        self.assertIn("#cites: 3\n", expected[1])
+        for compression, data in _compressed(
+                BIBLIOGRAPHY.encode('utf-8')).items():
+            compressed = self._write("bib.txt.compressed", data)
+            self.assertEqual(self._run(textfile, compressed), expected,
+                             compression)
+            self.assertEqual(self._run(textfile, "-", stdin=data), expected,
+                             compression)
+        self.assertEqual(self._run("-", bibfile, stdin=_gzip(MANUSCRIPT)),
+                         expected)
+
+class TestCompressedInput(CorpusTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestCompressedInput, cls).setUpClass()
+        cls.compressed = [(compressed_versions(textfile),
+                           compressed_versions(bibfile))
+                          for textfile, bibfile in cls.corpora]
+
+    def test_lines_are_the_same(self):
+        for (textfile, bibfile), compressed in zip(self.corpora,
+                                                   self.compressed):
+            for filename, versions in zip((textfile, bibfile), compressed):
+                expected = list(nyccc._read_lines(filename))
+                for version in versions:
+                    # Small chunks end the streams and lines in odd places
+                    for chunk_size in (nyccc.READ_CHUNK_SIZE, 1000, 7):
+                        self.assertEqual(list(nyccc._read_lines(version,
+                                                                chunk_size)),
+                                         expected,
+                                         "%s, %d" % (version, chunk_size))
+
+    def test_reports_are_the_same(self):
+        for (textfile, bibfile), (texts, bibs) in zip(self.corpora,
+                                                      self.compressed):
+            expected = report(check(textfile, bibfile))
+            for compressed_textfile, compressed_bibfile in zip(texts, bibs):
+                self.assertEqual(report(check(compressed_textfile,
+                                              compressed_bibfile)),
+                                 expected, compressed_textfile)
+
+    def test_standard_input_is_read_like_a_file(self):
+        textfile, bibfile = self.corpora[0]
+        texts, bibs = self.compressed[0]
+        expected = subprocess.check_output([sys.executable, NYCCC, textfile,
+                                            bibfile])
+        for stdin_file, args in ((textfile, ["-", bibfile]),
+                                 (texts[0], ["-", bibfile]),
+                                 (bibs[0], [textfile, "-"])):
+            with open(stdin_file, 'rb') as stdin:
+                output = subprocess.check_output([sys.executable, NYCCC]+args,
+                                                 stdin=stdin)
+            self.assertEqual(output, expected, stdin_file)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_documents.py :
+
+    The .docx and .odt manuscripts (see _read_manuscript) against the same
+    text as a plain text file.
+"""
+
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+import nyccc
+
+# The paragraphs as a plain text file would have them: the tabs are tabs,
+#  the line breaks are spaces and a note is a paragraph before the one it
+#  is in
+PARAGRAPHS = [u"Introduction (Rasku & Musliu 2013)",
+              u"A split run (Kärkkäinen 2007a, p. 12) and\ta tab.",
+              u"A line break (Smith et al. 2001; Jones 2002) here.",
+              u"Note text (Lax 1998).",
+              u"Virtasen (2010) mukaan   spaces and a note.",
+              u"",
+              u"Last (D'Alembert 2001)."]
+
+DOCX_PARAGRAPHS = [
+    u"<w:p><w:pPr><w:tabs><w:tab w:val='left' w:pos='720'/></w:tabs>"
+    u"</w:pPr><w:r><w:t>Introduction (Rasku &amp; Musliu 2013)</w:t></w:r>"
+    u"</w:p>",
+    # Runs split in the middle of the names, like the spell checkers and
+    #  the revisions do
+    u"<w:p><w:r><w:t xml:space='preserve'>A split run (Kärk</w:t></w:r>"
+    u"<w:r><w:rPr><w:b/></w:rPr><w:t>käinen 20</w:t></w:r>"
+    u"<w:r><w:t>07a, p. 12) and</w:t></w:r><w:r><w:tab/></w:r>"
+    u"<w:r><w:t>a tab.</w:t></w:r></w:p>",
+    u"<w:p><w:r><w:t xml:space='preserve'>A line break (Smith et al.</w:t>"
+    u"<w:br/><w:t>2001; Jones 2002) here.</w:t></w:r></w:p>",
+    # A text box is a paragraph of its own
+    u"<w:p><w:r><w:t xml:space='preserve'>Virtasen (2010) mukaan   </w:t>"
+    u"</w:r><w:r><w:pict><w:txbxContent><w:p><w:r><w:t>Note text "
+    u"(Lax 1998).</w:t></w:r></w:p></w:txbxContent></w:pict></w:r>"
+    u"<w:r><w:t>spaces and a note.</w:t></w:r></w:p>",
+    u"<w:p/>",
+    u"<w:p><w:r><w:t>Last (D'Alem</w:t></w:r><w:r><w:t>bert 2001).</w:t>"
+    u"</w:r></w:p>"]
+
+ODT_PARAGRAPHS = [
+    u"<text:h>Introduction (Rasku &amp; Musliu 2013)</text:h>",
+    u"<text:p>A split run (Kärk<text:span>käinen 20</text:span>07a, p. 12)"
+    u" and<text:tab/>a tab.</text:p>",
+    u"<text:p>A line break (Smith et al.<text:line-break/>2001; Jones 2002)"
+    u" here.</text:p>",
+    # The number of the note is not text
+    u"<text:p>Virtasen (2010) mukaan <text:s text:c='2'/><text:note>"
+    u"<text:note-citation>1</text:note-citation><text:note-body><text:p>"
+    u"Note text (Lax 1998).</text:p></text:note-body></text:note>spaces and"
+    u" a note.</text:p>",
+    u"<text:p/>",
+    u"<text:p>Last (D'Alem<text:span>bert 2001)</text:span>.</text:p>"]
+
+DOCX_XML = u"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>%s<w:sectPr/></w:body></w:document>"""
+
+ODT_XML = u"""<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"><office:body><office:text>%s</office:text></office:body></office:document-content>"""
+
+class TestDocuments(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        self.textfile = os.path.join(self.directory, "thesis.txt")
+        with open(self.textfile, 'wb') as f:
+            f.write(u"\n".join(PARAGRAPHS).encode('utf-8')+"\n")
+        self.documents = [
+            self._write("thesis.docx", "word/document.xml",
+                        DOCX_XML % u"".join(DOCX_PARAGRAPHS)),
+            self._write("thesis.odt", "content.xml",
+                        ODT_XML % u"".join(ODT_PARAGRAPHS))]
+        self.chunk_size = nyccc.READ_CHUNK_SIZE
+
+    def tearDown(self):
+        nyccc.READ_CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, member, xml):
+        filename = os.path.join(self.directory, name)
+        with zipfile.ZipFile(filename, 'w') as archive:
+            archive.writestr(member, xml.encode('utf-8'))
+        return filename
+
+    def test_paragraphs_are_those_of_the_text(self):
+        # Small chunks end the XML in the middle of the tags and names
+        for chunk_size in (self.chunk_size, 7, 1):
+            nyccc.READ_CHUNK_SIZE = chunk_size
+            for document in self.documents:
+                self.assertEqual(list(nyccc._read_manuscript(document)),
+                                 PARAGRAPHS, (document, chunk_size))
+
+    def test_citations_are_those_of_the_text(self):
+        parser = nyccc.get_parser(["ja"]+nyccc.AND_WORDS)
+        expected = nyccc.get_cites_from_file(self.textfile,
+            nyccc.MULTICITE_DELIMETER, parser=parser)
+        self.assertEqual(len(expected), 7)
+        for document in self.documents:
+            self.assertEqual(nyccc.get_cites_from_file(document,
+                nyccc.MULTICITE_DELIMETER, parser=parser), expected,
+                document)
+
+if __name__ == '__main__':
+    unittest.main()
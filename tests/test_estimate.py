@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_estimate.py :
+
+    The estimate mode (see estimate_check) against known intervals and
+    shares of hand-written manuscripts, and against the full check: its
+    lookups in the whole manuscript against the citations of every
+    paragraph, and its exact shares against the summary of cross_check.
+"""
+
+import unittest
+
+import nyccc
+from tests import CorpusTestCase, read_paragraphs, check
+from tests.test_extraction import TRICKY_PARAGRAPHS
+
+def _name(i, prefix):
+    # A capitalized name of its own for each i
+    letters = ""
+    for k in range(3):
+        letters += chr(ord('a')+i%26)
+        i //= 26
+    return prefix+letters
+
+# Each paragraph cites a reference of its own, and every fifth has no
+#  reference. A sixth of the references are not cited.
+PARAGRAPHS = ["Text about (%s 2001) here." % _name(i, "Cited")
+              for i in range(4000)]
+BIBLIOGRAPHY = ["%s, A. 2001. Title." % _name(i, "Cited")
+                for i in range(4000) if i%5]+\
+               ["%s, B. 1999. Other." % _name(i, "Uncited")
+                for i in range(640)]
+
+class TestEstimateIntervals(unittest.TestCase):
+
+    def test_wilson_interval(self):
+        z = nyccc._normal_quantile(0.975)
+        self.assertAlmostEqual(z, 1.959964, 6)
+        for interval, expected in [
+                (nyccc._wilson_interval(5, 10, z), (0.5, 0.236593, 0.763407)),
+                (nyccc._wilson_interval(0, 10, z), (0.0, 0.0, 0.277533)),
+                (nyccc._wilson_interval(0, 0, z), (0.0, 0.0, 1.0)),
+                # Drawn without replacement from 20 and from all 10
+                (nyccc._wilson_interval(5, 10, z, 20),
+                 (0.5, 0.294952, 0.705048)),
+                (nyccc._wilson_interval(5, 10, z, 10), (0.5, 0.5, 0.5))]:
+            for found, value in zip(interval, expected):
+                self.assertAlmostEqual(found, value, 6)
+
+    def test_design_effect_of_clustered_draws(self):
+        # Ten paragraphs of ten citations: all or none of them missing,
+        #  or half of each paragraph missing
+        clustered = [10*10, 5*10*10, 5*10*10, 10*10*10]
+        self.assertAlmostEqual(nyccc._design_effect(10, clustered, 0.5),
+                               10*10/9.0)
+        spread = [10*10, 10*5*5, 10*5*10, 10*10*10]
+        self.assertEqual(nyccc._design_effect(10, spread, 0.5), 1.0)
+        self.assertEqual(nyccc._design_effect(1, clustered, 0.5), 1.0)
+
+    def test_estimate_reads_a_sample_of_a_long_manuscript(self):
+        estimate = nyccc.estimate_check(PARAGRAPHS, BIBLIOGRAPHY,
+                                        margin=0.05)
+        self.assertTrue(estimate.paragraphs_read<len(PARAGRAPHS)/2)
+        self.assertEqual((estimate.num_paragraphs, estimate.num_refs),
+                         (len(PARAGRAPHS), len(BIBLIOGRAPHY)))
+        for found, share in ((estimate.missing_ref, 0.2),
+                             (estimate.missing_cite, 640.0/3840)):
+            self.assertFalse(found.exact)
+            self.assertTrue(found.low<=share<=found.high, (found, share))
+            self.assertTrue(found.high-found.low<=2*0.05, found)
+        # The sample is fixed by the seed
+        self.assertEqual(nyccc.estimate_check(PARAGRAPHS, BIBLIOGRAPHY,
+                                              margin=0.05).missing_ref,
+                         estimate.missing_ref)
+
+    def test_short_manuscript_is_checked_exactly(self):
+        estimate = nyccc.estimate_check(PARAGRAPHS[:50], BIBLIOGRAPHY,
+                                        margin=0.05)
+        self.assertEqual(estimate.paragraphs_read, 50)
+        self.assertEqual(estimate.missing_ref,
+                         nyccc.Estimate(0.2, 0.2, 0.2, 50, True))
+        rate = (len(BIBLIOGRAPHY)-40.0)/len(BIBLIOGRAPHY)
+        self.assertEqual(estimate.missing_cite, nyccc.Estimate(
+            rate, rate, rate, len(BIBLIOGRAPHY), True))
+
+class TestEstimate(CorpusTestCase):
+
+    # Most of the references are not cited
+    REFS = 500
+
+    def _sample(self, paragraphs, parser):
+        return nyccc._ManuscriptSample(paragraphs, nyccc.MULTICITE_DELIMETER,
+                                       parser, None)
+
+    def test_paragraphs_are_normalized_like_one_by_one(self):
+        for textfile, bibfile in self.corpora:
+            paragraphs = read_paragraphs(textfile)
+            self.assertEqual(nyccc._to_ascii_lines(paragraphs),
+                             [nyccc._to_ascii(line) for line in paragraphs])
+        for paragraphs in [TRICKY_PARAGRAPHS,
+                           [u" Spaces ", u"Two\nlines", u""],
+                           ["Bytes (Lax 1998)", u"Müller (2001)"],
+                           ["Utf-8 M\xc3\xbcller (2001)", u"Unicode"]]:
+            self.assertEqual(nyccc._to_ascii_lines(paragraphs),
+                             [nyccc._to_ascii(line) for line in paragraphs])
+
+    def test_cited_before_is_the_first_paragraph_of_a_citation(self):
+        parser = nyccc.get_parser()
+        for textfile, bibfile in self.corpora:
+            sample = self._sample(read_paragraphs(textfile), parser)
+            firsts = {}
+            for i in xrange(len(sample.texts)):
+                for cite in sample.cites(i):
+                    firsts.setdefault(cite, i)
+            # Looked up in a shuffled order, like the estimate does
+            order = range(len(sample.texts))
+            nyccc.random.Random(0).shuffle(order)
+            sample = self._sample(read_paragraphs(textfile), parser)
+            for i in order:
+                for cite in sample.cites(i):
+                    self.assertEqual(sample.cited_before(cite, i),
+                                     firsts[cite]<i, (cite, i))
+
+    def test_is_cited_finds_the_references_of_the_citations(self):
+        parser = nyccc.get_parser()
+        for textfile, bibfile in self.corpora:
+            bib_index = nyccc.BibIndex(nyccc.get_bib_from_file(bibfile),
+                                       parser)
+            sample = self._sample(read_paragraphs(textfile), parser)
+            citing = {}
+            for i in xrange(len(sample.texts)):
+                for cite in sample.cites(i):
+                    for key in bib_index.match(cite, 3)[1]:
+                        citing.setdefault(key, set()).add(cite)
+            self.assertTrue(0<len(citing)<len(bib_index.keys))
+            for key in bib_index.keys:
+                if sample.is_cited(key, bib_index, 3):
+                    self.assertIn(key, citing)
+                elif key in citing:
+                    # Only when no name of the key is cited, not even with
+                    #  a suffix (but e.g. a name in the title)
+                    names = nyccc._namewordre.findall(
+                        key[:parser.yearre.search(key).start()])
+                    for cite in citing[key]:
+                        for author in cite.authors:
+                            for word in nyccc._namewordre.findall(author):
+                                stem = word[:max(2, len(word)-3)]
+                                self.assertFalse([name for name in names
+                                                  if name.startswith(stem)],
+                                                 key)
+
+    def test_exact_shares_are_those_of_the_check(self):
+        parser = nyccc.get_parser()
+        max_share = nyccc.ESTIMATE_MAX_SHARE
+        nyccc.ESTIMATE_MAX_SHARE = 0
+        try:
+            for textfile, bibfile in self.corpora:
+                result = check(textfile, bibfile, parser,
+                               suffix_eat_cnt=3)
+                estimate = nyccc.estimate_check(
+                    nyccc._read_manuscript(textfile),
+                    nyccc.get_bib_from_file(bibfile),
+                    suffix_eat_cnt=3, parser=parser)
+                kinds = [problem.kind for problem in result.problems]
+                self.assertTrue(estimate.missing_ref.exact)
+                self.assertEqual(estimate.missing_ref.rate,
+                                 float(kinds.count("missing-reference"))/
+                                 result.num_unique_cites)
+                self.assertTrue(estimate.missing_cite.exact)
+                self.assertEqual(estimate.missing_cite.rate,
+                                 float(kinds.count("uncited"))/
+                                 result.num_refs)
+        finally:
+            nyccc.ESTIMATE_MAX_SHARE = max_share
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_extraction.py :
+
+    The scan engine against the citations and spans of hand-written
+    paragraphs, and the extraction engines (see CitationParser) against
+    each other and against the regexp path of the original nyccc.
+"""
+
+import unittest
+
+import nyccc
+from tests import CorpusTestCase, read_paragraphs, extract, baseline_extract
+
+# Paragraphs that the generated corpora do not have
+TRICKY_PARAGRAPHS = [
+    u"No citations here at all.",
+    u"A parenthesis (but no year) and a year 2003 without one.",
+    u"An unclosed (Rasku 2013 parenthesis, and Smith (2001) states.",
+    u"Only a year (2009) and (1999b, p. 3) in parenthesis.",
+    u"Nested (see (Smith 2001)) and empty () parentheses (Lax 1998).",
+    u"RESULTS OF THE STUDY ARE SHOWN IN TABLE (Smith & Jones 2006; "
+    u"Rasku et al. 2013, p. 12-14).",
+    u"D'Alembert, Descartes, et al. (1995) and Flycht-Eriksson (2004) write"
+    u" that (Kärkkäinen 2007a; Müller and Ångström 1988).",
+    u"Raskun (2013) mukaan ja Virtasen ym. (2001) mukaan (Huhta 2005).",
+    u"Two text citations Smith (2001) and Jones (2002) (Lax 1990; Young "
+    u"1991; Oldman 1992)",
+    u"Pages (Cotton 2000, p. 112--12) and commas (Ragins, 2001.)",
+]
+
+# Paragraphs and the (citation, text of the span) that the scan engine
+#  finds in them with the separators SEPARATORS, text citations first
+SEPARATORS = [";", "cited in"]
+SCANNED = [
+    (u"No parenthesis Smith 2001, Smith, 2001 or Smith et al. 2001.", []),
+    (u"Smith (2001) and Jones et al. (2002) write.",
+     [((("Smith",), "2001", False), u"Smith (2001)"),
+      ((("Jones",), "2002", False), u"Jones et al. (2002)")]),
+    # The names of a text citation are after the previous parenthesis
+    (u"Before (Lax 1998) Smith (2001) after.",
+     [((("Smith",), "2001", False), u"Smith (2001)"),
+      ((("Lax",), "1998", True), u"Lax 1998")]),
+    (u"Smith (see Lax 1998) and Jones (2002).",
+     [((("Jones",), "2002", False), u"Jones (2002)"),
+      ((("Lax",), "1998", True), u"see Lax 1998")]),
+    (u"Smith & Jones (1999a, p. 4) and (2000) and (Young 1991 cited in "
+     u"Lax 1998).",
+     [((("Smith", "Jones"), "1999a", False), u"Smith & Jones (1999a, p. 4)"),
+      ((("Young",), "1991", True), u"Young 1991"),
+      ((("Lax",), "1998", True), u"Lax 1998")]),
+    (u"Descartes, D'Alembert & Platon (2003; Lax 1998).",
+     [((("Lax",), "1998", True), u"Lax 1998")])]
+
+class TestScanEngine(unittest.TestCase):
+
+    def test_citations_and_spans_of_the_paragraphs(self):
+        parser = nyccc.get_parser(engine="scan")
+        for paragraph, expected in SCANNED:
+            spans = []
+            cites = nyccc._paragraph_cites(nyccc._to_ascii(paragraph),
+                                           SEPARATORS, 0, parser, spans)
+            self.assertEqual([(tuple(cite), paragraph[start:end])
+                              for cite, (start, end) in zip(cites, spans)],
+                             expected, paragraph)
+            self.assertEqual(len(cites), len(spans))
+
+    def test_separator_pattern_is_compiled_once(self):
+        splitter = nyccc._multicite_splitter(SEPARATORS)
+        self.assertIs(nyccc._multicite_splitter(list(SEPARATORS)), splitter)
+        self.assertEqual(splitter.split("Young 1991 cited in Lax 1998; X"),
+                         ["Young 1991 ", " Lax 1998", " X"])
+
+    def test_parsers_are_shared_and_engines_checked(self):
+        self.assertIs(nyccc.get_parser(["ja"], engine="scan"),
+                      nyccc.get_parser(["ja"], engine="scan"))
+        self.assertIsNot(nyccc.get_parser(["ja"], engine="scan"),
+                         nyccc.get_parser(["ja"], engine="regex"))
+        self.assertRaises(ValueError, nyccc.get_parser, engine="grep")
+
+class TestExtractionEngines(CorpusTestCase):
+
+    def _paragraphs(self):
+        for textfile, bibfile in self.corpora:
+            yield read_paragraphs(textfile)
+        yield TRICKY_PARAGRAPHS
+
+    def test_engines_find_the_same_citations_and_spans(self):
+        for paragraphs in self._paragraphs():
+            expected = extract(paragraphs, nyccc.get_parser(engine="regex"))
+            self.assertTrue(sum(len(cites) for cites, spans in expected))
+            for engine in nyccc.EXTRACTION_ENGINES:
+                found = extract(paragraphs, nyccc.get_parser(engine=engine))
+                for i, (paragraph_found, paragraph_expected) in \
+                        enumerate(zip(found, expected)):
+                    self.assertEqual(paragraph_found, paragraph_expected,
+                        "%s engine, paragraph %r" % (engine, paragraphs[i]))
+
+    def test_engines_find_the_citations_of_the_original(self):
+        for paragraphs in self._paragraphs():
+            expected = baseline_extract(paragraphs,
+                                        nyccc.get_parser(engine="regex"))
+            for engine in nyccc.EXTRACTION_ENGINES:
+                found = [cites for cites, spans in
+                         extract(paragraphs, nyccc.get_parser(engine=engine))]
+                for i, (paragraph_found, paragraph_expected) in \
+                        enumerate(zip(found, expected)):
+                    self.assertEqual(paragraph_found, paragraph_expected,
+                        "%s engine, paragraph %r" % (engine, paragraphs[i]))
+
+    def test_iter_cites_reads_the_same_from_the_file(self):
+        for textfile, bibfile in self.corpora:
+            expected = [cite for cites in baseline_extract(
+                            read_paragraphs(textfile),
+                            nyccc.get_parser(engine="regex"))
+                        for cite in cites]
+            for engine in nyccc.EXTRACTION_ENGINES:
+                found = nyccc.get_cites_from_file(textfile,
+                    nyccc.MULTICITE_DELIMETER,
+                    parser=nyccc.get_parser(engine=engine))
+                self.assertEqual(found, expected, engine)
+
+if __name__ == '__main__':
+    unittest.main()
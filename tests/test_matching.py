@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_matching.py :
+
+    BibIndex.match against the linear scan of the bibliography keys (and
+    full references) that the original nyccc matched the citations with.
+"""
+
+import unittest
+
+import nyccc
+from tests import CorpusTestCase, read_paragraphs
+
+# References that the generated bibliographies may not have
+REFERENCES = [u"Kärkkäinen, T. 2007. Uncited paper.",
+              u"Kärkkäinen, T. 2007a. Another paper.",
+              u"Ångström, A. & Müller, M. 1988. Physics.",
+              u"D'Alembert, J., Descartes, R. & Platon, P. 2001. Encyclopedie.",
+              u"Flycht-Eriksson, A. 2004b. Dialogue.",
+              u"Laxton, L. 1998. Not by Lax.",
+              u"Smith, A. (ed.) 2003. Edited by Jones.",
+              u"Čapek, K. 1920. R.U.R.",
+              u"Smith, A. 2001. Twice.",
+              u"Smith, A. 2001. Twice."]
+
+def baseline_find(authors, year, bib_keys, full_bib):
+    """ The _find_cite_in_bib of the original nyccc """
+    cite_matched = False
+    matched_refs = []
+    for ref in bib_keys:
+        match = True
+        # Require author order
+        author_search_pos = 0
+        for author in authors:
+            search_result = ref.find(author, author_search_pos)
+            if search_result==-1:
+                match = False
+                break
+            author_search_pos = search_result
+        if match and year in ref:
+            cite_matched = True
+            matched_refs.append(ref)
+    # As a backup, do a full search (for example if names are editors)
+    if full_bib and not cite_matched:
+        for key, full_ref in zip(bib_keys, full_bib):
+            match = True
+            for author in authors:
+                if author not in full_ref:
+                    match = False
+                    break
+            if match and year in full_ref:
+                cite_matched = True
+                matched_refs.append(key)
+    return cite_matched, matched_refs
+
+def baseline_match(cite, suffix_eat_cnt, bib_keys, full_bib):
+    """ The matching of a citation in the cross_check of the original
+    nyccc, where upto suffix_eat_cnt letters are eaten from the names of
+    the text citations.
+    """
+    authors, year, complete = cite
+    cite_has_target, refs = baseline_find(authors, year, bib_keys, full_bib)
+    if not cite_has_target and not complete:
+        for eat in range(1, suffix_eat_cnt+1):
+            authors_wo_suffix = [nyccc._get_author_without_suffix(author, eat)
+                                 for author in authors]
+            cite_has_target, refs = baseline_find(authors_wo_suffix, year,
+                                                  bib_keys, full_bib)
+            if cite_has_target:
+                break
+    return cite_has_target, refs
+
+def _variants(names, year):
+    # Citations of some of the names of a reference with suffixes, in the
+    #  wrong order, with "et al." (only the first ones) and other years
+    years = [year, year[:4]+"b", str(int(year[:4])+1)]
+    lists = [names[:1], names[:2], names[::-1], names[-1:]]
+    for authors in lists:
+        if not authors:
+            continue
+        for cite_year in years:
+            yield nyccc.Citation(authors, cite_year, True)
+        for suffix in ["n", "in", "sen"]:
+            yield nyccc.Citation([author+suffix for author in authors],
+                                 year, False)
+            # The suffix replaces letters too ("Virtanen", "Virtasen")
+            yield nyccc.Citation([author[:-2]+suffix for author in authors],
+                                 year, False)
+
+class TestBibIndexMatching(CorpusTestCase):
+
+    # The linear scan is slow
+    SEEDS = [0, 1]
+
+    def _cases(self):
+        # A bibliography and the citations to match against it
+        parser = nyccc.get_parser()
+        for textfile, bibfile in self.corpora:
+            bib = nyccc.get_bib_from_file(bibfile)+\
+                  [nyccc._to_ascii(ref) for ref in REFERENCES]
+            cites = set()
+            for cites_of_paragraph in (
+                    nyccc._paragraph_cites(nyccc._to_ascii(line), [";"], 0,
+                                           parser)
+                    for line in read_paragraphs(textfile)):
+                for cite in cites_of_paragraph:
+                    cites.add(cite)
+                    cites.add(nyccc.Citation(cite.authors, cite.year, False))
+            for bibref in bib:
+                yearmatch = parser.yearre.search(bibref)
+                if yearmatch:
+                    names = nyccc._namewordre.findall(
+                        bibref[:yearmatch.start()])
+                    cites.update(_variants(names, yearmatch.group(1)))
+            # Unicode and names that are not a name to the index
+            cites.update([nyccc.Citation([u"K\xe4rkk\xe4inen"], "2007", True),
+                          nyccc.Citation(["Karkkaisen"], "2007", False),
+                          nyccc.Citation(["ed."], "2003", True),
+                          nyccc.Citation(["Smith", "Jones"], "2003", True),
+                          nyccc.Citation([], "2001", True)])
+            yield bib, sorted(cites)
+
+    def test_matches_are_those_of_the_linear_scan(self):
+        parser = nyccc.get_parser()
+        for bib, cites in self._cases():
+            bib_index = nyccc.BibIndex(bib, parser)
+            found = 0
+            for suffix_eat_cnt in (0, 2, 3):
+                for cite in cites:
+                    expected = baseline_match(cite, suffix_eat_cnt,
+                                              bib_index.keys, bib)
+                    self.assertEqual(bib_index.match(cite, suffix_eat_cnt),
+                                     expected, (cite, suffix_eat_cnt))
+                    found += expected[0]
+            # Most, but not all, of the variants have a reference
+            self.assertTrue(0<found<3*len(cites))
+
+    def test_find_is_the_linear_scan(self):
+        parser = nyccc.get_parser()
+        for bib, cites in self._cases():
+            bib_index = nyccc.BibIndex(bib, parser)
+            for cite in cites:
+                for full_search in (True, False):
+                    self.assertEqual(
+                        bib_index.find(cite.authors, cite.year, full_search),
+                        baseline_find(cite.authors, cite.year, bib_index.keys,
+                                      bib if full_search else None), cite)
+
+if __name__ == '__main__':
+    unittest.main()
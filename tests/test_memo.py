@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_memo.py :
+
+    The bounds and the counts of the memos (see _Memo) on hand-written
+    entries and citations, and checking with the parse and match memos
+    (see PARSE_MEMO_SIZE and MATCH_MEMO_SIZE) warm, evicting or off
+    against each other.
+"""
+
+import unittest
+
+import nyccc
+from tests import CorpusTestCase, report
+
+class TestMemoBounds(unittest.TestCase):
+
+    def test_memo_keeps_the_used_entries_within_its_size(self):
+        memo = nyccc._Memo(4)
+        for key in "abc":
+            memo.put(key, key.upper())
+        # "a" is used, so it moves to the newer generation with "c"
+        self.assertEqual(memo.get("a"), "A")
+        for key in "de":
+            memo.put(key, key.upper())
+        self.assertEqual([memo.get(key) for key in "abcde"],
+                         ["A", None, None, "D", "E"])
+        self.assertEqual((memo.hits, memo.misses), (4, 2))
+        for key in range(100):
+            memo.put(key, key)
+            self.assertTrue(len(memo)<=4)
+
+    def test_memo_of_size_zero_keeps_nothing(self):
+        memo = nyccc._Memo(0)
+        memo.put("a", None)
+        self.assertIs(memo.get("a", nyccc._MISSING), nyccc._MISSING)
+        self.assertEqual((len(memo), memo.hits, memo.misses), (0, 0, 1))
+
+class TestMemoUse(unittest.TestCase):
+
+    def test_repeated_candidates_are_parsed_once(self):
+        parser = nyccc.CitationParser()
+        stats = nyccc.CheckStats()
+        line = "As shown (Rasku et al. 2013a; Smith 2001) and (Rasku et al. "\
+               "2013a)."
+        found = [nyccc._paragraph_cites(line, [";"], 0, parser, None, stats)
+                 for i in range(2)]
+        self.assertEqual(found[1], found[0])
+        self.assertEqual([tuple(cite) for cite in found[0]],
+                         [(("Rasku",), "2013a", True),
+                          (("Smith",), "2001", True),
+                          (("Rasku",), "2013a", True)])
+        # "Rasku et al. 2013a" and "Smith 2001" are parsed, the rest are
+        #  hits
+        self.assertEqual((parser.parse_memo.misses, parser.parse_memo.hits),
+                         (2, 4))
+        self.assertEqual((stats.counts["parse memo misses"],
+                          stats.counts["parse memo hits"]), (2, 4))
+
+    def test_matches_are_memoized_by_the_suffix_eating(self):
+        bib_index = nyccc.BibIndex(["Virtanen, V. 2010. Fin."])
+        cite = nyccc.Citation(["Virtasen"], "2010", False)
+        self.assertEqual(bib_index.match(cite, 0), (False, []))
+        matched = bib_index.match(cite, 3)
+        self.assertEqual(matched, (True, ["Virtanen, V. 2010. "]))
+        # The memo gives a list of its own to each caller
+        matched[1].append("changed")
+        self.assertEqual(bib_index.match(cite, 3),
+                         (True, ["Virtanen, V. 2010. "]))
+        self.assertEqual((bib_index.match_memo.misses,
+                          bib_index.match_memo.hits), (2, 1))
+
+class TestMemos(CorpusTestCase):
+
+    def _reports(self, memo_size=None):
+        # The manuscripts of all the corpora against the bibliography of
+        #  the first one in one process, like in the batch mode. With a
+        #  memo_size the memos of a new parser and bibliography are
+        #  replaced with ones of that size.
+        parser = nyccc.CitationParser()
+        if memo_size is not None:
+            parser.parse_memo = nyccc._Memo(memo_size)
+        bib_index = nyccc.BibIndex(nyccc.get_bib_from_file(
+            self.corpora[0][1]), parser)
+        if memo_size is not None:
+            bib_index.match_memo = nyccc._Memo(memo_size)
+            bib_index._full_refs_memo = nyccc._Memo(memo_size)
+        reports = []
+        for textfile, bibfile in self.corpora+self.corpora:
+            cites = list(nyccc.iter_cites(nyccc._read_manuscript(textfile),
+                                          parser=parser))
+            reports.append( (cites, report(nyccc.cross_check(
+                sorted(nyccc.iter_unique_cites(cites)), bib_index,
+                nyccc.EAT_SUFFIX_CHARS, parser))) )
+        return reports, parser, bib_index
+
+    def test_memos_do_not_change_the_results(self):
+        expected, parser, bib_index = self._reports(0)
+        self.assertFalse(parser.parse_memo.hits or bib_index.match_memo.hits)
+        for memo_size in (2, 64, None):
+            found, parser, bib_index = self._reports(memo_size)
+            # The small memos forget before the citations repeat
+            if memo_size is None:
+                self.assertTrue(parser.parse_memo.hits)
+                self.assertTrue(bib_index.match_memo.hits)
+            for i, (found_report, expected_report) in \
+                    enumerate(zip(found, expected)):
+                self.assertEqual(found_report, expected_report,
+                                 "memo size %s, manuscript %d" % (memo_size,
+                                                                  i))
+
+if __name__ == '__main__':
+    unittest.main()
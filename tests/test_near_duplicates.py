@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_near_duplicates.py :
+
+    BibIndex.near_duplicates against the groups of hand-written references
+    and against comparing all the pairs of references.
+"""
+
+import random
+import unittest
+
+import nyccc
+from tests import CorpusTestCase
+
+def _similarity(a, b):
+    return len(a & b)/float(len(a | b))
+
+BIBLIOGRAPHY = [
+    "Rasku, J. & Musliu, N. 2013. Automating the parameter selection in "
+    "VRP. Annals of OR.",
+    "Rasku, J., and Musliu, N. 2013 Automating the parameter selection in "
+    "VRP, Annals of OR",
+    "Smith, A. B. 2001. A book about cats and dogs. Publisher.",
+    "Smith, A. 2001. A book about cats and dogs. Publisher.",
+    "Smith, A. 2002. A book about cats and dogs. Publisher.",
+    "Jones, J. 2005. Completely different work on fish. Other.",
+    "Jones, J. 2005. Completely different work on fish. Other.",
+    "Lax, L. 1998. Old paper on birds. Journal.",
+    "Young, Y. 1991. Older paper on trees. Journal."]
+
+def _brute_force_clusters(word_sets, threshold):
+    # The groups linked by similar pairs, comparing every pair
+    groups = [set([i]) for i in range(len(word_sets))]
+    for i in range(len(word_sets)):
+        for j in range(i+1, len(word_sets)):
+            if _similarity(word_sets[i], word_sets[j])>=threshold:
+                merged = groups[i] | groups[j]
+                for k in merged:
+                    groups[k] = merged
+    return sorted(set(tuple(sorted(group)) for group in groups
+                      if len(group)>1))
+
+class TestNearDuplicateGroups(unittest.TestCase):
+
+    def test_words_of_a_reference(self):
+        self.assertEqual(nyccc._near_duplicate_words(
+            "Smith, A. B. & Jones and Lax 2001. Title-Word!", ["and"]),
+            frozenset(["smith", "jones", "lax", "2001", "title", "word"]))
+
+    def test_initials_punctuation_and_year_typos_are_grouped(self):
+        bib_index = nyccc.BibIndex(BIBLIOGRAPHY)
+        # The Jones references have the same key, so they are reported as
+        #  duplicates already
+        self.assertEqual([problem.references for problem in
+                          bib_index.near_duplicates()],
+                         [BIBLIOGRAPHY[0:2], BIBLIOGRAPHY[2:5]])
+        # Such a low similarity is found only with more and shorter bands
+        self.assertEqual([problem.references for problem in
+                          bib_index.near_duplicates(threshold=0.25, bands=60,
+                                                    rows=1)],
+                         [BIBLIOGRAPHY[0:2], BIBLIOGRAPHY[2:5],
+                          BIBLIOGRAPHY[7:9]])
+        self.assertEqual(set(problem.kind for problem in
+                             bib_index.near_duplicates()),
+                         set(["near-duplicate"]))
+
+    def test_clusters_are_those_of_all_the_pairs(self):
+        # With many bands of one row every similar pair shares a bucket
+        rnd = random.Random(0)
+        words = ["w%d" % i for i in range(12)]
+        for i in range(20):
+            word_sets = [frozenset(rnd.sample(words, rnd.randint(1, 5)))
+                         for k in range(30)]
+            for threshold in (0.5, 0.7):
+                self.assertEqual(
+                    [tuple(cluster) for cluster in
+                     nyccc._near_duplicate_clusters(word_sets, threshold, 60,
+                                                    1, max_bucket=30)],
+                    _brute_force_clusters(word_sets, threshold))
+
+class TestNearDuplicates(CorpusTestCase):
+
+    def _bibliography(self, bibfile):
+        # Copies of some of the references with another key and a typo of
+        #  their own at the end
+        bib = nyccc.get_bib_from_file(bibfile)
+        planted = []
+        for ref in bib[::10]:
+            ref = ref.replace(".", "", 1)
+            planted.append(ref[:-3]+ref[-2]+ref[-3]+ref[-1])
+        return bib+planted, planted
+
+    def test_planted_near_duplicates_are_found(self):
+        for textfile, bibfile in self.corpora:
+            bib, planted = self._bibliography(bibfile)
+            grouped = set(ref for problem in
+                          nyccc.BibIndex(bib).near_duplicates()
+                          for ref in problem.references)
+            for ref in planted:
+                self.assertIn(ref, grouped)
+
+    def test_groups_are_linked_by_similar_pairs(self):
+        threshold = nyccc.NEAR_DUPLICATE_THRESHOLD
+        for textfile, bibfile in self.corpora:
+            bib, planted = self._bibliography(bibfile)
+            words = dict((ref, nyccc._near_duplicate_words(ref, ["and"]))
+                         for ref in bib)
+            for problem in nyccc.BibIndex(bib).near_duplicates():
+                for ref in problem.references:
+                    self.assertTrue(max(_similarity(words[ref], words[other])
+                                        for other in problem.references
+                                        if other!=ref)>=threshold)
+
+if __name__ == '__main__':
+    unittest.main()
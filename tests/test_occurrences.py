@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_occurrences.py :
+
+    The places of the citations (see OccurrenceIndex and _original_spans)
+    on lines with accents, decomposed accents, ligatures and dropped
+    symbols against the text of the citation in the original line.
+"""
+
+import os
+import re
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unicodedata import normalize
+
+import nyccc
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+# The lines and the text of each of their citations, in the order of the
+#  citations of the line
+LINES = [
+    (u"Known (Kärkkäinen 2007a, s. 12–14) and (Ångström & Müller 1988).",
+     [u"Kärkkäinen 2007a, s. 12–14", u"Ångström & Müller 1988"]),
+    (u"Text Kärkkäisen (2007) mukaan ja Čapekin (1920) mukaan.",
+     [u"Kärkkäisen (2007)", u"Čapekin (1920)"]),
+    # Ligatures fold to many chars and the symbols to none
+    (u"Ligatures ﬁnal (Staﬀord 2001; Eﬃe 2002) and ½ (Smith 2003).",
+     [u"Staﬀord 2001", u"Eﬃe 2002", u"Smith 2003"]),
+    (u"Symbols € ★ 😀 (★Smith 2001★) — (Čapek 1920) ™ (Lax ja Young 1998).",
+     [u"Smith 2001", u"Čapek 1920", u"Lax ja Young 1998"]),
+    (u"Letters Ǆukić (2010) and (Ｓｍｉｔｈ 2001; Smith ２００２).",
+     [u"Ǆukić (2010)", u"Ｓｍｉｔｈ 2001", u"Smith ２００２"]),
+    # The byte order mark and the no-break spaces are stripped
+    (u"\ufeff\xa0\xa0Leading (Smith 2001) space.", [u"Smith 2001"])]
+
+class TestOccurrences(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = nyccc.get_parser(["ja"]+nyccc.AND_WORDS)
+
+    def _spans(self, lines):
+        # The citations and the (offset, length) of the occurrences on
+        #  each line
+        occurrences = nyccc.OccurrenceIndex()
+        cites = list(nyccc.iter_cites(lines, parser=self.parser,
+                                      occurrences=occurrences))
+        found = [[] for line in lines]
+        for cite in nyccc.iter_unique_cites(cites):
+            for paragraph, offset, length in occurrences.locations(cite):
+                found[paragraph].append((offset, length))
+        return cites, [sorted(spans) for spans in found]
+
+    def test_spans_are_the_citations_of_the_line(self):
+        for form in ("NFC", "NFD"):
+            lines = [normalize(form, line) for line, texts in LINES]
+            for source in (lines, [line.encode('utf-8')+"\n"
+                                   for line in lines]):
+                cites, found = self._spans(source)
+                self.assertEqual(len(cites), sum(len(texts) for line, texts
+                                                 in LINES))
+                for line, spans, (nfc_line, texts) in zip(lines, found,
+                                                          LINES):
+                    self.assertEqual([line[offset:offset+length]
+                                      for offset, length in spans],
+                                     [normalize(form, text)
+                                      for text in texts], line)
+
+    def test_decomposed_accents_give_the_same_citations(self):
+        self.assertEqual(
+            self._spans([normalize("NFD", line) for line, t in LINES])[0],
+            self._spans([line for line, t in LINES])[0])
+
+    def test_spans_are_those_of_the_char_by_char_folding(self):
+        # _fold_with_offsets knows the offset of each folded char, so
+        #  every span of the folded line must map to the same place
+        rnd = random.Random(0)
+        chars = u"aZ 1(;.\t\xe4\xc5\u010c\u0308\u030a\ufb03\ufb00\xbd\u2605"\
+                u"\u20ac\u2014\uff33\u01c4\xa0"
+        for i in range(500):
+            line = u"".join(rnd.choice(chars)
+                            for k in range(rnd.randint(0, 30)))
+            folded, offsets = nyccc._fold_with_offsets(line)
+            self.assertEqual(folded, nyccc._to_ascii(line))
+            spans = [(start, end) for start in range(len(folded))
+                     for end in range(start+1, len(folded)+1)]
+            self.assertEqual(nyccc._original_spans(line, folded, spans),
+                             [(offsets[start], offsets[end-1]+1-offsets[start])
+                              for start, end in spans], line)
+
+    def test_report_columns_point_at_the_citations(self):
+        directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        try:
+            textfile = os.path.join(directory, "thesis.txt")
+            lines = [normalize("NFD", line) for line, texts in LINES]
+            with open(textfile, 'wb') as f:
+                f.write(u"\n".join(lines).encode('utf-8')+"\n")
+            bibfile = os.path.join(directory, "bib.txt")
+            with open(bibfile, 'wb') as f:
+                f.write("Nobody, N. 1900. Uncited.\n")
+            report = subprocess.check_output([sys.executable, NYCCC,
+                textfile, bibfile, "-a", "ja", "-v", "2"]).decode('utf-8')
+        finally:
+            shutil.rmtree(directory)
+        starts = [(int(line), int(column)) for line, column in
+                  re.findall(r"(\d+):(\d+)", report)]
+        expected = []
+        for i, (nfc_line, texts) in enumerate(LINES):
+            for text in texts:
+                expected.append((i+1,
+                                 lines[i].index(normalize("NFD", text))+1))
+        self.assertEqual(sorted(starts), sorted(expected))
+
+if __name__ == '__main__':
+    unittest.main()
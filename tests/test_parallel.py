@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_parallel.py :
+
+    Matching the citations in parallel (cross_check with jobs) against
+    the problems and counts of hand-written citations, and against
+    matching them in one process.
+"""
+
+import unittest
+
+import nyccc
+from tests import CorpusTestCase, check, report
+
+BIBLIOGRAPHY = ["Smith, A. 2001. One.", "Smith, A. 2001. Dup.",
+                "Jones, J. 2005a. A.", "Jones, J. 2005b. B.",
+                "Lax, L. 1998. Old.", "Young, Y. 1991. Older.",
+                "Virtanen, V. 2010. Fin.", "Zed, Z. 1980. Never."]
+
+CITATIONS = sorted([nyccc.Citation(["Smith"], "2001", True),
+                    nyccc.Citation(["Jones"], "2005", True),
+                    nyccc.Citation(["Lax"], "1998", True),
+                    nyccc.Citation(["Laxx"], "1998", True),
+                    nyccc.Citation(["Nobody"], "1990", True),
+                    nyccc.Citation(["Virtasen"], "2010", False),
+                    nyccc.Citation(["Young"], "1991", True)])
+
+# What each of the citations gives, in the order of CITATIONS
+PROBLEMS = [
+    ("ambiguous", (("Jones",), "2005", True), BIBLIOGRAPHY[2:4]),
+    ("missing-reference", (("Laxx",), "1998", True), BIBLIOGRAPHY[4:5]),
+    ("missing-reference", (("Nobody",), "1990", True), []),
+    ("ambiguous", (("Smith",), "2001", True), BIBLIOGRAPHY[0:2]),
+    ("uncited", None, BIBLIOGRAPHY[7:8])]
+
+class TestParallelMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.min_cites = nyccc.PARALLEL_MATCH_MIN_CITES
+        nyccc.PARALLEL_MATCH_MIN_CITES = 0
+
+    def tearDown(self):
+        nyccc.PARALLEL_MATCH_MIN_CITES = self.min_cites
+
+    def test_chunks_are_merged_in_order(self):
+        # With this few citations each chunk has one, so the references
+        #  cited in other chunks must not be reported as uncited
+        for jobs in (1, 2, 3):
+            result = nyccc.cross_check(iter(CITATIONS), BIBLIOGRAPHY, 3,
+                                       suggestions=1, jobs=jobs)
+            self.assertEqual([(problem.kind, problem.cite and
+                               tuple(problem.cite), problem.references)
+                              for problem in result.problems], PROBLEMS,
+                             "%d jobs" % jobs)
+            self.assertEqual(result.num_unique_cites, len(CITATIONS))
+            self.assertEqual(dict(result.ref_counts),
+                             {"Smith, A. 2001. ":2, "Jones, J. 2005a. ":1,
+                              "Jones, J. 2005b. ":1, "Lax, L. 1998. ":1,
+                              "Young, Y. 1991. ":1, "Virtanen, V. 2010. ":1})
+
+    def test_counts_of_the_workers_are_merged(self):
+        counts = []
+        for jobs in (1, 2):
+            stats = nyccc.CheckStats()
+            nyccc.cross_check(CITATIONS, nyccc.BibIndex(BIBLIOGRAPHY), 3,
+                              suggestions=1, jobs=jobs, stats=stats)
+            counts.append(dict(stats.counts))
+        self.assertEqual(counts[0]["cites checked"], len(CITATIONS))
+        self.assertEqual(counts[1], counts[0])
+
+class TestParallelMatching(CorpusTestCase):
+
+    def setUp(self):
+        # The corpora are small, so the workers are used for any number of
+        #  citations
+        self.min_cites = nyccc.PARALLEL_MATCH_MIN_CITES
+        nyccc.PARALLEL_MATCH_MIN_CITES = 0
+
+    def tearDown(self):
+        nyccc.PARALLEL_MATCH_MIN_CITES = self.min_cites
+
+    def test_jobs_give_the_same_report_with_suggestions(self):
+        for textfile, bibfile in self.corpora:
+            expected = report(check(textfile, bibfile, suggestions=3, jobs=1))
+            self.assertIn("Did you mean", expected)
+            for jobs in (2, 4):
+                self.assertEqual(report(check(textfile, bibfile,
+                                              suggestions=3, jobs=jobs)),
+                                 expected, "%d jobs" % jobs)
+
+    def test_jobs_give_the_same_report_when_profiled(self):
+        for textfile, bibfile in self.corpora:
+            expected = report(check(textfile, bibfile, suggestions=3, jobs=1))
+            for jobs in (1, 2):
+                stats = nyccc.CheckStats()
+                self.assertEqual(report(check(textfile, bibfile,
+                                              suggestions=3, jobs=jobs,
+                                              stats=stats)),
+                                 expected, "%d jobs" % jobs)
+                self.assertIn("suggest", stats.seconds)
+
+if __name__ == '__main__':
+    unittest.main()
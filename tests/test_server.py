@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_server.py :
+
+    The check server (see nyccc_server.py) driven with framed JSON-RPC
+    messages over in-memory streams.
+"""
+
+import json
+import unittest
+from StringIO import StringIO
+
+import nyccc_server
+
+BIBLIOGRAPHY = u"""Rasku, J. & Hotokka, M. 2013. Chemistry paper.
+Smith, A. 2001. A book.
+Smith, B. 2001. Another book.
+Kärkkäinen, T. 2007. Uncited paper."""
+
+MANUSCRIPT = u"""First (Rasku & Hotokka 2013) and (Lax 1998).
+Second (Smith 2001).
+Third without citations."""
+
+def _framed(*messages):
+    # The messages in the LSP framing, as a stream to read them from
+    out = StringIO()
+    for message in messages:
+        if isinstance(message, dict):
+            message = json.dumps(message)
+        out.write("Content-Length: %d\r\n\r\n%s" % (len(message), message))
+    return StringIO(out.getvalue())
+
+def _read_all(wfile):
+    rfile = StringIO(wfile.getvalue())
+    messages = []
+    while True:
+        message = nyccc_server.read_message(rfile)
+        if message is None:
+            return messages
+        messages.append(message)
+
+def _notification(method, params):
+    return {"jsonrpc":"2.0", "method":method, "params":params}
+
+def _request(id, method, params):
+    return {"jsonrpc":"2.0", "id":id, "method":method, "params":params}
+
+class TestCheckServer(unittest.TestCase):
+
+    uri = "file:///thesis.txt"
+
+    def _serve(self, *messages):
+        # The messages the server sends for these, after the bibliography
+        #  and the manuscript have been opened
+        wfile = StringIO()
+        nyccc_server.serve(self.server, _framed(*messages), wfile)
+        return _read_all(wfile)
+
+    def _diagnostics(self, messages, uri=None):
+        # The (line, message) of the last diagnostics pushed for the uri
+        pushed = [message["params"]["diagnostics"] for message in messages
+                  if message.get("method")=="textDocument/publishDiagnostics"
+                  and message["params"]["uri"]==(uri or self.uri)]
+        return [(diagnostic["range"]["start"]["line"], diagnostic["message"])
+                for diagnostic in pushed[-1]] if pushed else None
+
+    def setUp(self):
+        self.server = nyccc_server.CheckServer(None)
+        self.opened = self._serve(
+            _notification("nyccc/bibliographyChanged",
+                          {"uri":"file:///bib.txt", "text":BIBLIOGRAPHY}),
+            _notification("textDocument/didOpen",
+                          {"textDocument":{"uri":self.uri,
+                                           "text":MANUSCRIPT}}))
+
+    def test_open_document_is_checked(self):
+        diagnostics = self._diagnostics(self.opened)
+        self.assertEqual([line for line, message in diagnostics], [0, 1])
+        self.assertIn("Lax 1998", diagnostics[0][1])
+        self.assertIn("might not be unique", diagnostics[1][1])
+        self.assertEqual(self._diagnostics(self.opened, "file:///bib.txt"),
+                         [(3, "Reference is not cited")])
+
+    def test_changed_paragraph_is_checked_again(self):
+        paragraphs = list(self.server.documents[self.uri])
+        messages = self._serve(_notification("nyccc/paragraphChanged",
+            {"uri":self.uri, "line":2, "text":u"Now (Kärkkäinen 2007)."}))
+        # The other paragraphs are not parsed again
+        for i in (0, 1):
+            self.assertIs(self.server.documents[self.uri][i], paragraphs[i])
+        # The problems of the document did not change, but the reference
+        #  is now cited
+        self.assertIsNone(self._diagnostics(messages))
+        self.assertEqual(self._diagnostics(messages, "file:///bib.txt"), [])
+
+        messages = self._serve(_notification("nyccc/paragraphChanged",
+            {"uri":self.uri, "line":0, "text":u"First (Lax 1999)."}))
+        diagnostics = self._diagnostics(messages)
+        self.assertEqual([line for line, message in diagnostics], [0, 1])
+        self.assertIn("Lax 1999", diagnostics[0][1])
+        self.assertEqual(self._diagnostics(messages, "file:///bib.txt"),
+                         [(0, "Reference is not cited")])
+
+    def test_paragraph_can_be_added_after_the_last(self):
+        messages = self._serve(_notification("nyccc/paragraphChanged",
+            {"uri":self.uri, "line":3, "text":u"Fourth (Young 1966)."}))
+        self.assertEqual(len(self.server.documents[self.uri]), 4)
+        self.assertEqual(self._diagnostics(messages)[-1][0], 3)
+
+    def test_malformed_params_are_invalid(self):
+        for line in ["a", 3e6, 3000000, 5, -1, None, True]:
+            messages = self._serve(_request(1, "nyccc/paragraphChanged",
+                {"uri":self.uri, "line":line, "text":u"(Lax 1998)"}))
+            self.assertEqual(len(messages), 1, line)
+            self.assertEqual(messages[0]["id"], 1)
+            self.assertEqual(messages[0]["error"]["code"],
+                             nyccc_server.INVALID_PARAMS, line)
+            self.assertEqual(len(self.server.documents[self.uri]), 3)
+        messages = self._serve(
+            _request(2, "textDocument/didOpen", {"textDocument":{}}),
+            "{not json",
+            _request(3, "shutdown", {}))
+        self.assertEqual([message["id"] for message in messages],
+                         [2, None, 3])
+        self.assertEqual(messages[0]["error"]["code"],
+                         nyccc_server.INVALID_PARAMS)
+        self.assertEqual(messages[1]["error"]["code"],
+                         nyccc_server.PARSE_ERROR)
+        self.assertIsNone(messages[2]["result"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_store.py :
+
+    Checks stored with --store (see nyccc_store.py) and the queries of
+    "nyccc.py query" against what the checks themselves report.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import nyccc
+import nyccc_store
+from tests import check
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+MANUSCRIPTS = {
+    "a.txt":u"Known (Smith 2001) and (Lax 1998), unknown (Nobody 1990).\n"
+            u"Again (Nobody 1990) and an ambiguous (Jones 2005).\n",
+    "b.txt":u"Known (Smith 2001) and (Young 1991), unknown (Nobody 1990).\n"}
+
+# Two references have the key of an earlier one
+BIBLIOGRAPHY = u"""Smith, A. 2001. A book.
+Smith, A. 2001. Another book.
+Lax, L. 1998. Old paper.
+Jones, J. 2005a. First.
+Jones, J. 2005b. Second.
+Kärkkäinen, T. 2007. Uncited paper.
+Kärkkäinen, T. 2007. Uncited paper, again.
+Young, Y. 1991. Older paper.
+"""
+
+class TestCitationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        self.docs = os.path.join(self.directory, "docs")
+        os.mkdir(self.docs)
+        for name, text in MANUSCRIPTS.items():
+            with open(os.path.join(self.docs, name), 'wb') as f:
+                f.write(text.encode('utf-8'))
+        self.bibfile = os.path.join(self.directory, "bib.txt")
+        with open(self.bibfile, 'wb') as f:
+            f.write(BIBLIOGRAPHY.encode('utf-8'))
+        self.database = os.path.join(self.directory, "archive.db")
+        # Stored twice, the second check replaces the first
+        for i in range(2):
+            subprocess.check_output([sys.executable, NYCCC, self.docs,
+                                     self.bibfile, "--batch", "--store",
+                                     self.database])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _query(self, *args):
+        return subprocess.check_output([sys.executable, NYCCC, "query",
+                                        self.database]+list(args))
+
+    def test_every_reference_is_stored(self):
+        store = nyccc_store.CitationStore(self.database)
+        try:
+            references = [row[0] for row in store.connection.execute(
+                "SELECT reference FROM refs ORDER BY id")]
+        finally:
+            store.close()
+        self.assertEqual(references, nyccc.get_bib_from_file(self.bibfile))
+
+    def test_documents_have_the_counts_of_the_check(self):
+        expected = ""
+        for name in sorted(MANUSCRIPTS):
+            result = check(os.path.join(self.docs, name), self.bibfile)
+            expected += "%s\n\t#cites: %d\tNo reference for citation: %d/%d"\
+                        "\tReference was not cited: %d/%d\n" % (
+                os.path.join(self.docs, name), result.num_cites,
+                result.missing_ref_cnt, result.num_unique_cites,
+                result.missing_cite_cnt, result.num_refs)
+        self.assertEqual(self._query("documents"), expected)
+
+    def test_uncited_are_those_that_no_check_cites(self):
+        self.assertEqual(self._query("uncited"),
+            "Reference 'Karkkainen, T. 2007. Uncited paper, again....' is "
+            "not cited (in the bibliography of 2 documents)\n"
+            "Reference 'Karkkainen, T. 2007. Uncited paper....' is not cited"
+            " (in the bibliography of 2 documents)\n")
+
+    def test_failing_are_the_problems_of_the_checks(self):
+        self.assertEqual(self._query("failing"),
+            "No reference for citation (Nobody 1990) in 2 documents "
+            "(3 times)\n"
+            # The references with the same key make it ambiguous
+            "Ambiguous citation (Smith 2001) in 2 documents (2 times)\n"
+            "Ambiguous citation (Jones 2005) in 1 document (1 time)\n")
+        self.assertEqual(self._query("failing", "-n", "1").count("\n"), 1)
+
+    def test_citing_finds_the_references_with_the_same_key(self):
+        paths = "".join("\t%s\n" % os.path.join(self.docs, name)
+                        for name in sorted(MANUSCRIPTS))
+        self.assertEqual(self._query("citing", "Another book"),
+            "Reference 'Smith, A. 2001. Another book....' is cited in\n"+
+            paths)
+        self.assertEqual(self._query("citing", "smith, a. 2001"),
+            "Reference 'Smith, A. 2001. A book....' is cited in\n"+paths+
+            "Reference 'Smith, A. 2001. Another book....' is cited in\n"+
+            paths)
+        self.assertEqual(self._query("citing", "Lax%1998"),
+            "Reference 'Lax, L. 1998. Old paper....' is cited in\n"
+            "\t%s\n" % os.path.join(self.docs, "a.txt"))
+        self.assertEqual(self._query("citing", "Nobody"), "")
+
+if __name__ == '__main__':
+    unittest.main()
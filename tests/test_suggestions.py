@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_suggestions.py :
+
+    The "did you mean" suggestions (see BibIndex.suggest) and the edit
+    distance and word index under them against comparing with every
+    reference of a small bibliography.
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import nyccc
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+BIBLIOGRAPHY = ["Andrews, A. 2008. Misspelled.",
+                "Andrews, A. & Baker, B. 2010. Two authors.",
+                "Bennett, M. J. 1993a. Towards.",
+                "Bennett, J. M. 1993b. Cultural.",
+                "Smith, A. 2001. Book.",
+                "Smyth, A. 2001. Other.",
+                "Smithson, A. 2001. Far.",
+                "Noyear, N. Paper."]
+
+def osa_distance(a, b):
+    """ The optimal string alignment distance of a and b from the full
+    table, with no cutoff """
+    d = [[i+j if i*j==0 else 0 for j in range(len(b)+1)]
+         for i in range(len(a)+1)]
+    for i in range(1, len(a)+1):
+        for j in range(1, len(b)+1):
+            d[i][j] = min(d[i-1][j]+1, d[i][j-1]+1,
+                          d[i-1][j-1]+(a[i-1]!=b[j-1]))
+            if i>1 and j>1 and a[i-1]==b[j-2] and a[i-2]==b[j-1]:
+                d[i][j] = min(d[i][j], d[i-2][j-2]+1)
+    return d[len(a)][len(b)]
+
+class TestSuggestions(unittest.TestCase):
+
+    def setUp(self):
+        self.bib_index = nyccc.BibIndex(BIBLIOGRAPHY)
+
+    def test_edit_distance_is_that_of_the_full_table(self):
+        rnd = random.Random(0)
+        for i in range(3000):
+            a, b = ["".join(rnd.choice("abc") for k in
+                            range(rnd.randint(0, 6))) for j in range(2)]
+            max_distance = rnd.randint(0, 3)
+            self.assertEqual(nyccc._edit_distance(a, b, max_distance),
+                             min(osa_distance(a, b), max_distance+1),
+                             (a, b, max_distance))
+
+    def test_word_index_has_every_word_within_the_distance(self):
+        rnd = random.Random(0)
+        words = ["".join(rnd.choice("abcd") for k in range(rnd.randint(1, 6)))
+                 for i in range(300)]
+        for max_distance in (1, 2):
+            index = nyccc._SimilarWordIndex(words, max_distance)
+            for word in words[:50]+["", "abcdabcd"]:
+                candidates = index.candidates(word)
+                self.assertEqual(candidates, sorted(set(candidates)))
+                self.assertTrue(set(candidates).issuperset(
+                    other for other in words
+                    if osa_distance(word, other)<=max_distance))
+
+    def test_typos_of_names_and_years_are_suggested(self):
+        for cite, year, expected in [
+                # A swap, a year typo and a missing suffix letter are one
+                (("Anderws",), "2008", [(1, BIBLIOGRAPHY[0])]),
+                (("Andrews",), "2009", [(1, BIBLIOGRAPHY[0]),
+                                        (2, BIBLIOGRAPHY[1])]),
+                (("bennett",), "1993", [(1, BIBLIOGRAPHY[2]),
+                                        (1, BIBLIOGRAPHY[3])]),
+                (("Bennet",), "1993", [(2, BIBLIOGRAPHY[2]),
+                                       (2, BIBLIOGRAPHY[3])]),
+                # The other authors count too
+                (("Andrews", "Bakker"), "2010", [(1, BIBLIOGRAPHY[1])]),
+                (("Andrews", "Zed"), "2010", []),
+                (("Smith",), "2002", [(1, BIBLIOGRAPHY[4]),
+                                      (2, BIBLIOGRAPHY[5])]),
+                (("Zzzz",), "2001", []),
+                (("Noyear",), "2001", []),
+                ((), "2001", [])]:
+            cut = []
+            self.assertEqual(self.bib_index.suggest(
+                nyccc.Citation(list(cite), year, True), cut=cut),
+                expected, cite)
+            self.assertEqual(cut, [])
+
+    def test_suggestions_are_limited(self):
+        cite = (["Smith"], "2002", True)
+        self.assertEqual(self.bib_index.suggest(cite, max_suggestions=1),
+                         [(1, BIBLIOGRAPHY[4])])
+        self.assertEqual(self.bib_index.suggest(cite, max_distance=1),
+                         [(1, BIBLIOGRAPHY[4])])
+        cut = []
+        self.assertEqual(self.bib_index.suggest(cite, max_evaluations=1,
+                                                cut=cut),
+                         [(1, BIBLIOGRAPHY[4])])
+        self.assertEqual(cut, [True])
+
+    def test_report_has_the_suggestions(self):
+        directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        try:
+            textfile = os.path.join(directory, "thesis.txt")
+            with open(textfile, 'w') as f:
+                f.write("As shown (Anderws 2008; Smith 2001).\n")
+            bibfile = os.path.join(directory, "bib.txt")
+            with open(bibfile, 'w') as f:
+                f.write("\n".join(BIBLIOGRAPHY)+"\n")
+            report = subprocess.check_output([sys.executable, NYCCC,
+                textfile, bibfile, "--suggest", "2"])
+        finally:
+            shutil.rmtree(directory)
+        self.assertIn("No reference for citation (Anderws 2008)\n"
+                      "\tDid you mean 'Andrews, A. 2008. Misspelled....'?\n",
+                      report)
+
+if __name__ == '__main__':
+    unittest.main()
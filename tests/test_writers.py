@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+tests/test_writers.py :
+
+    The --format jsonl and sarif reports (see JSONLinesWriter and
+    SARIFWriter) parsed back as JSON, against the citations and the
+    problems that are in the files.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from collections import Counter
+
+NYCCC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "nyccc.py")
+
+MANUSCRIPTS = {
+    "a.txt":u"Known (Smith 2001, p. 12) and (Lax ja Young 1998; Nobody 1990)."
+            u"\n\nAgain (Nobody 1990) and an ambiguous (Jones 2005).\n",
+    "b.txt":u"Only Virtasen (2010) mukaan.\n"}
+
+BIBLIOGRAPHY = u"""Smith, A. 2001. A book.
+Smith, A. 2001. A book.
+Jones, J. 2005a. First.
+Jones, J. 2005b. Second.
+Young, Y. 1991. Older paper.
+Noyear, N. Paper.
+"""
+
+# The text at each occurrence of the citations
+CITATIONS = {(u"Smith", u"2001"):u"Smith 2001, p. 12",
+             (u"Lax", u"Young", u"1998"):u"Lax ja Young 1998",
+             (u"Nobody", u"1990"):u"Nobody 1990",
+             (u"Jones", u"2005"):u"Jones 2005",
+             (u"Virtasen", u"2010"):u"Virtasen (2010)"}
+
+class TestReportFormats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nyccc-test-")
+        self.docs = os.path.join(self.directory, "docs")
+        os.mkdir(self.docs)
+        self.lines = {}
+        for name, text in MANUSCRIPTS.items():
+            filename = os.path.join(self.docs, name)
+            with open(filename, 'wb') as f:
+                f.write(text.encode('utf-8'))
+            self.lines[filename] = text.split(u"\n")
+        self.bibfile = os.path.join(self.directory, "bib.txt")
+        with open(self.bibfile, 'wb') as f:
+            f.write(BIBLIOGRAPHY.encode('utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, report_format, batch):
+        # The report alone, the rest is written to stderr
+        args = [sys.executable, NYCCC, os.path.join(self.docs, "a.txt"),
+                self.bibfile, "-a", "ja", "--format", report_format]
+        if batch:
+            args[2:3] = [self.docs, "--batch"]
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(args, stderr=devnull)
+
+    def _cited(self, citation):
+        return CITATIONS[tuple(citation["authors"])+(citation["year"],)]
+
+    def test_each_line_is_a_json_object(self):
+        expected = Counter({("bib.txt", "duplicate"):1,
+                            ("bib.txt", "missing-year"):1,
+                            ("a.txt", "ambiguous"):2,
+                            ("a.txt", "missing-reference"):2,
+                            ("a.txt", "uncited"):2, ("a.txt", "summary"):1})
+        for batch in (False, True):
+            if batch:
+                expected.update({("b.txt", "missing-reference"):1,
+                                 ("b.txt", "uncited"):6,
+                                 ("b.txt", "summary"):1})
+            objects = [json.loads(line) for line in
+                       self._run("jsonl", batch).splitlines()]
+            self.assertEqual(objects[-1]["kind"], "batch-summary" if batch
+                             else "summary")
+            if batch:
+                self.assertEqual(objects.pop()["num_documents"], 2)
+            self.assertEqual(Counter((os.path.basename(obj["file"]),
+                                      obj["kind"]) for obj in objects),
+                             expected)
+            for obj in objects:
+                if obj["kind"]=="summary":
+                    continue
+                if obj["citation"] is None:
+                    self.assertIsNone(obj["occurrences"])
+                    continue
+                lines = self.lines[obj["file"]]
+                for paragraph, offset, length in obj["occurrences"]:
+                    self.assertEqual(lines[paragraph][offset:offset+length],
+                                     self._cited(obj["citation"]))
+
+    def test_sarif_log_points_at_the_citations(self):
+        for batch in (False, True):
+            log = json.loads(self._run("sarif", batch))
+            self.assertEqual(log["version"], "2.1.0")
+            run = log["runs"][0]
+            self.assertEqual(run["tool"]["driver"]["name"], "nyccc")
+            rules = [rule["id"] for rule in run["tool"]["driver"]["rules"]]
+            self.assertEqual(len(run["results"]), 15 if batch else 8)
+            regions = 0
+            for sarif_result in run["results"]:
+                self.assertIn(sarif_result["ruleId"], rules)
+                citation = sarif_result["properties"]["citation"]
+                for location in sarif_result["locations"]:
+                    physical = location["physicalLocation"]
+                    if "region" not in physical:
+                        self.assertIsNone(citation)
+                        continue
+                    # The lines and the columns count from 1 and the end
+                    #  column is after the citation
+                    region = physical["region"]
+                    line = self.lines[physical["artifactLocation"]["uri"]][
+                        region["startLine"]-1]
+                    self.assertGreaterEqual(region["startColumn"], 1)
+                    self.assertEqual(line[region["startColumn"]-1:
+                                          region["endColumn"]-1],
+                                     self._cited(citation))
+                    regions += 1
+            # (Nobody 1990) is twice in a.txt
+            self.assertEqual(regions, 6 if batch else 5)
+
+if __name__ == '__main__':
+    unittest.main()